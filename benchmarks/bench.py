@@ -0,0 +1,279 @@
+"""
+Micro-benchmarks for the codec and device hot paths, runnable without hardware.
+
+Run `script/bench` to compare against the stored baseline, which fails when any
+benchmark is slower than its baseline by more than the threshold, and
+`script/bench --save-baseline` to record a new baseline after an intended
+change.
+
+Each benchmark is timed in rounds alternating with a fixed calibration loop, and
+compared as a multiple of the loop's time, so a machine or run that is uniformly
+faster or slower does not register as a change. Benchmarks over the threshold
+are measured again, and only fail if they stay over it.
+"""
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+
+from pathlib import Path
+from typing import Callable, Optional
+
+from teeheesmart import get_media_switch
+from teeheesmart.hex.capture import ReplayDevice, read_capture
+from teeheesmart.hex.emulator import EmulatorPool
+from teeheesmart.hex.io import Codec, Command, FrameDecoder, Instruction, TcpDevice, TcpEndpoint
+from teeheesmart.hex.media_switch import MediaSwitch
+
+# Reuse the fakes the unit tests run against
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tests' / 'hex'))
+from fakes import FakeDevice, FakeSocket
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+# Allowed slowdown relative to the baseline before a benchmark is a regression
+DEFAULT_THRESHOLD = 0.25
+# Rounds of each benchmark, alternating with the calibration loop
+REPEAT = 7
+# Further measurements of a benchmark over the threshold before it fails
+RETRIES = 2
+
+class Measurement:
+  def __init__(self, ns: float, relative: float):
+    self._ns = ns
+    self._relative = relative
+
+  @property
+  def ns(self) -> float:
+    """
+    Fastest time per call, in nanoseconds
+    """
+    return self._ns
+
+  @property
+  def relative(self) -> float:
+    """
+    Median time per call, as a multiple of the calibration loop's time in the
+    same round
+    """
+    return self._relative
+
+class SimulatedSwitch(FakeDevice):
+  """
+  Replies as a switch with `input_count` inputs would, so input count detection
+  runs its full probe sequence
+  """
+
+  def __init__(self, input_count: int):
+    super().__init__()
+    self._input_count = input_count
+    self._selected = 0
+
+  def process(self, instructions):
+    try:
+      _ = iter(instructions)
+    except TypeError:
+      instructions = [instructions]
+    results = []
+    for instruction in instructions:
+      if instruction.id == Command.SWITCH_VIDEO:
+        if instruction.data_value > self._input_count:
+          continue
+        self._selected = instruction.data_value - 1
+      results.append(Instruction(Command.CURRENT_ACTIVE_INPUT, self._selected))
+    return results
+
+def _tcp_device_process(persistent: bool) -> Callable[[], object]:
+  device = TcpDevice(TcpEndpoint('localhost'), persistent = persistent)
+  # Talk to a fake socket, rather than the network
+  fake_socket = FakeSocket()
+  device._create_connection = lambda: fake_socket
+  instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+  return lambda: device.process(instruction)
+
+def _frame_decoder_feed() -> Callable[[], object]:
+  decoder = FrameDecoder()
+  chunk = memoryview(Codec.encode_many([Instruction(Command.CURRENT_ACTIVE_INPUT, 2)] * 32))
+  return lambda: decoder.feed(chunk)
+
+def _replayed_session() -> Callable[[], object]:
+  # Capture a real session with an emulated switch, then replay it at full speed
+  with tempfile.TemporaryDirectory() as directory:
+    path = f'{directory}/capture.bin'
+    with EmulatorPool(input_count = 16) as pool:
+      media_switch = get_media_switch(pool.urls[0], capture_path = path)
+      for input in [3, 1, 4, 1, 5]:
+        media_switch.select_source(input)
+        media_switch.update()
+      media_switch.close()
+    records = list(read_capture(path))
+
+  def replay() -> None:
+    media_switch = MediaSwitch(ReplayDevice(records, speed = None))
+    for input in [3, 1, 4, 1, 5]:
+      media_switch.select_source(input)
+      media_switch.update()
+  return replay
+
+def _calibration_loop() -> int:
+  # Mixes the interpreter work the benchmarks do: calls, loops, dicts and strings
+  values: dict[int, int] = {}
+  total = 0
+  for index in range(100):
+    values[index & 15] = total
+    total += len(str(index))
+  return total
+
+def _benchmarks() -> dict[str, Callable[[], Callable[[], object]]]:
+  """
+  Each entry creates the operation to time, so setup is excluded from timings
+  """
+  query = Instruction(Command.QUERY_ACTIVE_INPUT)
+  other = Instruction(Command.SWITCH_VIDEO, 3)
+  frame = Codec.encode(Instruction(Command.CURRENT_ACTIVE_INPUT, 3))
+  return {
+    'codec_encode': lambda: lambda: Codec.encode(query),
+    'codec_decode': lambda: lambda: Codec.decode(frame),
+    'instruction_construct': lambda: lambda: Instruction(Command.SWITCH_VIDEO, 3),
+    'instruction_equality': lambda: lambda: query == other,
+    'frame_decoder_feed_32_frames': _frame_decoder_feed,
+    'tcp_device_process_transient': lambda: _tcp_device_process(persistent = False),
+    'tcp_device_process_persistent': lambda: _tcp_device_process(persistent = True),
+    'media_switch_construct_known_inputs':
+      lambda: lambda: MediaSwitch(SimulatedSwitch(4), input_count = 4),
+    'media_switch_construct_detect_inputs': lambda: lambda: MediaSwitch(SimulatedSwitch(4)),
+    'media_switch_replayed_session': _replayed_session,
+  }
+
+def measure(operation: Callable[[], object]) -> Measurement:
+  timer = timeit.Timer(operation)
+  number, _ = timer.autorange()
+  calibration = timeit.Timer(_calibration_loop)
+  calibration_number, _ = calibration.autorange()
+
+  fastest_ns = math.inf
+  ratios: list[float] = []
+  for _ in range(REPEAT):
+    calibration_ns = calibration.timeit(calibration_number) / calibration_number * 1e9
+    ns = timer.timeit(number) / number * 1e9
+    fastest_ns = min(fastest_ns, ns)
+    ratios.append(ns / calibration_ns)
+  return Measurement(fastest_ns, statistics.median(ratios))
+
+def run(name_filter: Optional[str] = None) -> dict[str, Measurement]:
+  return {
+    name: measure(create_operation())
+    for name, create_operation in _benchmarks().items()
+    if name_filter is None or name_filter in name
+  }
+
+def compare(
+    results: dict[str, Measurement],
+    baseline: dict[str, float],
+    threshold: float
+  ) -> list[str]:
+  """
+  Returns:
+    list[str]: Names of benchmarks whose relative cost exceeds their baseline's
+      by more than `threshold`, a fraction of the baseline.
+  """
+  return [
+    name for name, measurement in results.items()
+    if name in baseline and measurement.relative > baseline[name] * (1 + threshold)
+  ]
+
+def confirm_regressions(
+    results: dict[str, Measurement],
+    baseline: dict[str, float],
+    threshold: float
+  ) -> list[str]:
+  """
+  Measure regressed benchmarks again, keeping the best result of each, and
+  return those still over the threshold
+  """
+  benchmarks = _benchmarks()
+  regressions = compare(results, baseline, threshold)
+  for _ in range(RETRIES):
+    if len(regressions) == 0:
+      break
+    for name in regressions:
+      remeasured = measure(benchmarks[name]())
+      if remeasured.relative < results[name].relative:
+        results[name] = remeasured
+    regressions = compare(results, baseline, threshold)
+  return regressions
+
+def _load_baseline() -> dict:
+  if not BASELINE_PATH.exists():
+    return {}
+  return json.loads(BASELINE_PATH.read_text())
+
+def _save_baseline(results: dict[str, float]) -> None:
+  baseline = {
+    'python': platform.python_version(),
+    'machine': platform.machine(),
+    # Each benchmark's time as a multiple of the calibration loop's
+    'results': {name: float(f'{relative:.4g}') for name, relative in sorted(results.items())},
+  }
+  BASELINE_PATH.write_text(json.dumps(baseline, indent = 2) + '\n')
+
+def _report(results: dict[str, Measurement], baseline: dict[str, float]) -> str:
+  lines = [f'{"benchmark":<40} {"ns/op":>12} {"relative":>10} {"baseline":>10} {"change":>8}']
+  for name, measurement in results.items():
+    row = f'{name:<40} {measurement.ns:>12.1f} {measurement.relative:>10.4g}'
+    if name in baseline:
+      change = f'{(measurement.relative / baseline[name] - 1) * 100:+.1f}%'
+      lines.append(f'{row} {baseline[name]:>10.4g} {change:>8}')
+    else:
+      lines.append(f'{row} {"-":>10} {"-":>8}')
+  return '\n'.join(lines)
+
+def _python_version_mismatch(recorded: Optional[str]) -> Optional[str]:
+  current = platform.python_version()
+  if recorded is None or recorded.split('.')[:2] == current.split('.')[:2]:
+    return None
+  return f'Baseline was recorded on Python {recorded}, but running on {current}'
+
+def main(argv: Optional[list[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description = 'Run teeheesmart micro-benchmarks')
+  parser.add_argument('-k', dest = 'name_filter', help = 'Only run benchmarks whose name contains this')
+  parser.add_argument(
+    '--threshold',
+    type = float,
+    default = DEFAULT_THRESHOLD,
+    help = f'Allowed slowdown, as a fraction of the baseline. Default: {DEFAULT_THRESHOLD}',
+  )
+  parser.add_argument('--save-baseline', action = 'store_true', help = 'Record results as the baseline')
+  parser.add_argument('--output', type = Path, help = 'Also write the report to this file')
+  args = parser.parse_args(argv)
+
+  results = run(args.name_filter)
+  recorded = _load_baseline()
+  baseline: dict[str, float] = recorded.get('results', {})
+
+  if args.save_baseline:
+    print(_report(results, baseline))
+    relative = {name: measurement.relative for name, measurement in results.items()}
+    _save_baseline({**baseline, **relative})
+    print(f'Saved baseline to {BASELINE_PATH}')
+    return 0
+
+  regressions = confirm_regressions(results, baseline, args.threshold)
+  report = _report(results, baseline)
+  mismatch = _python_version_mismatch(recorded.get('python'))
+  if mismatch is not None:
+    report = f'{report}\n{mismatch}; timings may not be comparable'
+  print(report)
+  if args.output is not None:
+    args.output.write_text(report + '\n')
+
+  if len(regressions) > 0:
+    print(f'Regressed by more than {args.threshold:.0%}: {", ".join(regressions)}')
+    return 1
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
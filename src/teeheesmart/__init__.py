@@ -1,15 +1,41 @@
 """TESmart HDMI switch control library"""
+import os
+
 from typing import Optional
 
 from .constants import PROTOCOL_HEX, SCHEME_TCP
-from .url_parser import parse_url
-from .media_switch import MediaSwitch
+from .fleet import FleetSnapshot, SwitchFleet, SwitchState
+from .url_parser import Endpoint, parse_url
+from .media_switch import AsyncMediaSwitch, MediaSwitch
+from .registry import SharedMediaSwitch, SwitchRegistry
+
+from .hex import \
+  CachePolicy, CircuitOpenError, DesiredState, DeviceMultiplexer, DeviceObserver, \
+  HistogramCollector, get_tcp_async_media_switch, get_tcp_media_switch
 
-from .hex import get_tcp_media_switch
+# URL query parameters
+_OPTION_INPUTS = 'inputs'
+_OPTION_MODEL = 'model'
 
 def get_media_switch(
     url: str,
-    timeout_sec: Optional[float] = None
+    timeout_sec: Optional[float] = None,
+    persistent: bool = False,
+    input_count: Optional[int] = None,
+    model: Optional[str] = None,
+    input_count_cache_path: Optional[str | os.PathLike] = None,
+    pipelined: bool = False,
+    cache_policy: Optional[CachePolicy] = None,
+    select_source_window_sec: Optional[float] = None,
+    serialize: bool = False,
+    observer: Optional[DeviceObserver] = None,
+    capture_path: Optional[str | os.PathLike] = None,
+    circuit_breaker: bool = False,
+    cache_dns: bool = False,
+    shared: bool = False,
+    multiplexer: Optional[DeviceMultiplexer] = None,
+    fenced: bool = False,
+    adaptive_timeout: bool = False
   ) -> MediaSwitch:
   """
   Create media switch representation whose state can be accessed via the specified
@@ -27,8 +53,12 @@ def get_media_switch(
     + Default protocol: Hex (identifier: hex)
 
   URL format:
-    The URL takes the form of `<scheme>://<host>:<port>#<protocol>` with all
-    but the host being optional.
+    The URL takes the form of `<scheme>://<host>:<port>?<options>#<protocol>` with
+    all but the host being optional.
+
+    Options are query parameters:
+      + inputs: Number of inputs the switch has (see `input_count`)
+      + model: Device model name (see `model`)
 
     Examples:
       + 10.0.0.1 ->
@@ -43,24 +73,176 @@ def get_media_switch(
           Scheme: tcp, Host: switch.local, Port: 8080, Protocol: hex
       + tcp://localhost:8080#hex
           Scheme: tcp, Host: localhost, Port: 8080, Protocol: hex
+      + 10.0.0.1?model=HSW-1601 ->
+          Scheme: tcp, Host: 10.0.0.1, Port: 5000, Protocol: hex, Inputs: 16
 
   Args:
     url (str): The URL at which the device state can be accessed.
     timeout_sec (Optional[float]): Timeout, in seconds, to use when communicating
       with the device. Default: None, which allows the underlying protocol driver
       to determine.
+    persistent (bool): Keep the device connection open between commands, rather
+      than reconnecting for each one. Default: False. Call `close` on the returned
+      switch to release the connection.
+    input_count (Optional[int]): Number of inputs the switch has. Default: None,
+      which uses the model or cache, if available, or otherwise probes the device.
+      Probing briefly switches inputs, so declaring this avoids on-screen flicker
+      and speeds startup.
+    model (Optional[str]): Device model name (e.g., HSW-1601), from which the
+      input count and device behavior are determined.
+    input_count_cache_path (Optional[str | os.PathLike]): File in which probed
+      input counts are saved, keyed by host and port, so later calls can skip
+      probing.
+    pipelined (bool): Send batches of commands at once, rather than waiting for
+      each reply before sending the next. Default: False.
+    cache_policy (Optional[CachePolicy]): How long device state remains fresh,
+      during which `update` returns without querying the device. Default: None,
+      which always queries it.
+    select_source_window_sec (Optional[float]): Window, in seconds, within which
+      bursts of `select_source` calls are coalesced so only the last requested
+      input is sent. Default: None, which sends every call.
+    serialize (bool): Send all commands for the device one at a time through a
+      shared queue, with interactive commands (e.g., selecting an input) ahead of
+      polling. Default: False.
+    observer (Optional[DeviceObserver]): Notified of connect times, round-trip
+      times, timeouts, traffic and errors for each command, e.g., a
+      `HistogramCollector`. Default: None.
+    capture_path (Optional[str | os.PathLike]): File to which all bytes exchanged
+      with the device are appended, for replay with
+      `teeheesmart.hex.capture.ReplayDevice`. Default: None.
+    circuit_breaker (bool): After repeated failures to reach the device, fail
+      fast with `CircuitOpenError` for a cooldown period that doubles while it
+      remains unreachable, rather than waiting out the connection timeout on every
+      command. Shared by all switches for the same host and port. Default: False.
+    cache_dns (bool): Cache resolution of the host name for a minute, and race
+      its IPv6 and IPv4 addresses when connecting, preferring the last to win.
+      Saves resolving names such as `switch.local` on every connection.
+      Default: False.
+    shared (bool): Return a handle to the switch already open for the same
+      device, if any, rather than connecting and probing it again; see
+      `SwitchRegistry`. URLs naming the same scheme, host, port and protocol
+      share a switch, which keeps the options it was first created with. Each
+      call must be matched by a call to `close`, which closes the switch once no
+      handles remain. Default: False.
+    multiplexer (Optional[DeviceMultiplexer]): Perform the switch's I/O on this
+      multiplexer's thread, alongside that of other switches using it, rather
+      than on the calling thread. Lets one thread keep many switches polled. Not
+      supported with `pipelined`, `fenced` or `capture_path`. Default: None.
+    fenced (bool): Follow commands that only sometimes reply, such as selecting
+      an input, with a query of the active input, and stop reading at its reply
+      rather than waiting out the timeout. Commands then take about one round
+      trip, plus a brief wait, for a reply that may follow, when the command goes
+      unanswered. Default: False.
+    adaptive_timeout (bool): Wait for replies for a time derived from the
+      round-trip times measured to the device, between 50ms and 2s, rather than
+      the fixed `timeout_sec`, which then applies only until the first
+      measurement. Shared by all switches for the same host and port.
+      Default: False.
 
   Returns:
     MediaSwitch: Representation of the media switch device, including methods for
       controlling it (e.g., selecting sources.)
   """
+  if shared:
+    return SwitchRegistry.default().acquire(
+      url,
+      lambda url: get_media_switch(
+        url,
+        timeout_sec = timeout_sec,
+        persistent = persistent,
+        input_count = input_count,
+        model = model,
+        input_count_cache_path = input_count_cache_path,
+        pipelined = pipelined,
+        cache_policy = cache_policy,
+        select_source_window_sec = select_source_window_sec,
+        serialize = serialize,
+        observer = observer,
+        capture_path = capture_path,
+        circuit_breaker = circuit_breaker,
+        cache_dns = cache_dns,
+        multiplexer = multiplexer,
+        fenced = fenced,
+        adaptive_timeout = adaptive_timeout,
+      )
+    )
+
+  endpoint = _parse_supported_url(url)
+  return get_tcp_media_switch(
+    host = endpoint.host,
+    port = endpoint.port,
+    timeout_sec = timeout_sec,
+    persistent = persistent,
+    input_count = _input_count_option(endpoint, input_count),
+    model = _model_option(endpoint, model),
+    input_count_cache = input_count_cache_path,
+    pipelined = pipelined,
+    cache_policy = cache_policy,
+    select_source_window_sec = select_source_window_sec,
+    serialize = serialize,
+    observer = observer,
+    capture_path = capture_path,
+    circuit_breaker = circuit_breaker,
+    cache_dns = cache_dns,
+    multiplexer = multiplexer,
+    fenced = fenced,
+    adaptive_timeout = adaptive_timeout,
+  )
+
+async def get_async_media_switch(
+    url: str,
+    timeout_sec: Optional[float] = None,
+    persistent: bool = False,
+    input_count: Optional[int] = None,
+    model: Optional[str] = None,
+    input_count_cache_path: Optional[str | os.PathLike] = None
+  ) -> AsyncMediaSwitch:
+  """
+  asyncio variant of `get_media_switch`, accepting the same URLs but only a
+  subset of its options.
+
+  The returned switch's device operations are coroutines, and its initial state
+  has already been loaded from the device.
+
+  Args:
+    url (str): See `get_media_switch`.
+    timeout_sec (Optional[float]): See `get_media_switch`.
+    persistent (bool): See `get_media_switch`.
+    input_count (Optional[int]): See `get_media_switch`.
+    model (Optional[str]): See `get_media_switch`.
+    input_count_cache_path (Optional[str | os.PathLike]): See `get_media_switch`.
+  """
+  endpoint = _parse_supported_url(url)
+  return await get_tcp_async_media_switch(
+    host = endpoint.host,
+    port = endpoint.port,
+    timeout_sec = timeout_sec,
+    persistent = persistent,
+    input_count = _input_count_option(endpoint, input_count),
+    model = _model_option(endpoint, model),
+    input_count_cache = input_count_cache_path,
+  )
+
+def _input_count_option(endpoint: Endpoint, input_count: Optional[int]) -> Optional[int]:
+  if input_count is not None:
+    return input_count
+  value = endpoint.options.get(_OPTION_INPUTS)
+  if value is None:
+    return None
+  try:
+    return int(value)
+  except ValueError:
+    raise ValueError(f'Invalid {_OPTION_INPUTS} option: {value}') from None
+
+def _model_option(endpoint: Endpoint, model: Optional[str]) -> Optional[str]:
+  if model is not None:
+    return model
+  return endpoint.options.get(_OPTION_MODEL)
+
+def _parse_supported_url(url: str) -> Endpoint:
   endpoint = parse_url(url)
   if endpoint.protocol == PROTOCOL_HEX and endpoint.scheme == SCHEME_TCP:
-    return get_tcp_media_switch(
-      host = endpoint.host,
-      port = endpoint.port,
-      timeout_sec = timeout_sec,
-    )
+    return endpoint
   else:
     raise ValueError(f'Unsupported url specified: {url}')
   
\ No newline at end of file
@@ -0,0 +1,216 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+from .constants import LOGGER
+from .media_switch import MediaSwitch
+from .url_parser import parse_url
+
+class SwitchState:
+  """
+  Point-in-time state of a single media switch
+  """
+
+  def __init__(
+      self,
+      url: str,
+      selected_source: int,
+      input_count: int,
+      output_count: int
+    ):
+    self._url = url
+    self._selected_source = selected_source
+    self._input_count = input_count
+    self._output_count = output_count
+
+  @classmethod
+  def from_media_switch(cls, url: str, media_switch: MediaSwitch) -> 'SwitchState':
+    return cls(
+      url = url,
+      selected_source = media_switch.selected_source,
+      input_count = media_switch.input_count,
+      output_count = media_switch.output_count,
+    )
+
+  @property
+  def url(self) -> str:
+    return self._url
+
+  @property
+  def selected_source(self) -> int:
+    return self._selected_source
+
+  @property
+  def input_count(self) -> int:
+    return self._input_count
+
+  @property
+  def output_count(self) -> int:
+    return self._output_count
+
+  def __repr__(self) -> str:
+    return (
+      f'SwitchState({self.url!r}, selected_source={self.selected_source}, '
+      f'input_count={self.input_count}, output_count={self.output_count})'
+    )
+
+class FleetSnapshot:
+  """
+  Consolidated result of polling every switch in a fleet
+  """
+
+  def __init__(
+      self,
+      states: dict[str, SwitchState],
+      errors: dict[str, Exception]
+    ):
+    self._states = states
+    self._errors = errors
+
+  @property
+  def states(self) -> dict[str, SwitchState]:
+    """
+    State of each switch that was polled successfully, keyed by URL
+    """
+    return self._states
+
+  @property
+  def errors(self) -> dict[str, Exception]:
+    """
+    Error raised for each switch that could not be polled, keyed by URL. A switch
+    that was reached but did not report its state has a `TimeoutError`.
+    """
+    return self._errors
+
+  @property
+  def ok(self) -> bool:
+    return len(self._errors) == 0
+
+class SwitchFleet:
+  """
+  Polls many media switches concurrently.
+
+  Switches are created on first poll and reused thereafter; a switch that fails
+  to be created is retried on the next poll. At most `max_concurrency` devices are
+  communicated with at once, so a sweep takes roughly as long as the slowest
+  device rather than the sum of all of them.
+  """
+  DEFAULT_MAX_CONCURRENCY: int = 16
+
+  def __init__(
+      self,
+      urls: Iterable[str],
+      max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+      timeout_sec: Optional[float] = None,
+      persistent: bool = False,
+      switch_factory: Optional[Callable[[str], MediaSwitch]] = None,
+      circuit_breaker: bool = True
+    ):
+    """
+    Args:
+      urls (Iterable[str]): Device URLs, in the format accepted by
+        `get_media_switch`. Duplicates are ignored.
+      max_concurrency (int): Maximum number of devices polled at once.
+      timeout_sec (Optional[float]): Passed to `get_media_switch`.
+      persistent (bool): Passed to `get_media_switch`.
+      switch_factory (Optional[Callable[[str], MediaSwitch]]): Creates a switch
+        from a URL. Default: `get_media_switch` with the options above.
+      circuit_breaker (bool): Passed to `get_media_switch`, so unreachable
+        switches fail fast rather than each poll waiting out their connection
+        timeouts. Default: True.
+    """
+    if max_concurrency < 1:
+      raise ValueError(f'max_concurrency must be at least 1. Received: {max_concurrency}')
+
+    # Validate all URLs up-front, rather than failing part way through a poll
+    self._urls = list(dict.fromkeys(urls))
+    for url in self._urls:
+      parse_url(url)
+
+    if switch_factory is None:
+      # Deferred to avoid a circular import with the package root
+      from . import get_media_switch
+      def switch_factory(url: str) -> MediaSwitch:
+        return get_media_switch(
+          url,
+          timeout_sec = timeout_sec,
+          persistent = persistent,
+          circuit_breaker = circuit_breaker,
+        )
+
+    self._max_concurrency = max_concurrency
+    self._switch_factory = switch_factory
+    self._switches: dict[str, MediaSwitch] = {}
+    self._lock = threading.Lock()
+
+  @property
+  def urls(self) -> list[str]:
+    return list(self._urls)
+
+  @property
+  def switches(self) -> dict[str, MediaSwitch]:
+    """
+    Switches created so far, keyed by URL
+    """
+    return dict(self._switches)
+
+  def poll(self) -> FleetSnapshot:
+    """
+    Refresh the state of every switch concurrently
+    """
+    states: dict[str, SwitchState] = {}
+    errors: dict[str, Exception] = {}
+    if len(self._urls) == 0:
+      return FleetSnapshot(states, errors)
+
+    with self._lock:
+      max_workers = min(self._max_concurrency, len(self._urls))
+      with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        futures = [(url, executor.submit(self._poll_switch, url)) for url in self._urls]
+        for url, future in futures:
+          try:
+            states[url] = future.result()
+          except Exception as ex:
+            LOGGER.warning('Failed polling %s: %s', url, ex)
+            errors[url] = ex
+
+    return FleetSnapshot(states, errors)
+
+  def close(self) -> None:
+    """
+    Close all switches created by the fleet
+    """
+    with self._lock:
+      for url, media_switch in self._switches.items():
+        try:
+          media_switch.close()
+        except Exception as ex:
+          LOGGER.warning('Failed closing %s: %s', url, ex)
+      self._switches = {}
+
+  def _poll_switch(self, url: str) -> SwitchState:
+    media_switch = self._switches.get(url)
+    if media_switch is None:
+      # Creating a switch loads its state, so no separate update is needed
+      media_switch = self._switch_factory(url)
+      self._switches[url] = media_switch
+      reported = media_switch.selected_source_updated_at is not None
+    else:
+      # Switches log, rather than raise, replies that never come, leaving the
+      # state last reported in place
+      updated_at = media_switch.selected_source_updated_at
+      media_switch.update()
+      reported = media_switch.selected_source_updated_at != updated_at or \
+        _is_fresh(media_switch)
+    if not reported:
+      raise TimeoutError(f'{url} did not report its state')
+    return SwitchState.from_media_switch(url, media_switch)
+
+def _is_fresh(media_switch: MediaSwitch) -> bool:
+  # Within its cache policy, a switch's `update` keeps the state last reported
+  cache_policy = getattr(media_switch, 'cache_policy', None)
+  updated_at = media_switch.selected_source_updated_at
+  return cache_policy is not None and updated_at is not None and \
+    cache_policy.is_fresh(time.monotonic() - updated_at)
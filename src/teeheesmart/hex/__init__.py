@@ -1,21 +1,174 @@
 """
 Encapsulates Hex Protocol communication and devices
 """
+import os
+
 from typing import Optional
 
-from ..media_switch import MediaSwitch as MediaSwitchProtocol
-from .io import TcpDevice, TcpEndpoint
-from .media_switch import MediaSwitch
+from ..media_switch import \
+  AsyncMediaSwitch as AsyncMediaSwitchProtocol, \
+  MediaSwitch as MediaSwitchProtocol
+from .aio import AsyncTcpDevice
+from .breaker import CircuitBreaker, CircuitOpenError
+from .cache_policy import CachePolicy
+from .capture import CaptureRecorder
+from .desired_state import DesiredState
+from .input_count_cache import InputCountCache
+from .instrumentation import DeviceObserver, HistogramCollector
+from .io import Command, ResponsePolicy, TcpDevice, TcpEndpoint
+from .media_switch import AsyncMediaSwitch, MediaSwitch
+from .models import MODELS, DeviceModel, find_model
+from .multiplexer import DeviceMultiplexer, MultiplexedDevice
+from .resolver import ResolverCache
+from .rtt import RttEstimator
 
 def get_tcp_media_switch(
     host: str,
     port: Optional[int] = None,
-    timeout_sec: Optional[float] = None
+    timeout_sec: Optional[float] = None,
+    persistent: bool = False,
+    input_count: Optional[int] = None,
+    model: Optional[str] = None,
+    input_count_cache: Optional[str | os.PathLike | InputCountCache] = None,
+    pipelined: bool = False,
+    cache_policy: Optional[CachePolicy] = None,
+    select_source_window_sec: Optional[float] = None,
+    serialize: bool = False,
+    observer: Optional[DeviceObserver] = None,
+    capture_path: Optional[str | os.PathLike] = None,
+    circuit_breaker: bool = False,
+    cache_dns: bool = False,
+    multiplexer: Optional[DeviceMultiplexer] = None,
+    fenced: bool = False,
+    adaptive_timeout: bool = False
   ) -> MediaSwitchProtocol:
+  endpoint = _create_endpoint(host, port, timeout_sec, cache_dns)
+  device_model = _find_model(model)
+  cache = _create_cache(input_count_cache)
+  if multiplexer is None:
+    tcp_device = TcpDevice(
+      endpoint,
+      persistent = persistent,
+      response_policies = _response_policies(device_model),
+      pipelined = pipelined,
+      observer = observer,
+      recorder = None if capture_path is None else CaptureRecorder(capture_path),
+      circuit_breaker = _circuit_breaker(endpoint, circuit_breaker),
+      fenced = fenced,
+      rtt_estimator = _rtt_estimator(endpoint, adaptive_timeout),
+    )
+  else:
+    if pipelined or fenced or capture_path is not None:
+      raise ValueError('Pipelining, fencing and capture are not supported with a multiplexer')
+    tcp_device = MultiplexedDevice(
+      multiplexer,
+      endpoint,
+      persistent = persistent,
+      response_policies = _response_policies(device_model),
+      observer = observer,
+      circuit_breaker = _circuit_breaker(endpoint, circuit_breaker),
+      rtt_estimator = _rtt_estimator(endpoint, adaptive_timeout),
+    )
+  media_switch = MediaSwitch(
+    tcp_device,
+    input_count = _known_input_count(endpoint, input_count, device_model, cache),
+    cache_policy = cache_policy,
+    select_source_window_sec = select_source_window_sec,
+    serialize = serialize,
+  )
+  _cache_input_count(endpoint, media_switch, cache)
+  return media_switch
+
+async def get_tcp_async_media_switch(
+    host: str,
+    port: Optional[int] = None,
+    timeout_sec: Optional[float] = None,
+    persistent: bool = False,
+    input_count: Optional[int] = None,
+    model: Optional[str] = None,
+    input_count_cache: Optional[str | os.PathLike | InputCountCache] = None
+  ) -> AsyncMediaSwitchProtocol:
+  endpoint = _create_endpoint(host, port, timeout_sec)
+  device_model = _find_model(model)
+  cache = _create_cache(input_count_cache)
+  tcp_device = AsyncTcpDevice(
+    endpoint,
+    persistent = persistent,
+    response_policies = _response_policies(device_model),
+  )
+  media_switch = await AsyncMediaSwitch.create(
+    tcp_device,
+    input_count = _known_input_count(endpoint, input_count, device_model, cache),
+  )
+  _cache_input_count(endpoint, media_switch, cache)
+  return media_switch
+
+def _create_endpoint(
+    host: str,
+    port: Optional[int],
+    timeout_sec: Optional[float],
+    cache_dns: bool = False
+  ) -> TcpEndpoint:
+  resolver = ResolverCache.shared() if cache_dns else None
   if timeout_sec is None:
     # Let `TcpEndpoint` manage timeout
-    endpoint = TcpEndpoint(host, port)
+    return TcpEndpoint(host, port, resolver = resolver)
   else:
-    endpoint = TcpEndpoint(host, port, timeout_sec)
-  tcp_device = TcpDevice(endpoint)
-  return MediaSwitch(tcp_device)
\ No newline at end of file
+    return TcpEndpoint(host, port, timeout_sec, resolver = resolver)
+
+def _circuit_breaker(endpoint: TcpEndpoint, enabled: bool) -> Optional[CircuitBreaker]:
+  if not enabled:
+    return None
+  return CircuitBreaker.for_endpoint(endpoint.host, endpoint.port)
+
+def _rtt_estimator(endpoint: TcpEndpoint, enabled: bool) -> Optional[RttEstimator]:
+  if not enabled:
+    return None
+  initial_timeout_sec = endpoint.timeout_sec
+  if initial_timeout_sec is None:
+    initial_timeout_sec = RttEstimator.DEFAULT_INITIAL_TIMEOUT_SEC
+  return RttEstimator.for_endpoint(endpoint.host, endpoint.port, initial_timeout_sec)
+
+def _find_model(model: Optional[str]) -> Optional[DeviceModel]:
+  if model is None:
+    return None
+  return find_model(model)
+
+def _create_cache(
+    input_count_cache: Optional[str | os.PathLike | InputCountCache]
+  ) -> Optional[InputCountCache]:
+  if input_count_cache is None or isinstance(input_count_cache, InputCountCache):
+    return input_count_cache
+  return InputCountCache(input_count_cache)
+
+def _response_policies(
+    device_model: Optional[DeviceModel]
+  ) -> Optional[dict[Command, ResponsePolicy]]:
+  if device_model is None:
+    return None
+  return device_model.response_policies
+
+def _known_input_count(
+    endpoint: TcpEndpoint,
+    input_count: Optional[int],
+    device_model: Optional[DeviceModel],
+    cache: Optional[InputCountCache]
+  ) -> Optional[int]:
+  # Explicit declarations take precedence over previously-detected values
+  if input_count is not None:
+    return input_count
+  if device_model is not None:
+    return device_model.input_count
+  if cache is not None:
+    return cache.get(endpoint.host, endpoint.port)
+  return None
+
+def _cache_input_count(
+    endpoint: TcpEndpoint,
+    media_switch: MediaSwitchProtocol | AsyncMediaSwitchProtocol,
+    cache: Optional[InputCountCache]
+  ) -> None:
+  if cache is None or media_switch.input_count == 0:
+    return
+  if cache.get(endpoint.host, endpoint.port) != media_switch.input_count:
+    cache.set(endpoint.host, endpoint.port, media_switch.input_count)
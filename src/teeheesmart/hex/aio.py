@@ -0,0 +1,220 @@
+import asyncio
+import itertools
+import time
+
+from ..constants import LOGGER
+from .io import \
+  Codec, Command, FrameDecoder, Instruction, ResponsePolicies, ResponsePolicy, \
+  TcpDevice, TcpEndpoint, _log_response_timeout
+from typing import Optional
+
+# Room for a reply plus any unsolicited frames that arrived alongside it
+_READ_SIZE = 256
+
+class AsyncTcpDevice:
+  """
+  Manages TCP I/O for a specific Hex Protocol-based device using asyncio streams.
+
+  Mirrors `TcpDevice`, including its persistent connection mode.
+  """
+
+  def __init__(
+      self,
+      endpoint: TcpEndpoint,
+      persistent: bool = False,
+      idle_timeout_sec: Optional[float] = TcpDevice.DEFAULT_IDLE_TIMEOUT_SEC,
+      response_policies: Optional[dict[Command, ResponsePolicy]] = None,
+    ):
+    self._endpoint = endpoint
+    self._persistent = persistent
+    self._idle_timeout_sec = idle_timeout_sec
+    self._response_policies = ResponsePolicies(response_policies)
+
+    self._lock = asyncio.Lock()
+    self._reader: Optional[asyncio.StreamReader] = None
+    self._writer: Optional[asyncio.StreamWriter] = None
+    self._decoder = FrameDecoder()
+    self._conn_last_used = 0.0
+
+  @property
+  def endpoint(self) -> TcpEndpoint:
+    return self._endpoint
+
+  @property
+  def persistent(self) -> bool:
+    return self._persistent
+
+  @property
+  def response_policies(self) -> ResponsePolicies:
+    return self._response_policies
+
+  async def process(self, instructions: list[Instruction] | Instruction) -> list[Instruction]:
+    try:
+      _ = iter(instructions)
+    except TypeError:
+      # Single instruction provided; wrap it.
+      instructions = [instructions]
+
+    if self._persistent:
+      async with self._lock:
+        results = await self._process_persistent(instructions)
+    else:
+      results = await self._process_transient(instructions)
+
+    # Results is a list of lists, so flatten before returning
+    flat_results = list(itertools.chain.from_iterable(results))
+    return flat_results
+
+  async def close(self) -> None:
+    """
+    Close the persistent connection, if one is open
+    """
+    async with self._lock:
+      await self._close_connection()
+
+  async def __aenter__(self) -> 'AsyncTcpDevice':
+    return self
+
+  async def __aexit__(self, *_) -> None:
+    await self.close()
+
+  async def _process_transient(self, instructions: list[Instruction]) -> list[list[Instruction]]:
+    results = []
+
+    reader, writer = await self._create_connection()
+    decoder = FrameDecoder()
+    try:
+      for instruction in instructions:
+        result = await self._execute_instruction(instruction, reader, writer, decoder)
+        results.append(result)
+    except Exception as ex:
+      LOGGER.error('Failed communicating with device: %s', ex)
+    finally:
+      await self._close_stream(writer)
+
+    return results
+
+  async def _process_persistent(self, instructions: list[Instruction]) -> list[list[Instruction]]:
+    results = []
+
+    # As for `TcpDevice`, anything sent while the connection sat idle is returned
+    # ahead of the replies rather than taken for one of them
+    unsolicited: list[Instruction] = []
+    reused = self._writer is not None and self._is_connection_reusable()
+    if reused:
+      await self._receive_pending(unsolicited)
+      reused = not self._reader.at_eof()
+    if not reused:
+      await self._close_connection()
+      self._reader, self._writer = await self._create_connection()
+
+    try:
+      for instruction in instructions:
+        try:
+          result = await self._execute_instruction(
+            instruction, self._reader, self._writer, self._decoder
+          )
+        except OSError as ex:
+          if not reused:
+            raise
+          LOGGER.info('Connection to device lost, reconnecting: %s', ex)
+          reused = False
+          await self._close_connection()
+          self._reader, self._writer = await self._create_connection()
+          result = await self._execute_instruction(
+            instruction, self._reader, self._writer, self._decoder
+          )
+        results.append(result)
+      self._conn_last_used = time.monotonic()
+    except Exception as ex:
+      LOGGER.error('Failed communicating with device: %s', ex)
+      await self._close_connection()
+
+    if len(unsolicited) > 0:
+      results.insert(0, unsolicited)
+    return results
+
+  async def _create_connection(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    return await asyncio.wait_for(
+      asyncio.open_connection(self._endpoint.host, self._endpoint.port),
+      self._endpoint.connect_timeout_sec
+    )
+
+  async def _close_connection(self) -> None:
+    if self._writer is not None:
+      await self._close_stream(self._writer)
+      self._reader = None
+      self._writer = None
+      self._decoder.reset()
+
+  async def _close_stream(self, writer: asyncio.StreamWriter) -> None:
+    writer.close()
+    try:
+      await writer.wait_closed()
+    except OSError as ex:
+      LOGGER.debug('Failed closing connection: %s', ex)
+
+  def _is_connection_reusable(self) -> bool:
+    if self._idle_timeout_sec is not None:
+      idle_sec = time.monotonic() - self._conn_last_used
+      if idle_sec > self._idle_timeout_sec:
+        LOGGER.debug('Connection idle for %.1fs, reconnecting', idle_sec)
+        return False
+    return not (self._writer.is_closing() or self._reader.at_eof())
+
+  async def _receive_pending(self, responses: list[Instruction]) -> None:
+    """
+    Add any Instructions that have already arrived on the persistent connection,
+    without waiting for more
+    """
+    try:
+      while not self._reader.at_eof():
+        # Buffered data is returned without suspending, so only an empty buffer
+        # times out
+        async with asyncio.timeout(0):
+          chunk = await self._reader.read(_READ_SIZE)
+        responses.extend(self._decoder.feed(chunk))
+    except TimeoutError:
+      pass
+    if len(responses) > 0:
+      LOGGER.debug('Received %d instructions while idle: %s', len(responses), responses)
+
+  async def _execute_instruction(
+      self,
+      instruction: Instruction,
+      reader: asyncio.StreamReader,
+      writer: asyncio.StreamWriter,
+      decoder: FrameDecoder
+    ) -> list[Instruction]:
+    writer.write(Codec.encode(instruction))
+    await writer.drain()
+
+    policy = self._response_policies.policy_for(instruction)
+    if policy == ResponsePolicy.NEVER_REPLIES:
+      return []
+
+    # Device either returns a single instruction specifying the selected input
+    # or no response at all.
+    result: list[Instruction] = []
+    try:
+      await asyncio.wait_for(
+        self._receive(reader, decoder, result),
+        self._endpoint.timeout_sec
+      )
+    except TimeoutError:
+      _log_response_timeout(instruction, policy)
+
+    return result
+
+  async def _receive(
+      self,
+      reader: asyncio.StreamReader,
+      decoder: FrameDecoder,
+      result: list[Instruction]
+    ) -> None:
+    while len(result) == 0:
+      chunk = await reader.read(_READ_SIZE)
+      if chunk == b'':
+        result.append(Instruction(Command.NULL_RESPONSE))
+        return
+      result.extend(decoder.feed(chunk))
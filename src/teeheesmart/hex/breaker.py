@@ -0,0 +1,154 @@
+import threading
+import time
+
+from enum import Enum, unique
+from typing import Callable
+
+from ..constants import LOGGER
+
+class CircuitOpenError(ConnectionError):
+  """
+  Raised, without contacting the device, while its circuit breaker is open
+  """
+
+@unique
+class CircuitState(Enum):
+  # Requests flow normally
+  CLOSED = 'closed'
+  # Requests fail fast until the cooldown elapses
+  OPEN = 'open'
+  # A single probe request is allowed through to test the device
+  HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+  """
+  Fails fast for a device that keeps failing, so callers don't each wait out
+  connection timeouts.
+
+  After `failure_threshold` consecutive failures the circuit opens, rejecting
+  requests for a cooldown period. Once that elapses, one probe request is let
+  through: success closes the circuit, while failure reopens it with the cooldown
+  doubled, up to `max_cooldown_sec`. A probe whose outcome is not recorded within
+  the cooldown counts as failed, so a caller that never reports back cannot hold
+  the circuit half-open.
+  """
+  DEFAULT_FAILURE_THRESHOLD: int = 3
+  DEFAULT_BASE_COOLDOWN_SEC: float = 1.0
+  DEFAULT_MAX_COOLDOWN_SEC: float = 60.0
+
+  _registry: dict[tuple[str, int], 'CircuitBreaker'] = {}
+  _registry_lock = threading.Lock()
+
+  def __init__(
+      self,
+      failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+      base_cooldown_sec: float = DEFAULT_BASE_COOLDOWN_SEC,
+      max_cooldown_sec: float = DEFAULT_MAX_COOLDOWN_SEC,
+      clock: Callable[[], float] = time.monotonic
+    ):
+    """
+    Args:
+      failure_threshold (int): Consecutive failures that open the circuit.
+      base_cooldown_sec (float): How long the circuit first stays open.
+      max_cooldown_sec (float): Upper limit of the cooldown as it doubles.
+      clock (Callable[[], float]): Source of monotonic time, in seconds.
+    """
+    if failure_threshold < 1:
+      raise ValueError(f'failure_threshold must be at least 1. Received: {failure_threshold}')
+    if base_cooldown_sec < 0 or max_cooldown_sec < base_cooldown_sec:
+      raise ValueError(
+        'Cooldowns must satisfy 0 <= base_cooldown_sec <= max_cooldown_sec. '
+        f'Received: {base_cooldown_sec}, {max_cooldown_sec}'
+      )
+    self._failure_threshold = failure_threshold
+    self._base_cooldown_sec = base_cooldown_sec
+    self._max_cooldown_sec = max_cooldown_sec
+    self._clock = clock
+
+    self._lock = threading.Lock()
+    self._state = CircuitState.CLOSED
+    self._failure_count = 0
+    self._cooldown_sec = base_cooldown_sec
+    self._opened_at = 0.0
+    self._probe_started_at = 0.0
+
+  @classmethod
+  def for_endpoint(cls, host: str, port: int) -> 'CircuitBreaker':
+    """
+    Return the breaker shared by everything communicating with `host` and `port`,
+    creating it with default settings if there is none
+    """
+    with cls._registry_lock:
+      breaker = cls._registry.get((host, port))
+      if breaker is None:
+        breaker = cls._registry[(host, port)] = cls()
+      return breaker
+
+  @property
+  def state(self) -> CircuitState:
+    return self._state
+
+  @property
+  def cooldown_sec(self) -> float:
+    """
+    How long the circuit stays open the next time it opens
+    """
+    return self._cooldown_sec
+
+  def check(self) -> None:
+    """
+    Call before each request.
+
+    Raises:
+      CircuitOpenError: The circuit is open, or half-open with its probe request
+        already in flight.
+    """
+    with self._lock:
+      if self._state == CircuitState.CLOSED:
+        return
+      if self._state == CircuitState.HALF_OPEN:
+        if self._clock() - self._probe_started_at < self._cooldown_sec:
+          raise CircuitOpenError('Circuit half-open; probe already in progress')
+        LOGGER.warning('No outcome recorded for circuit breaker probe; treating it as failed')
+        self._fail_probe()
+      remaining_sec = self._opened_at + self._cooldown_sec - self._clock()
+      if remaining_sec <= 0:
+        # Let this request through as the probe
+        self._state = CircuitState.HALF_OPEN
+        self._probe_started_at = self._clock()
+        return
+      raise CircuitOpenError(f'Circuit open; retrying in {remaining_sec:.1f}s')
+
+  def record_success(self) -> None:
+    with self._lock:
+      if self._state != CircuitState.CLOSED:
+        LOGGER.info('Device recovered; closing circuit')
+      self._state = CircuitState.CLOSED
+      self._failure_count = 0
+      self._cooldown_sec = self._base_cooldown_sec
+
+  def record_failure(self) -> None:
+    with self._lock:
+      if self._state == CircuitState.HALF_OPEN:
+        self._fail_probe()
+        return
+      self._failure_count += 1
+      if self._state == CircuitState.CLOSED and self._failure_count >= self._failure_threshold:
+        self._open()
+
+  def _fail_probe(self) -> None:
+    self._failure_count += 1
+    self._cooldown_sec = min(self._cooldown_sec * 2, self._max_cooldown_sec)
+    self._open()
+
+  def _open(self) -> None:
+    LOGGER.warning(
+      'Device failed %d consecutive times; failing fast for %.1fs',
+      self._failure_count,
+      self._cooldown_sec
+    )
+    self._state = CircuitState.OPEN
+    self._opened_at = self._clock()
+
+  def __repr__(self) -> str:
+    return f'CircuitBreaker(state={self.state.value}, cooldown_sec={self.cooldown_sec})'
@@ -0,0 +1,40 @@
+class CachePolicy:
+  """
+  Controls how long `MediaSwitch` state is considered fresh, letting `update` skip
+  device I/O when another caller refreshed it recently
+  """
+
+  def __init__(
+      self,
+      max_age_sec: float,
+      stale_while_revalidate: bool = False
+    ):
+    """
+    Args:
+      max_age_sec (float): How long, in seconds, state remains fresh after being
+        received from the device.
+      stale_while_revalidate (bool): When state is stale, return immediately and
+        refresh it in the background, rather than waiting for the device.
+        Default: False.
+    """
+    if max_age_sec < 0:
+      raise ValueError(f'max_age_sec must not be negative. Received: {max_age_sec}')
+    self._max_age_sec = max_age_sec
+    self._stale_while_revalidate = stale_while_revalidate
+
+  @property
+  def max_age_sec(self) -> float:
+    return self._max_age_sec
+
+  @property
+  def stale_while_revalidate(self) -> bool:
+    return self._stale_while_revalidate
+
+  def is_fresh(self, age_sec: float) -> bool:
+    return age_sec <= self._max_age_sec
+
+  def __repr__(self) -> str:
+    return (
+      f'CachePolicy(max_age_sec={self.max_age_sec}, '
+      f'stale_while_revalidate={self.stale_while_revalidate})'
+    )
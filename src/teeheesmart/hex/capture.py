@@ -0,0 +1,283 @@
+import os
+import struct
+import threading
+import time
+
+from enum import IntEnum, unique
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from ..constants import LOGGER
+from .io import _FENCE, Command, FrameDecoder, Instruction, TcpEndpoint
+
+@unique
+class Direction(IntEnum):
+  """
+  Kind of event a capture record holds
+  """
+  # Bytes written to the device
+  SENT = 0
+  # Bytes read from the device; empty when the device closed the connection
+  RECEIVED = 1
+  # A connection was opened; data holds the device's `host:port`
+  CONNECTED = 2
+
+class CaptureRecord:
+  """
+  One event in a capture
+  """
+
+  def __init__(self, direction: Direction, timestamp_ns: int, data: bytes):
+    self._direction = direction
+    self._timestamp_ns = timestamp_ns
+    self._data = data
+
+  @property
+  def direction(self) -> Direction:
+    return self._direction
+
+  @property
+  def timestamp_ns(self) -> int:
+    """
+    Monotonic clock reading when the event occurred, comparable only with other
+    records from the same capture
+    """
+    return self._timestamp_ns
+
+  @property
+  def data(self) -> bytes:
+    return self._data
+
+  def __eq__(self, other):
+    if not isinstance(other, CaptureRecord):
+      return NotImplemented
+    return (self.direction, self.timestamp_ns, self.data) == \
+      (other.direction, other.timestamp_ns, other.data)
+
+  def __repr__(self) -> str:
+    return f'CaptureRecord({self.direction.name}, {self.timestamp_ns}, {self.data!r})'
+
+# Begins every capture file, identifying its format
+_MAGIC = b'THSCAP\x01\n'
+# Direction, monotonic timestamp in nanoseconds and data length, then the data
+_RECORD_HEADER = struct.Struct('<BQH')
+
+class CaptureRecorder:
+  """
+  Appends the bytes exchanged with devices, with timestamps, to a compact binary
+  log, for replay with `ReplayDevice`.
+
+  Each record is flushed as it is written, so a capture survives the process
+  crashing. The file is opened on first use and reopened after `close`, so one
+  recorder can be shared by several devices.
+  """
+
+  def __init__(self, path: str | os.PathLike):
+    self._path = os.fspath(path)
+    self._lock = threading.Lock()
+    self._file: Optional[BinaryIO] = None
+
+  @property
+  def path(self) -> str:
+    return self._path
+
+  def record_connected(self, endpoint: TcpEndpoint) -> None:
+    self.record(Direction.CONNECTED, f'{endpoint.host}:{endpoint.port}'.encode('utf-8'))
+
+  def record_sent(self, data: bytes | memoryview) -> None:
+    self.record(Direction.SENT, data)
+
+  def record_received(self, data: bytes | memoryview) -> None:
+    self.record(Direction.RECEIVED, data)
+
+  def record(self, direction: Direction, data: bytes | memoryview) -> None:
+    header = _RECORD_HEADER.pack(direction, time.monotonic_ns(), len(data))
+    with self._lock:
+      file = self._open()
+      file.write(header)
+      file.write(data)
+      file.flush()
+
+  def close(self) -> None:
+    with self._lock:
+      if self._file is not None:
+        self._file.close()
+        self._file = None
+
+  def __enter__(self) -> 'CaptureRecorder':
+    return self
+
+  def __exit__(self, *_) -> None:
+    self.close()
+
+  def _open(self) -> BinaryIO:
+    if self._file is None:
+      self._file = open(self._path, 'ab')
+      if self._file.tell() == 0:
+        self._file.write(_MAGIC)
+    return self._file
+
+def read_capture(path: str | os.PathLike) -> Iterator[CaptureRecord]:
+  """
+  Read the records of a capture written by `CaptureRecorder`.
+
+  A truncated final record, left by a crash mid-write, is ignored.
+
+  Raises:
+    ValueError: The file is not a capture.
+  """
+  with open(path, 'rb') as file:
+    if file.read(len(_MAGIC)) != _MAGIC:
+      raise ValueError(f'Not a capture file: {os.fspath(path)}')
+    while True:
+      header = file.read(_RECORD_HEADER.size)
+      if len(header) < _RECORD_HEADER.size:
+        return
+      direction, timestamp_ns, length = _RECORD_HEADER.unpack(header)
+      data = file.read(length)
+      if len(data) < length:
+        return
+      yield CaptureRecord(Direction(direction), timestamp_ns, data)
+
+class ReplayDevice:
+  """
+  Stands in for a `TcpDevice`, answering each instruction with the replies
+  captured when it was originally sent, so a `MediaSwitch` session can be
+  reproduced without the device.
+
+  Instructions are expected in the order they were captured; differences are
+  logged but otherwise ignored.
+  """
+
+  def __init__(
+      self,
+      records: Iterable[CaptureRecord] | str | os.PathLike,
+      speed: Optional[float] = 1.0,
+      endpoint: Optional[TcpEndpoint] = None
+    ):
+    """
+    Args:
+      records (Iterable[CaptureRecord] | str | os.PathLike): Capture records, or
+        the path of a capture file.
+      speed (Optional[float]): How much faster than originally captured replies
+        are given, e.g., 10 for ten times faster. None replies immediately.
+      endpoint (Optional[TcpEndpoint]): Reported as the device's endpoint.
+        Default: that of the first connection in the capture.
+    """
+    if speed is not None and speed <= 0:
+      raise ValueError(f'speed must be positive. Received: {speed}')
+    if isinstance(records, (str, os.PathLike)):
+      records = read_capture(records)
+    self._records = list(records)
+    self._speed = speed
+    self._endpoint = endpoint or self._captured_endpoint()
+
+    self._lock = threading.Lock()
+    self._position = 0
+    # Captured frames sent alongside those already replayed, e.g., when pipelined
+    self._unmatched_sent: list[Instruction] = []
+
+  @property
+  def endpoint(self) -> TcpEndpoint:
+    return self._endpoint
+
+  @property
+  def remaining_record_count(self) -> int:
+    return len(self._records) - self._position
+
+  def process(self, instructions: list[Instruction] | Instruction) -> list[Instruction]:
+    """
+    Raises:
+      EOFError: The capture holds no more exchanges.
+    """
+    try:
+      _ = iter(instructions)
+    except TypeError:
+      # Single instruction provided; wrap it.
+      instructions = [instructions]
+
+    results: list[Instruction] = []
+    with self._lock:
+      for instruction in instructions:
+        results.extend(self._replay(instruction))
+      self._discard_fence()
+    return results
+
+  def close(self) -> None:
+    pass
+
+  def _replay(self, instruction: Instruction) -> list[Instruction]:
+    if instruction != _FENCE:
+      self._discard_fence()
+    if len(self._unmatched_sent) > 0:
+      # Replies to a batch were all replayed with its first instruction
+      self._check_matches(instruction, self._unmatched_sent.pop(0))
+      return []
+
+    sent = self._next_sent_record()
+    captured = FrameDecoder().feed(sent.data)
+    if len(captured) > 0:
+      self._check_matches(instruction, captured[0])
+      self._unmatched_sent = captured[1:]
+
+    decoder = FrameDecoder()
+    responses: list[Instruction] = []
+    replied_at_ns: Optional[int] = None
+    for record in self._records_until_sent():
+      if record.direction != Direction.RECEIVED:
+        continue
+      replied_at_ns = record.timestamp_ns
+      if record.data == b'':
+        responses.append(Instruction(Command.NULL_RESPONSE))
+      else:
+        responses.extend(decoder.feed(record.data))
+
+    if self._speed is not None:
+      if replied_at_ns is None:
+        # Nothing was received, so the original wait ended with the next send
+        replied_at_ns = self._next_timestamp_ns(sent.timestamp_ns)
+      time.sleep((replied_at_ns - sent.timestamp_ns) / 1e9 / self._speed)
+    return responses
+
+  def _discard_fence(self) -> None:
+    """
+    Forget a query captured after an instruction in the same write, unless it is
+    replayed next: a fenced device sends one after instructions that only
+    sometimes reply, and its reply was replayed with theirs
+    """
+    if self._unmatched_sent == [_FENCE]:
+      self._unmatched_sent = []
+
+  def _next_timestamp_ns(self, default_ns: int) -> int:
+    if self._position < len(self._records):
+      return self._records[self._position].timestamp_ns
+    return default_ns
+
+  def _next_sent_record(self) -> CaptureRecord:
+    while self._position < len(self._records):
+      record = self._records[self._position]
+      self._position += 1
+      if record.direction == Direction.SENT:
+        return record
+    raise EOFError('No captured exchanges remain to replay')
+
+  def _records_until_sent(self) -> Iterator[CaptureRecord]:
+    while self._position < len(self._records):
+      record = self._records[self._position]
+      if record.direction == Direction.SENT:
+        return
+      self._position += 1
+      yield record
+
+  def _check_matches(self, instruction: Instruction, captured: Instruction) -> None:
+    if instruction != captured:
+      LOGGER.warning('Replaying %s in place of captured %s', instruction, captured)
+
+  def _captured_endpoint(self) -> TcpEndpoint:
+    connected = next(
+      (record for record in self._records if record.direction == Direction.CONNECTED),
+      None
+    )
+    if connected is None:
+      return TcpEndpoint('localhost')
+    host, _, port = connected.data.decode('utf-8').rpartition(':')
+    return TcpEndpoint(host, int(port))
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar('T')
+
+class _Batch:
+  def __init__(self):
+    self.done = threading.Event()
+    self.error: Optional[BaseException] = None
+
+class LastWriteWinsCoalescer(Generic[T]):
+  """
+  Coalesces bursts of submitted values so that only the last one within a window
+  is acted upon.
+
+  The first submission in a burst waits out the window, then sends the most
+  recently submitted value. Every caller in the burst blocks until that send
+  completes, and receives its error, if any.
+  """
+
+  def __init__(self, window_sec: float, send: Callable[[T], None]):
+    if window_sec < 0:
+      raise ValueError(f'window_sec must not be negative. Received: {window_sec}')
+    self._window_sec = window_sec
+    self._send = send
+
+    self._lock = threading.Lock()
+    self._batch: Optional[_Batch] = None
+    self._pending: Optional[T] = None
+
+  @property
+  def window_sec(self) -> float:
+    return self._window_sec
+
+  def submit(self, value: T) -> None:
+    with self._lock:
+      self._pending = value
+      batch = self._batch
+      is_leader = batch is None
+      if is_leader:
+        batch = self._batch = _Batch()
+
+    if is_leader:
+      self._flush(batch)
+    else:
+      batch.done.wait()
+
+    if batch.error is not None:
+      raise batch.error
+
+  def _flush(self, batch: _Batch) -> None:
+    time.sleep(self._window_sec)
+    # Submissions from here on start a new burst
+    with self._lock:
+      value = self._pending
+      self._pending = None
+      self._batch = None
+    try:
+      self._send(value)
+    except BaseException as ex:
+      batch.error = ex
+    finally:
+      batch.done.set()
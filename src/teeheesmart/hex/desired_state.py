@@ -0,0 +1,51 @@
+from typing import Optional
+
+class DesiredState:
+  """
+  Configuration for `MediaSwitch.apply` to bring a switch to. Settings left as
+  None are not changed.
+  """
+
+  def __init__(
+      self,
+      selected_source: Optional[int] = None,
+      buzzer_muted: Optional[bool] = None,
+      led_timeout_seconds: Optional[int] = None,
+      auto_input_detection: Optional[bool] = None
+    ):
+    """
+    Args:
+      selected_source (Optional[int]): Input to select.
+      buzzer_muted (Optional[bool]): Whether the buzzer is muted.
+      led_timeout_seconds (Optional[int]): LED timeout: 0, 10 or 30.
+      auto_input_detection (Optional[bool]): Whether input auto-detection is
+        enabled.
+    """
+    self._selected_source = selected_source
+    self._buzzer_muted = buzzer_muted
+    self._led_timeout_seconds = led_timeout_seconds
+    self._auto_input_detection = auto_input_detection
+
+  @property
+  def selected_source(self) -> Optional[int]:
+    return self._selected_source
+
+  @property
+  def buzzer_muted(self) -> Optional[bool]:
+    return self._buzzer_muted
+
+  @property
+  def led_timeout_seconds(self) -> Optional[int]:
+    return self._led_timeout_seconds
+
+  @property
+  def auto_input_detection(self) -> Optional[bool]:
+    return self._auto_input_detection
+
+  def __repr__(self) -> str:
+    return (
+      f'DesiredState(selected_source={self.selected_source}, '
+      f'buzzer_muted={self.buzzer_muted}, '
+      f'led_timeout_seconds={self.led_timeout_seconds}, '
+      f'auto_input_detection={self.auto_input_detection})'
+    )
@@ -0,0 +1,413 @@
+"""
+Emulates Hex protocol devices on localhost, for exercising clients end to end
+without hardware.
+
+Run `python -m teeheesmart.hex.emulator --count 100` to serve 100 emulated
+switches until interrupted.
+"""
+import argparse
+import asyncio
+import random
+import threading
+
+from typing import Optional
+
+from ..constants import LOGGER
+from .io import Command, FrameDecoder, Instruction, ResponsePolicy
+from .media_switch import MAX_SUPPORTED_INPUTS
+
+# How emulated devices reply by default, matching observed hardware: a valid
+# input selection is always acknowledged, while an invalid one is ignored.
+EMULATED_RESPONSE_POLICIES: dict[Command, ResponsePolicy] = {
+  Command.SWITCH_VIDEO: ResponsePolicy.EXPECTS_REPLY,
+  Command.MUTE_BUZZER: ResponsePolicy.NEVER_REPLIES,
+  Command.LED_TIMEOUT_SECONDS: ResponsePolicy.NEVER_REPLIES,
+  Command.QUERY_ACTIVE_INPUT: ResponsePolicy.EXPECTS_REPLY,
+  Command.ENABLE_INPUT_DETECTION: ResponsePolicy.NEVER_REPLIES,
+}
+
+class EmulatedSwitch:
+  """
+  State of an emulated switch, and the replies it gives to each instruction
+  """
+  DEFAULT_INPUT_COUNT: int = 4
+
+  def __init__(
+      self,
+      input_count: int = DEFAULT_INPUT_COUNT,
+      response_policies: Optional[dict[Command, ResponsePolicy]] = None,
+      rand: Optional[random.Random] = None
+    ):
+    """
+    Args:
+      input_count (int): Number of inputs the switch has.
+      response_policies (Optional[dict[Command, ResponsePolicy]]): Overrides for
+        `EMULATED_RESPONSE_POLICIES`. Commands that sometimes reply do so half of
+        the time; unlisted commands never reply.
+      rand (Optional[random.Random]): Source of randomness, for repeatable runs.
+    """
+    if input_count not in range(1, MAX_SUPPORTED_INPUTS + 1):
+      raise ValueError(
+        f'Input count must be between 1 and {MAX_SUPPORTED_INPUTS}, inclusive. '
+        f'Received: {input_count}'
+      )
+    self._input_count = input_count
+    self._response_policies = {**EMULATED_RESPONSE_POLICIES, **(response_policies or {})}
+    self._rand = rand or random.Random()
+
+    self._selected_source = 1
+    self._buzzer_muted = False
+    self._led_timeout_seconds = 0
+    self._auto_input_detection = False
+
+  @property
+  def input_count(self) -> int:
+    return self._input_count
+
+  @property
+  def selected_source(self) -> int:
+    return self._selected_source
+
+  @property
+  def buzzer_muted(self) -> bool:
+    return self._buzzer_muted
+
+  @property
+  def led_timeout_seconds(self) -> int:
+    return self._led_timeout_seconds
+
+  @property
+  def auto_input_detection(self) -> bool:
+    return self._auto_input_detection
+
+  def handle(self, instruction: Instruction) -> Optional[Instruction]:
+    """
+    Apply an instruction, returning the reply to send, if any
+    """
+    match instruction.id:
+      case Command.SWITCH_VIDEO:
+        if instruction.data_value not in range(1, self._input_count + 1):
+          return None
+        self._selected_source = instruction.data_value
+      case Command.MUTE_BUZZER:
+        # Zero turns the buzzer off
+        self._buzzer_muted = instruction.data_value == 0
+      case Command.LED_TIMEOUT_SECONDS:
+        self._led_timeout_seconds = instruction.data_value
+      case Command.ENABLE_INPUT_DETECTION:
+        self._auto_input_detection = instruction.data_value != 0
+      case Command.QUERY_ACTIVE_INPUT:
+        pass
+      case _:
+        return None
+
+    policy = self._response_policies.get(instruction.id, ResponsePolicy.NEVER_REPLIES)
+    if policy == ResponsePolicy.NEVER_REPLIES:
+      return None
+    if policy == ResponsePolicy.SOMETIMES_REPLIES and self._rand.random() < 0.5:
+      return None
+    return self.active_input_instruction()
+
+  def select_from_front_panel(self, input: int) -> Instruction:
+    """
+    Select an input as if via the front panel, returning the frame the device
+    reports to connected clients
+    """
+    if input in range(1, self._input_count + 1):
+      self._selected_source = input
+    return self.active_input_instruction()
+
+  def active_input_instruction(self) -> Instruction:
+    return Instruction(Command.CURRENT_ACTIVE_INPUT, self._selected_source - 1)
+
+class EmulatorServer:
+  """
+  Serves an `EmulatedSwitch` over TCP using asyncio
+  """
+  READ_SIZE: int = 256
+  # Time allowed for client connections to finish when closing
+  CLOSE_TIMEOUT_SEC: float = 1.0
+
+  def __init__(
+      self,
+      switch: Optional[EmulatedSwitch] = None,
+      latency_sec: float = 0.0,
+      drop_rate: float = 0.0,
+      max_connections: Optional[int] = None,
+      rand: Optional[random.Random] = None
+    ):
+    """
+    Args:
+      switch (Optional[EmulatedSwitch]): Switch to serve. Default: a new switch
+        with default settings.
+      latency_sec (float): Delay before handling each instruction.
+      drop_rate (float): Fraction of replies, between 0 and 1, silently dropped.
+      max_connections (Optional[int]): Connections accepted at once; more are
+        closed immediately. Default: None, which is unlimited.
+      rand (Optional[random.Random]): Source of randomness, for repeatable runs.
+    """
+    if drop_rate < 0 or drop_rate > 1:
+      raise ValueError(f'drop_rate must be between 0 and 1, inclusive. Received: {drop_rate}')
+    self._switch = switch or EmulatedSwitch(rand = rand)
+    self._latency_sec = latency_sec
+    self._drop_rate = drop_rate
+    self._max_connections = max_connections
+    self._rand = rand or random.Random()
+
+    self._server: Optional[asyncio.Server] = None
+    self._writers: set[asyncio.StreamWriter] = set()
+    # Tasks serving each client connection, awaited on close
+    self._handlers: set[asyncio.Task] = set()
+    self._rejected_count = 0
+
+  @property
+  def switch(self) -> EmulatedSwitch:
+    return self._switch
+
+  @property
+  def host(self) -> str:
+    return self._address()[0]
+
+  @property
+  def port(self) -> int:
+    return self._address()[1]
+
+  @property
+  def connection_count(self) -> int:
+    """
+    Number of currently open client connections
+    """
+    return len(self._writers)
+
+  @property
+  def rejected_count(self) -> int:
+    """
+    Number of connections closed for exceeding `max_connections`
+    """
+    return self._rejected_count
+
+  async def start(self, host: str = '127.0.0.1', port: int = 0) -> None:
+    """
+    Start accepting connections. Port 0 picks a free port, available via `port`.
+    """
+    self._server = await asyncio.start_server(self._handle_connection, host, port)
+
+  async def close(self) -> None:
+    if self._server is None:
+      return
+    self._server.close()
+    for writer in list(self._writers):
+      writer.close()
+    if len(self._handlers) > 0:
+      # Handlers return once they see their connection closed; any that don't in
+      # time, e.g., while delaying a reply, are cancelled
+      _, pending = await asyncio.wait(self._handlers, timeout = EmulatorServer.CLOSE_TIMEOUT_SEC)
+      for handler in pending:
+        handler.cancel()
+      await asyncio.gather(*pending, return_exceptions = True)
+    await self._server.wait_closed()
+    self._server = None
+
+  def select_from_front_panel(self, input: int) -> None:
+    """
+    Select an input as if via the front panel, notifying connected clients. Must
+    be called on the server's event loop.
+    """
+    data = self._switch.select_from_front_panel(input).frame_bytes
+    for writer in self._writers:
+      writer.write(data)
+
+  async def __aenter__(self) -> 'EmulatorServer':
+    if self._server is None:
+      await self.start()
+    return self
+
+  async def __aexit__(self, *_) -> None:
+    await self.close()
+
+  def _address(self) -> tuple[str, int]:
+    if self._server is None:
+      raise RuntimeError('Emulator has not been started')
+    return self._server.sockets[0].getsockname()[:2]
+
+  async def _handle_connection(
+      self,
+      reader: asyncio.StreamReader,
+      writer: asyncio.StreamWriter
+    ) -> None:
+    if self._max_connections is not None and len(self._writers) >= self._max_connections:
+      self._rejected_count += 1
+      writer.close()
+      return
+
+    handler = asyncio.current_task()
+    self._handlers.add(handler)
+    self._writers.add(writer)
+    decoder = FrameDecoder()
+    try:
+      while True:
+        chunk = await reader.read(EmulatorServer.READ_SIZE)
+        if chunk == b'':
+          return
+        for instruction in decoder.feed(chunk):
+          if self._latency_sec > 0:
+            await asyncio.sleep(self._latency_sec)
+          reply = self._switch.handle(instruction)
+          if reply is not None and not self._should_drop():
+            writer.write(reply.frame_bytes)
+        await writer.drain()
+    except ConnectionError as ex:
+      LOGGER.debug('Emulator client connection failed: %s', ex)
+    finally:
+      self._writers.discard(writer)
+      self._handlers.discard(handler)
+      writer.close()
+
+  def _should_drop(self) -> bool:
+    return self._drop_rate > 0 and self._rand.random() < self._drop_rate
+
+class EmulatorPool:
+  """
+  Runs emulators on an event loop in a background thread, so they can be driven
+  by blocking clients, such as those from `get_media_switch`
+  """
+
+  def __init__(
+      self,
+      count: int = 1,
+      input_count: int = EmulatedSwitch.DEFAULT_INPUT_COUNT,
+      response_policies: Optional[dict[Command, ResponsePolicy]] = None,
+      latency_sec: float = 0.0,
+      drop_rate: float = 0.0,
+      max_connections: Optional[int] = None,
+      seed: Optional[int] = None
+    ):
+    """
+    Args:
+      count (int): Number of emulators, each with its own port and state.
+      seed (Optional[int]): Seeds the randomness of every emulator, for repeatable
+        runs.
+
+    See `EmulatedSwitch` and `EmulatorServer` for the remaining options, which
+    apply to every emulator.
+    """
+    rand = random.Random(seed)
+    self._servers = [
+      EmulatorServer(
+        EmulatedSwitch(input_count, response_policies, random.Random(rand.random())),
+        latency_sec = latency_sec,
+        drop_rate = drop_rate,
+        max_connections = max_connections,
+        rand = random.Random(rand.random()),
+      )
+      for _ in range(count)
+    ]
+    self._loop: Optional[asyncio.AbstractEventLoop] = None
+    self._thread: Optional[threading.Thread] = None
+
+  @property
+  def servers(self) -> list[EmulatorServer]:
+    return list(self._servers)
+
+  @property
+  def urls(self) -> list[str]:
+    """
+    Device URLs of the emulators, as accepted by `get_media_switch`
+    """
+    return [f'{server.host}:{server.port}' for server in self._servers]
+
+  def start(self, host: str = '127.0.0.1') -> None:
+    if self._thread is not None:
+      return
+    self._loop = asyncio.new_event_loop()
+    self._thread = threading.Thread(
+      target = self._loop.run_forever,
+      name = 'teeheesmart-emulator',
+      daemon = True,
+    )
+    self._thread.start()
+    self.run(self._start_servers(host))
+
+  def run(self, coroutine):
+    """
+    Run a coroutine on the emulators' event loop, returning its result
+    """
+    if self._loop is None:
+      raise RuntimeError('Emulator pool has not been started')
+    return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+  def select_from_front_panel(self, server: EmulatorServer, input: int) -> None:
+    async def select() -> None:
+      server.select_from_front_panel(input)
+    self.run(select())
+
+  def close(self) -> None:
+    if self._thread is None:
+      return
+    self.run(self._close_servers())
+    self._loop.call_soon_threadsafe(self._loop.stop)
+    self._thread.join()
+    self._loop.close()
+    self._loop = None
+    self._thread = None
+
+  def __enter__(self) -> 'EmulatorPool':
+    self.start()
+    return self
+
+  def __exit__(self, *_) -> None:
+    self.close()
+
+  async def _start_servers(self, host: str) -> None:
+    for server in self._servers:
+      await server.start(host)
+
+  async def _close_servers(self) -> None:
+    await asyncio.gather(*(server.close() for server in self._servers))
+
+async def _serve(args: argparse.Namespace) -> None:
+  rand = random.Random(args.seed)
+  servers = [
+    EmulatorServer(
+      EmulatedSwitch(args.inputs, rand = random.Random(rand.random())),
+      latency_sec = args.latency_ms / 1000,
+      drop_rate = args.drop_rate,
+      max_connections = args.max_connections,
+      rand = random.Random(rand.random()),
+    )
+    for _ in range(args.count)
+  ]
+  for index, server in enumerate(servers):
+    await server.start(args.host, 0 if args.port == 0 else args.port + index)
+    print(f'{server.host}:{server.port}', flush = True)
+  try:
+    await asyncio.Event().wait()
+  finally:
+    for server in servers:
+      await server.close()
+
+def main(argv: Optional[list[str]] = None) -> None:
+  parser = argparse.ArgumentParser(
+    description = 'Serve emulated Hex protocol switches, printing the URL of each'
+  )
+  parser.add_argument('--count', type = int, default = 1, help = 'Number of switches')
+  parser.add_argument('--host', default = '127.0.0.1')
+  parser.add_argument(
+    '--port',
+    type = int,
+    default = 0,
+    help = 'Port of the first switch, with the rest on consecutive ports. Default: any free port',
+  )
+  parser.add_argument('--inputs', type = int, default = EmulatedSwitch.DEFAULT_INPUT_COUNT)
+  parser.add_argument('--latency-ms', type = float, default = 0.0, help = 'Delay per instruction')
+  parser.add_argument('--drop-rate', type = float, default = 0.0, help = 'Fraction of replies dropped')
+  parser.add_argument('--max-connections', type = int, help = 'Connections accepted per switch')
+  parser.add_argument('--seed', type = int)
+  args = parser.parse_args(argv)
+  try:
+    asyncio.run(_serve(args))
+  except KeyboardInterrupt:
+    pass
+
+if __name__ == '__main__':
+  main()
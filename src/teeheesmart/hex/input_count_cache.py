@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import threading
+
+from ..constants import LOGGER
+from typing import Optional
+
+class InputCountCache:
+  """
+  Persists detected device input counts on disk, keyed by `host:port`, so they
+  need not be probed again on restart.
+
+  The cache is a small JSON file; unreadable or corrupt files are treated as empty.
+  """
+
+  def __init__(self, path: str | os.PathLike):
+    self._path = os.fspath(path)
+    self._lock = threading.Lock()
+
+  @property
+  def path(self) -> str:
+    return self._path
+
+  @staticmethod
+  def key(host: str, port: int) -> str:
+    return f'{host}:{port}'
+
+  def get(self, host: str, port: int) -> Optional[int]:
+    with self._lock:
+      value = self._read().get(self.key(host, port))
+    if isinstance(value, int) and value > 0:
+      return value
+    return None
+
+  def set(self, host: str, port: int, input_count: int) -> None:
+    with self._lock:
+      entries = self._read()
+      entries[self.key(host, port)] = input_count
+      self._write(entries)
+
+  def _read(self) -> dict:
+    try:
+      with open(self._path, 'r', encoding = 'utf-8') as file:
+        entries = json.load(file)
+    except FileNotFoundError:
+      return {}
+    except (OSError, ValueError) as ex:
+      LOGGER.warning('Ignoring unreadable input count cache %s: %s', self._path, ex)
+      return {}
+    if not isinstance(entries, dict):
+      return {}
+    return entries
+
+  def _write(self, entries: dict) -> None:
+    # Write to a temporary file and rename it into place, so concurrent readers
+    # never observe a partially-written cache.
+    directory = os.path.dirname(os.path.abspath(self._path))
+    os.makedirs(directory, exist_ok = True)
+    fd, temp_path = tempfile.mkstemp(dir = directory, prefix = '.input_count_cache')
+    try:
+      with os.fdopen(fd, 'w', encoding = 'utf-8') as file:
+        json.dump(entries, file, indent = 2, sort_keys = True)
+      os.replace(temp_path, self._path)
+    except BaseException:
+      os.unlink(temp_path)
+      raise
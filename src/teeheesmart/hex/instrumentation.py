@@ -0,0 +1,286 @@
+import bisect
+import threading
+
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+  from .io import Instruction, TcpEndpoint
+
+class DeviceObserver:
+  """
+  Receives timing and traffic events from a `TcpDevice`.
+
+  Every method does nothing by default, so implementations override only the
+  events they need. Events are reported on the thread doing the I/O, while it
+  waits, so implementations must be quick and must not raise.
+  """
+
+  def on_connect(self, endpoint: 'TcpEndpoint', elapsed_sec: float) -> None:
+    """
+    A connection to the device was established
+    """
+
+  def on_exchange(
+      self,
+      endpoint: 'TcpEndpoint',
+      instruction: 'Instruction',
+      elapsed_sec: float,
+      bytes_sent: int,
+      bytes_received: int,
+      timed_out: bool
+    ) -> None:
+    """
+    An instruction was sent and its reply, if any, was read.
+
+    Args:
+      endpoint (TcpEndpoint): Device communicated with.
+      instruction (Instruction): Instruction sent.
+      elapsed_sec (float): Time from sending until the reply arrived or waiting
+        for it stopped. For pipelined instructions, that of the whole batch.
+      bytes_sent (int): Bytes written for the instruction.
+      bytes_received (int): Bytes read while waiting for its reply.
+      timed_out (bool): Whether waiting for a reply timed out. For pipelined
+        instructions, whether a reply the device always sends is missing.
+    """
+
+  def on_error(
+      self,
+      endpoint: 'TcpEndpoint',
+      instruction: Optional['Instruction'],
+      error: Exception
+    ) -> None:
+    """
+    Connecting or communicating failed.
+
+    Args:
+      instruction (Optional[Instruction]): Instruction in flight, or None when
+        connecting failed.
+    """
+
+class LatencyHistogram:
+  """
+  Thread-safe histogram of durations, in fixed buckets growing roughly 25% wider
+  from 100 microseconds to about a minute. Recording is a binary search and a
+  counter increment, cheap enough to leave enabled in production.
+  """
+  # Upper bound of each bucket, in seconds; the last bucket is unbounded
+  BUCKET_BOUNDS_SEC: tuple[float, ...] = tuple(
+    round(0.0001 * 1.25 ** i, 7) for i in range(61)
+  )
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._counts = [0] * (len(LatencyHistogram.BUCKET_BOUNDS_SEC) + 1)
+    self._count = 0
+    self._total_sec = 0.0
+    self._min_sec: Optional[float] = None
+    self._max_sec: Optional[float] = None
+
+  def record(self, elapsed_sec: float) -> None:
+    bucket = bisect.bisect_left(LatencyHistogram.BUCKET_BOUNDS_SEC, elapsed_sec)
+    with self._lock:
+      self._counts[bucket] += 1
+      self._count += 1
+      self._total_sec += elapsed_sec
+      if self._min_sec is None or elapsed_sec < self._min_sec:
+        self._min_sec = elapsed_sec
+      if self._max_sec is None or elapsed_sec > self._max_sec:
+        self._max_sec = elapsed_sec
+
+  @property
+  def count(self) -> int:
+    return self._count
+
+  @property
+  def mean_sec(self) -> Optional[float]:
+    if self._count == 0:
+      return None
+    return self._total_sec / self._count
+
+  @property
+  def min_sec(self) -> Optional[float]:
+    return self._min_sec
+
+  @property
+  def max_sec(self) -> Optional[float]:
+    return self._max_sec
+
+  def percentile(self, percent: float) -> Optional[float]:
+    """
+    Estimate the duration below which `percent` of recorded durations fall.
+
+    Returns:
+      Optional[float]: Upper bound of the bucket holding the percentile, capped at
+        the maximum recorded duration, or None when nothing has been recorded.
+    """
+    if percent < 0 or percent > 100:
+      raise ValueError(f'percent must be between 0 and 100, inclusive. Received: {percent}')
+    with self._lock:
+      if self._count == 0:
+        return None
+      rank = max(1, percent / 100 * self._count)
+      seen = 0
+      for bucket, bucket_count in enumerate(self._counts):
+        seen += bucket_count
+        if seen >= rank:
+          break
+      if bucket < len(LatencyHistogram.BUCKET_BOUNDS_SEC):
+        return min(LatencyHistogram.BUCKET_BOUNDS_SEC[bucket], self._max_sec)
+      return self._max_sec
+
+  def __repr__(self) -> str:
+    return (
+      f'LatencyHistogram(count={self.count}, p50={self.percentile(50)}, '
+      f'p99={self.percentile(99)}, max={self.max_sec})'
+    )
+
+class CommandStats:
+  """
+  Traffic and latency for one command sent to one device
+  """
+
+  def __init__(self):
+    self._round_trip = LatencyHistogram()
+    self._lock = threading.Lock()
+    self._timeout_count = 0
+    self._error_count = 0
+    self._bytes_sent = 0
+    self._bytes_received = 0
+
+  @property
+  def round_trip(self) -> LatencyHistogram:
+    """
+    Exchanges that did not time out
+    """
+    return self._round_trip
+
+  @property
+  def timeout_count(self) -> int:
+    return self._timeout_count
+
+  @property
+  def error_count(self) -> int:
+    return self._error_count
+
+  @property
+  def bytes_sent(self) -> int:
+    return self._bytes_sent
+
+  @property
+  def bytes_received(self) -> int:
+    return self._bytes_received
+
+  def _record_exchange(
+      self,
+      elapsed_sec: float,
+      bytes_sent: int,
+      bytes_received: int,
+      timed_out: bool
+    ) -> None:
+    if not timed_out:
+      self._round_trip.record(elapsed_sec)
+    with self._lock:
+      if timed_out:
+        self._timeout_count += 1
+      self._bytes_sent += bytes_sent
+      self._bytes_received += bytes_received
+
+  def _record_error(self) -> None:
+    with self._lock:
+      self._error_count += 1
+
+class EndpointStats:
+  """
+  Connection and per-command statistics for one device
+  """
+
+  def __init__(self):
+    self._connect = LatencyHistogram()
+    self._lock = threading.Lock()
+    self._connect_error_count = 0
+    self._commands: dict[int, CommandStats] = {}
+
+  @property
+  def connect(self) -> LatencyHistogram:
+    return self._connect
+
+  @property
+  def connect_error_count(self) -> int:
+    return self._connect_error_count
+
+  @property
+  def commands(self) -> dict[int, CommandStats]:
+    """
+    Statistics keyed by command id, so `Command` members can be used as keys
+    """
+    return dict(self._commands)
+
+  def _record_connect_error(self) -> None:
+    with self._lock:
+      self._connect_error_count += 1
+
+  def _for_command(self, command_id: int) -> CommandStats:
+    stats = self._commands.get(command_id)
+    if stats is None:
+      with self._lock:
+        stats = self._commands.setdefault(command_id, CommandStats())
+    return stats
+
+class HistogramCollector(DeviceObserver):
+  """
+  Observer aggregating connect times, round-trip times, timeouts, errors and
+  traffic per device and command
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._endpoints: dict[tuple[str, int], EndpointStats] = {}
+
+  @property
+  def endpoints(self) -> dict[tuple[str, int], EndpointStats]:
+    """
+    Statistics keyed by device (host, port)
+    """
+    return dict(self._endpoints)
+
+  def for_endpoint(self, host: str, port: int) -> Optional[EndpointStats]:
+    return self._endpoints.get((host, port))
+
+  def on_connect(self, endpoint: 'TcpEndpoint', elapsed_sec: float) -> None:
+    self._for_endpoint(endpoint).connect.record(elapsed_sec)
+
+  def on_exchange(
+      self,
+      endpoint: 'TcpEndpoint',
+      instruction: 'Instruction',
+      elapsed_sec: float,
+      bytes_sent: int,
+      bytes_received: int,
+      timed_out: bool
+    ) -> None:
+    self._for_endpoint(endpoint)._for_command(instruction.id)._record_exchange(
+      elapsed_sec,
+      bytes_sent,
+      bytes_received,
+      timed_out
+    )
+
+  def on_error(
+      self,
+      endpoint: 'TcpEndpoint',
+      instruction: Optional['Instruction'],
+      error: Exception
+    ) -> None:
+    endpoint_stats = self._for_endpoint(endpoint)
+    if instruction is None:
+      endpoint_stats._record_connect_error()
+    else:
+      endpoint_stats._for_command(instruction.id)._record_error()
+
+  def _for_endpoint(self, endpoint: 'TcpEndpoint') -> EndpointStats:
+    key = (endpoint.host, endpoint.port)
+    stats = self._endpoints.get(key)
+    if stats is None:
+      with self._lock:
+        stats = self._endpoints.setdefault(key, EndpointStats())
+    return stats
@@ -1,9 +1,25 @@
 import itertools
+import re
 import socket
+import threading
+import time
 
 from ..constants import LOGGER
-from enum import IntEnum, unique
-from typing import Optional
+from .breaker import CircuitBreaker
+from .instrumentation import DeviceObserver
+from .resolver import ResolverCache
+from .rtt import RttEstimator
+from array import array
+from enum import Enum, IntEnum, unique
+from typing import TYPE_CHECKING, Iterable, Optional
+
+if TYPE_CHECKING:
+  from .capture import CaptureRecorder
+
+try:
+  import numpy
+except ImportError: # Optional; see the `numpy` extra
+  numpy = None
 
 
 @unique
@@ -22,7 +38,50 @@ class Command(IntEnum):
 
   @classmethod
   def is_supported(cls, cmd_id: int) -> bool:
-    return cmd_id in iter(Command)
+    return 0 <= cmd_id < _COMMAND_TABLE_SIZE and _COMMANDS_BY_ID[cmd_id] is not None
+
+# Command ids are a single byte, so every id has a slot in the lookup table
+_COMMAND_TABLE_SIZE = 256
+_COMMANDS_BY_ID: list[Optional[Command]] = [None] * _COMMAND_TABLE_SIZE
+for _command in Command:
+  _COMMANDS_BY_ID[_command.value] = _command
+del _command
+
+@unique
+class ResponsePolicy(Enum):
+  """
+  Whether the device replies to a command
+  """
+  # A reply always arrives, unless communication failed
+  EXPECTS_REPLY = 'expects_reply'
+  # No reply is ever sent, so there is nothing to wait for
+  NEVER_REPLIES = 'never_replies'
+  # A reply may or may not arrive, so wait up to the timeout for one
+  SOMETIMES_REPLIES = 'sometimes_replies'
+
+# Observed device behavior; commands not listed are treated as SOMETIMES_REPLIES.
+DEFAULT_RESPONSE_POLICIES: dict[Command, ResponsePolicy] = {
+  # Replies with the active input only when the requested input exists
+  Command.SWITCH_VIDEO: ResponsePolicy.SOMETIMES_REPLIES,
+  Command.MUTE_BUZZER: ResponsePolicy.NEVER_REPLIES,
+  Command.LED_TIMEOUT_SECONDS: ResponsePolicy.NEVER_REPLIES,
+  Command.QUERY_ACTIVE_INPUT: ResponsePolicy.EXPECTS_REPLY,
+  Command.ENABLE_INPUT_DETECTION: ResponsePolicy.SOMETIMES_REPLIES,
+}
+
+class ResponsePolicies:
+  """
+  Looks up the `ResponsePolicy` for instructions, layering overrides (e.g., for a
+  specific device model) on top of `DEFAULT_RESPONSE_POLICIES`
+  """
+
+  def __init__(self, overrides: Optional[dict[Command, ResponsePolicy]] = None):
+    self._policies = dict(DEFAULT_RESPONSE_POLICIES)
+    if overrides is not None:
+      self._policies.update(overrides)
+
+  def policy_for(self, instruction: 'Instruction') -> ResponsePolicy:
+    return self._policies.get(instruction.id, ResponsePolicy.SOMETIMES_REPLIES)
 
 # Validation rules: limit I/O values to one byte
 _VALUE_MIN = 0
@@ -40,10 +99,19 @@ def _validated_value(maybe_value: Optional[int], default_value: int = 0) -> int:
   else:
     return maybe_value
 
+# Interned instructions, keyed by (command id, data value)
+_INSTRUCTIONS: dict[tuple[int, int], 'Instruction'] = {}
+# The same instructions, keyed by their encoded frame
+_INSTRUCTIONS_BY_FRAME: dict[bytes, 'Instruction'] = {}
+
 class Instruction:
   """
-  Encapsulates a fully-formed Hex instruction
+  Encapsulates a fully-formed Hex instruction.
+
+  Instructions are immutable and interned: constructing the same command and data
+  value again returns the existing instance, whose frame is encoded only once.
   """
+  __slots__ = ('_command', '_id', '_data_value', '_frame_bytes')
 
   # Default name for unsupported/unrecognized commands
   UNSUPPORTED_COMMAND_NAME: str = "UNSUPPORTED"
@@ -51,26 +119,44 @@ class Instruction:
   # Hex uses 6-byte instructions
   SIZE_BYTES: int = 6
 
-  def __init__(
-    self,
+  def __new__(
+    cls,
     cmd: int,
     data_value: Optional[int] = None
-  ):
-    if Command.is_supported(cmd):
-      self._command = Command(cmd)
-      self._unsupported_command_id = None
-    else:
-      self._command = None
-      self._unsupported_command_id = cmd
+  ) -> 'Instruction':
+    # Command and bool keys hash and compare equal to their int values
+    try:
+      return _INSTRUCTIONS[(cmd, 0 if data_value is None else data_value)]
+    except (KeyError, TypeError):
+      return cls._intern(cmd, data_value)
+
+  @classmethod
+  def _intern(cls, cmd: int, data_value: Optional[int]) -> 'Instruction':
+    value = int(_validated_value(data_value))
+    if cmd not in range(_COMMAND_TABLE_SIZE):
+      raise ValueError(
+        f'Command ids are between 0 and {_COMMAND_TABLE_SIZE - 1}, inclusive. '
+        f'Received: {cmd}'
+      )
+    cmd_id = int(cmd)
+
+    instruction = object.__new__(cls)
+    object.__setattr__(instruction, '_command', _COMMANDS_BY_ID[cmd_id])
+    object.__setattr__(instruction, '_id', cmd_id)
+    object.__setattr__(instruction, '_data_value', value)
+    object.__setattr__(
+      instruction,
+      '_frame_bytes',
+      bytes((0xAA, 0xBB, 0x03, cmd_id, value, 0xEE))
+    )
+    # Another thread may have interned the same instruction first
+    instruction = _INSTRUCTIONS.setdefault((cmd_id, value), instruction)
+    _INSTRUCTIONS_BY_FRAME.setdefault(instruction._frame_bytes, instruction)
+    return instruction
 
-    self._data_value = _validated_value(data_value)
-    
   @property
   def id(self) -> int:
-    if self._command is not None:
-      return self._command.value
-    else:
-      return self._unsupported_command_id
+    return self._id
 
   @property
   def name(self) -> str:
@@ -89,14 +175,24 @@ class Instruction:
 
   @property
   def frame(self) -> list[int]:
-    return [
-      0xAA,
-      0xBB,
-      0x03,
-      self.id,
-      self.data_value,
-      0xEE
-    ]
+    return list(self._frame_bytes)
+
+  @property
+  def frame_bytes(self) -> bytes:
+    """
+    The encoded frame, as sent over the wire
+    """
+    return self._frame_bytes
+
+  def __setattr__(self, name: str, value) -> None:
+    raise AttributeError('Instruction is immutable')
+
+  def __delattr__(self, name: str) -> None:
+    raise AttributeError('Instruction is immutable')
+
+  def __reduce__(self):
+    # Unpickling and copying go through the intern table
+    return (Instruction, (self._id, self._data_value))
 
   def __str__(self) -> str:
     return (
@@ -109,9 +205,21 @@ class Instruction:
     )
 
   def __eq__(self, other):
+    if self is other:
+      return True
     if not isinstance(other, Instruction):
       return NotImplemented
-    return self.frame == other.frame
+    return self._frame_bytes == other._frame_bytes
+
+  def __hash__(self) -> int:
+    return hash(self._frame_bytes)
+
+# Intern every value of every supported command up-front; others are interned on
+# first use
+for _command in Command:
+  for _value in _VALID_RANGE:
+    Instruction(_command, _value)
+del _command, _value
 
 class Codec:
   """
@@ -120,44 +228,244 @@ class Codec:
 
   @classmethod
   def encode(cls, instruction: Instruction) -> bytes:
-    msg = cls._encode_message(instruction)
-    data = bytes(msg)
-    return data
-  
+    return instruction.frame_bytes
+
   @classmethod
   def decode(cls, data: bytes) -> Instruction:
+    if type(data) is bytes:
+      instruction = _INSTRUCTIONS_BY_FRAME.get(data)
+      if instruction is not None:
+        return instruction
     frame = cls._decode_message(data)
     cmd = Instruction(*frame)
     return cmd
 
   @classmethod
-  def _encode_message(cls, instruction: Instruction) -> list[int]:
-    return instruction.frame
-  
+  def encode_many(cls, instructions: Iterable[Instruction]) -> bytes:
+    """
+    Encode instructions into one contiguous buffer
+    """
+    return b''.join([instruction.frame_bytes for instruction in instructions])
+
+  @classmethod
+  def decode_many(cls, data: bytes | bytearray | memoryview) -> 'DecodedFrames':
+    """
+    Decode every frame in a buffer, such as a capture of device traffic.
+
+    Bytes that are not part of a valid frame are skipped, as `FrameDecoder` does.
+    Uses NumPy, when installed, to check framing across the whole buffer at once.
+
+    Args:
+      data (bytes | bytearray | memoryview): Buffer to decode; anything supporting
+        the buffer protocol, including `mmap`, is accepted.
+
+    Returns:
+      DecodedFrames: Command ids, data values and offsets of the frames found.
+    """
+    if numpy is not None:
+      return cls._decode_many_vectorized(data)
+    return cls._decode_many_scanned(data)
+
   @classmethod
   def _decode_message(cls, data: bytes) -> list[int]:
     _, _, _, cmd_id, data_value, _ = [byte for byte in data]
     return [cmd_id, data_value]
 
+  @classmethod
+  def _decode_many_vectorized(cls, data) -> 'DecodedFrames':
+    buffer = numpy.frombuffer(data, dtype = numpy.uint8)
+    candidate_count = len(buffer) - Instruction.SIZE_BYTES + 1
+    if candidate_count <= 0:
+      offsets = numpy.empty(0, dtype = numpy.intp)
+    else:
+      # Frames can never overlap, so every position can be checked independently
+      is_frame = (
+        (buffer[:candidate_count] == 0xAA) &
+        (buffer[1:candidate_count + 1] == 0xBB) &
+        (buffer[2:candidate_count + 2] == 0x03) &
+        (buffer[4:candidate_count + 4] <= _VALUE_MAX - 1) &
+        (buffer[5:candidate_count + 5] == 0xEE)
+      )
+      offsets = numpy.flatnonzero(is_frame)
+    return DecodedFrames(buffer[offsets + 3], buffer[offsets + 4], offsets)
+
+  @classmethod
+  def _decode_many_scanned(cls, data) -> 'DecodedFrames':
+    command_ids = array('B')
+    data_values = array('B')
+    offsets = array('q')
+    for match in _FRAME_PATTERN.finditer(data):
+      offsets.append(match.start())
+      command_ids.append(match[1][0])
+      data_values.append(match[2][0])
+    return DecodedFrames(command_ids, data_values, offsets)
+
+# Matches a complete frame, capturing its command id and (valid) data value
+_FRAME_PATTERN = re.compile(
+  rb'\xAA\xBB\x03(.)([\x00-\xFE])\xEE',
+  re.DOTALL
+)
+
+class DecodedFrames:
+  """
+  Frames decoded by `Codec.decode_many`, as parallel columns in stream order.
+
+  Columns are NumPy arrays when NumPy is installed, otherwise `array.array`.
+  """
+
+  def __init__(self, command_ids, data_values, offsets):
+    self._command_ids = command_ids
+    self._data_values = data_values
+    self._offsets = offsets
+
+  @property
+  def command_ids(self):
+    return self._command_ids
+
+  @property
+  def data_values(self):
+    return self._data_values
+
+  @property
+  def offsets(self):
+    """
+    Byte offset of each frame within the decoded buffer
+    """
+    return self._offsets
+
+  def instructions(self) -> list[Instruction]:
+    return [
+      Instruction(cmd_id, data_value)
+      for cmd_id, data_value
+      in zip(self._command_ids.tolist(), self._data_values.tolist())
+    ]
+
+  def __len__(self) -> int:
+    return len(self._offsets)
+
+class FrameDecoder:
+  """
+  Incrementally decodes Instructions from a stream of bytes.
+
+  Chunks may contain any number of frames, partial frames, or garbage; incomplete
+  frames are buffered until the rest arrives, and corrupt data is skipped by
+  scanning ahead for the next frame header. Chunks may be `memoryview` slices of
+  a reusable receive buffer, so no intermediate `bytes` are needed per read.
+  """
+  _HEADER: bytes = b'\xAA\xBB\x03'
+  _FOOTER: int = 0xEE
+  # Bytes from the end of the header that could begin a frame split across chunks
+  _MAX_PARTIAL_HEADER: int = len(_HEADER) - 1
+
+  def __init__(self):
+    self._buffer = bytearray()
+    self._discarded_byte_count = 0
+
+  @property
+  def pending_byte_count(self) -> int:
+    """
+    Number of buffered bytes awaiting the rest of their frame
+    """
+    return len(self._buffer)
+
+  @property
+  def discarded_byte_count(self) -> int:
+    """
+    Total number of bytes skipped as unrecognizable
+    """
+    return self._discarded_byte_count
+
+  def feed(self, data: bytes | bytearray | memoryview) -> list[Instruction]:
+    """
+    Add bytes to the stream, returning any Instructions they complete
+    """
+    buffer = self._buffer
+    buffer += data
+    instructions: list[Instruction] = []
+    size = len(buffer)
+    position = 0
+    while True:
+      start = buffer.find(self._HEADER, position)
+      if start < 0:
+        # Retain a trailing partial header, which the next chunk may complete
+        keep_from = max(position, size - self._MAX_PARTIAL_HEADER)
+        while keep_from < size and not self._HEADER.startswith(buffer[keep_from:]):
+          keep_from += 1
+        self._discard(keep_from - position)
+        position = keep_from
+        break
+      if start + Instruction.SIZE_BYTES > size:
+        self._discard(start - position)
+        position = start
+        break
+      instruction = self._decode_frame(buffer, start)
+      if instruction is None:
+        # Not a frame after all; resume scanning just past this header
+        self._discard(start + 1 - position)
+        position = start + 1
+      else:
+        instructions.append(instruction)
+        self._discard(start - position)
+        position = start + Instruction.SIZE_BYTES
+    del buffer[:position]
+    return instructions
+
+  def reset(self) -> None:
+    """
+    Drop any buffered partial frame, e.g., after reconnecting
+    """
+    self._buffer.clear()
+
+  def _decode_frame(self, buffer: bytearray, start: int) -> Optional[Instruction]:
+    if buffer[start + Instruction.SIZE_BYTES - 1] != self._FOOTER:
+      return None
+    try:
+      return Instruction(buffer[start + 3], buffer[start + 4])
+    except ValueError:
+      return None
+
+  def _discard(self, byte_count: int) -> None:
+    if byte_count > 0:
+      LOGGER.debug('Discarding %d unrecognized bytes', byte_count)
+      self._discarded_byte_count += byte_count
+
 class TcpEndpoint:
   """
   Hex Protocol TCP endpoint location details
   """
   DEFAULT_PORT: int = 5000
   DEFAULT_TIMEOUT_SEC: float = 0.250
+  DEFAULT_CONNECT_TIMEOUT_SEC: float = 1.0
 
   def __init__(
       self,
       host: str,
       port: Optional[int] = None,
-      timeout_sec: Optional[float] = DEFAULT_TIMEOUT_SEC
+      timeout_sec: Optional[float] = DEFAULT_TIMEOUT_SEC,
+      connect_timeout_sec: Optional[float] = DEFAULT_CONNECT_TIMEOUT_SEC,
+      resolver: Optional[ResolverCache] = None
     ):
+    """
+    Args:
+      host (str): Device host name or address.
+      port (Optional[int]): Device port. Default: `DEFAULT_PORT`.
+      timeout_sec (Optional[float]): Timeout for each read from the device. None
+        waits indefinitely.
+      connect_timeout_sec (Optional[float]): Timeout for connecting to the device,
+        which is slower to fail than reads when it is offline. None waits for the
+        operating system to give up.
+      resolver (Optional[ResolverCache]): Caches resolution of `host` and races
+        its addresses when connecting. Default: None, which resolves `host` on
+        every connection.
+    """
     self._host = host
     if port is None:
       self._port = TcpEndpoint.DEFAULT_PORT
     else:
       self._port = port
     self._timeout_sec = timeout_sec
+    self._connect_timeout_sec = connect_timeout_sec
+    self._resolver = resolver
 
   @property
   def host(self) -> str:
@@ -171,16 +479,209 @@ class TcpEndpoint:
   def timeout_sec(self) -> Optional[float]:
     return self._timeout_sec
 
+  @property
+  def connect_timeout_sec(self) -> Optional[float]:
+    return self._connect_timeout_sec
+
+  @property
+  def resolver(self) -> Optional[ResolverCache]:
+    return self._resolver
+
+  def create_connection(self) -> socket.socket:
+    """
+    Connect to the endpoint, within the connect timeout
+    """
+    if self._resolver is not None:
+      return self._resolver.connect(self._host, self._port, self._connect_timeout_sec)
+    return socket.create_connection((self._host, self._port), self._connect_timeout_sec)
+
+class _Connection:
+  """
+  Open socket to a device, along with the decoding state for the bytes it receives
+  """
+  # Room for a reply plus any unsolicited frames that arrived alongside it
+  RECV_BUFFER_SIZE: int = 256
+
+  def __init__(self, sock: socket.socket, recorder: Optional['CaptureRecorder'] = None):
+    self.sock = sock
+    self._recorder = recorder
+    self._decoder = FrameDecoder()
+    self._recv_buffer = memoryview(bytearray(_Connection.RECV_BUFFER_SIZE))
+    self.received_byte_count = 0
+
+  def send(self, data: bytes) -> None:
+    self.sock.sendall(data)
+    if self._recorder is not None:
+      self._recorder.record_sent(data)
+
+  def receive(self, responses: list[Instruction], count: int) -> None:
+    """
+    Read until `responses` holds at least `count` Instructions, or the device
+    closes the connection, which is recorded as a NULL_RESPONSE.
+
+    Raises:
+      TimeoutError: The device stopped sending before enough were received.
+    """
+    while len(responses) < count:
+      if not self._read(responses):
+        return
+
+  def receive_until(self, responses: list[Instruction], command: Command, count: int = 1) -> None:
+    """
+    Read until `responses` holds `count` Instructions for `command`, or the device
+    closes the connection, which is recorded as a NULL_RESPONSE.
+
+    Raises:
+      TimeoutError: The device stopped sending before enough were received.
+    """
+    found = 0
+    checked = 0
+    while True:
+      found += sum(1 for response in responses[checked:] if response.id == command)
+      checked = len(responses)
+      if found >= count or not self._read(responses):
+        return
+
+  def receive_pending(self, responses: list[Instruction]) -> bool:
+    """
+    Add any Instructions that have already arrived, without waiting for more.
+    Returns False if the device closed the connection, which is recorded as a
+    NULL_RESPONSE.
+    """
+    timeout = self.sock.gettimeout()
+    self.sock.setblocking(False)
+    try:
+      while self._read(responses):
+        pass
+      return False
+    except (BlockingIOError, TimeoutError):
+      return True
+    finally:
+      self.sock.settimeout(timeout)
+
+  def _read(self, responses: list[Instruction]) -> bool:
+    """
+    Read once, adding the Instructions completed, or return False if the device
+    closed the connection
+    """
+    byte_count = self.sock.recv_into(self._recv_buffer)
+    self.received_byte_count += byte_count
+    if self._recorder is not None:
+      self._recorder.record_received(self._recv_buffer[:byte_count])
+    if byte_count == 0:
+      responses.append(Instruction(Command.NULL_RESPONSE))
+      return False
+    responses.extend(self._decoder.feed(self._recv_buffer[:byte_count]))
+    return True
+
+  def close(self) -> None:
+    self.sock.close()
+
 class TcpDevice:
   """
   Manages TCP I/O for a specific Hex Protocol-based device
   """
+  # Idle period after which a persistent connection is re-established rather than
+  # reused, since the device silently drops connections it considers stale.
+  DEFAULT_IDLE_TIMEOUT_SEC: float = 30.0
+  # Idle period after which TCP keepalive probes are sent on persistent connections
+  DEFAULT_KEEPALIVE_SEC: float = 10.0
 
   def __init__(
       self,
       endpoint: TcpEndpoint,
+      persistent: bool = False,
+      idle_timeout_sec: Optional[float] = DEFAULT_IDLE_TIMEOUT_SEC,
+      keepalive_sec: Optional[float] = DEFAULT_KEEPALIVE_SEC,
+      response_policies: Optional[dict[Command, ResponsePolicy]] = None,
+      pipelined: bool = False,
+      observer: Optional[DeviceObserver] = None,
+      recorder: Optional['CaptureRecorder'] = None,
+      circuit_breaker: Optional[CircuitBreaker] = None,
+      fenced: bool = False,
+      rtt_estimator: Optional[RttEstimator] = None,
     ):
+    """
+    Args:
+      endpoint (TcpEndpoint): Location of the device.
+      persistent (bool): Keep the connection open between calls to `process`,
+        rather than connecting for each call. Default: False.
+      idle_timeout_sec (Optional[float]): When persistent, reconnect if the
+        connection has been unused for longer than this. None disables.
+      keepalive_sec (Optional[float]): When persistent, enable TCP keepalive probes
+        after this many idle seconds. None disables.
+      response_policies (Optional[dict[Command, ResponsePolicy]]): Overrides for
+        `DEFAULT_RESPONSE_POLICIES`, used to skip waiting for replies the device
+        never sends.
+      pipelined (bool): Send all instructions passed to `process` at once and then
+        read the replies, rather than waiting for each reply before sending the
+        next instruction. Default: False.
+      observer (Optional[DeviceObserver]): Notified of connect times, round-trip
+        times, timeouts, traffic and errors, e.g., a `HistogramCollector`.
+      recorder (Optional[CaptureRecorder]): Records all bytes exchanged with the
+        device, for replay with `ReplayDevice`.
+      circuit_breaker (Optional[CircuitBreaker]): Fails `process` fast with
+        `CircuitOpenError` while the device keeps failing, rather than waiting
+        out connection timeouts each time, e.g., `CircuitBreaker.for_endpoint`.
+      fenced (bool): Follow each command that only sometimes replies with a
+        `QUERY_ACTIVE_INPUT`, and read until its reply arrives, rather than
+        waiting out the timeout in case the command replies. Bounds such
+        commands to one round trip, and returns the active input after them.
+        Applies to instructions sent one at a time. Default: False.
+      rtt_estimator (Optional[RttEstimator]): Sets the timeout for each reply
+        from the round-trip times measured, in place of the endpoint's fixed
+        timeout, e.g., `RttEstimator.for_endpoint`.
+    """
     self._endpoint = endpoint
+    self._persistent = persistent
+    self._idle_timeout_sec = idle_timeout_sec
+    self._keepalive_sec = keepalive_sec
+    self._response_policies = ResponsePolicies(response_policies)
+    self._pipelined = pipelined
+    # Default does nothing, sparing every event site a None check
+    self._observer = observer or _NULL_OBSERVER
+    self._recorder = recorder
+    self._circuit_breaker = circuit_breaker
+    self._fenced = fenced
+    self._rtt_estimator = rtt_estimator
+
+    self._lock = threading.Lock()
+    self._conn: Optional[_Connection] = None
+    self._conn_last_used = 0.0
+
+  @property
+  def endpoint(self) -> TcpEndpoint:
+    return self._endpoint
+
+  @property
+  def persistent(self) -> bool:
+    return self._persistent
+
+  @property
+  def response_policies(self) -> ResponsePolicies:
+    return self._response_policies
+
+  @property
+  def pipelined(self) -> bool:
+    return self._pipelined
+
+  @property
+  def fenced(self) -> bool:
+    return self._fenced
+
+  @property
+  def rtt_estimator(self) -> Optional[RttEstimator]:
+    return self._rtt_estimator
+
+  @property
+  def circuit_breaker(self) -> Optional[CircuitBreaker]:
+    return self._circuit_breaker
+
+  @property
+  def observer(self) -> Optional[DeviceObserver]:
+    if self._observer is _NULL_OBSERVER:
+      return None
+    return self._observer
 
   def process(self, instructions: list[Instruction] | Instruction) -> list[Instruction]:
     try:
@@ -188,61 +689,371 @@ class TcpDevice:
     except TypeError:
       # Single instruction provided; wrap it.
       instructions = [instructions]
+
+    if self._circuit_breaker is not None:
+      self._circuit_breaker.check()
+
+    if self._persistent:
+      with self._lock:
+        results = self._process_persistent(instructions)
+    else:
+      results = self._process_transient(instructions)
+
+    # Results is a list of lists, so flatten before returning
+    flat_results = list(itertools.chain.from_iterable(results))
+    return flat_results
+
+  def close(self) -> None:
+    """
+    Close the persistent connection, if one is open
+    """
+    with self._lock:
+      self._close_connection()
+    if self._recorder is not None:
+      self._recorder.close()
+
+  def __enter__(self) -> 'TcpDevice':
+    return self
+
+  def __exit__(self, *_) -> None:
+    self.close()
+
+  def _process_transient(self, instructions: list[Instruction]) -> list[list[Instruction]]:
     results = []
 
-    conn = self._create_connection()
+    conn = self._open_connection()
     try:
-      for instruction in instructions:
-        result = self._execute_instruction(instruction, conn)
-        results.append(result)
+      self._exchange(instructions, conn, results)
     except Exception as ex:
       LOGGER.error('Failed communicating with device: %s', ex)
+      # Marked as the device closing the connection would be, so callers know
+      # later instructions may not have been sent
+      results.append([Instruction(Command.NULL_RESPONSE)])
     finally:
       conn.close()
 
-    # Results is a list of lists, so flatten before returning
-    flat_results = list(itertools.chain.from_iterable(results))
-    return flat_results
-  
+    return results
+
+  def _process_persistent(self, instructions: list[Instruction]) -> list[list[Instruction]]:
+    results = []
+
+    # Anything the device sent while the connection sat idle, such as a front
+    # panel change or a reply that arrived after its timeout, is returned ahead
+    # of the replies to these instructions rather than taken for one of them.
+    unsolicited: list[Instruction] = []
+    reused = self._conn is not None and \
+      self._is_connection_reusable(self._conn, unsolicited)
+    if not reused:
+      self._close_connection()
+      self._conn = self._open_connection()
+
+    try:
+      try:
+        self._exchange(instructions, self._conn, results)
+      except OSError as ex:
+        if not reused:
+          raise
+        # The device dropped a previously-working connection; retry the unfinished
+        # instructions once on a fresh one.
+        LOGGER.info('Connection to device lost, reconnecting: %s', ex)
+        self._close_connection()
+        self._conn = self._open_connection()
+        self._exchange(instructions[len(results):], self._conn, results)
+      self._conn_last_used = time.monotonic()
+    except Exception as ex:
+      LOGGER.error('Failed communicating with device: %s', ex)
+      self._close_connection()
+      # See `_process_transient`
+      results.append([Instruction(Command.NULL_RESPONSE)])
+
+    if len(unsolicited) > 0:
+      results.insert(0, unsolicited)
+    return results
+
+  def _exchange(
+      self,
+      instructions: list[Instruction],
+      conn: _Connection,
+      results: list[list[Instruction]]
+    ) -> None:
+    """
+    Execute instructions, appending each one's responses to `results` as they
+    complete
+    """
+    completed_before = len(results)
+    try:
+      if self._pipelined and len(instructions) > 1:
+        results.extend(self._execute_pipelined(instructions, conn))
+      else:
+        for instruction in instructions:
+          results.append(self._execute_instruction(instruction, conn))
+    except Exception as ex:
+      in_flight = instructions[len(results) - completed_before]
+      self._observer.on_error(self._endpoint, in_flight, ex)
+      if self._circuit_breaker is not None:
+        self._circuit_breaker.record_failure()
+      raise
+    if self._circuit_breaker is not None:
+      self._circuit_breaker.record_success()
+
+  def _open_connection(self) -> _Connection:
+    started = time.perf_counter()
+    try:
+      sock = self._create_connection()
+    except Exception as ex:
+      self._observer.on_error(self._endpoint, None, ex)
+      if self._circuit_breaker is not None:
+        self._circuit_breaker.record_failure()
+      raise
+    self._observer.on_connect(self._endpoint, time.perf_counter() - started)
+    if self._recorder is not None:
+      self._recorder.record_connected(self._endpoint)
+    return _Connection(sock, self._recorder)
+
   def _create_connection(self) -> socket.socket:
-    conn = socket.create_connection(
-      (self._endpoint.host, self._endpoint.port)
-    )
+    conn = self._endpoint.create_connection()
     conn.settimeout(self._endpoint.timeout_sec)
+    if self._persistent and self._keepalive_sec is not None:
+      self._enable_keepalive(conn)
     return conn
-  
+
+  def _enable_keepalive(self, conn: socket.socket) -> None:
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    interval = max(1, int(self._keepalive_sec))
+    # Tuning options are platform-specific; fall back to OS defaults without them.
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+      conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, interval)
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+      conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+
+  def _close_connection(self) -> None:
+    if self._conn is not None:
+      try:
+        self._conn.close()
+      except OSError as ex:
+        LOGGER.debug('Failed closing connection: %s', ex)
+      self._conn = None
+
+  def _is_connection_reusable(self, conn: _Connection, unsolicited: list[Instruction]) -> bool:
+    """
+    Check whether an idle connection can be reused, adding anything the device
+    sent while it was idle to `unsolicited`
+    """
+    if self._idle_timeout_sec is not None:
+      idle_sec = time.monotonic() - self._conn_last_used
+      if idle_sec > self._idle_timeout_sec:
+        LOGGER.debug('Connection idle for %.1fs, reconnecting', idle_sec)
+        return False
+
+    # Peek without blocking: no data means the connection is open and quiet, while
+    # an empty read means the device half-closed it.
+    timeout = conn.sock.gettimeout()
+    conn.sock.setblocking(False)
+    try:
+      data = conn.sock.recv(1, socket.MSG_PEEK)
+    except BlockingIOError:
+      return True
+    except OSError:
+      return False
+    finally:
+      conn.sock.settimeout(timeout)
+    if data == b'':
+      return False
+
+    received: list[Instruction] = []
+    try:
+      is_open = conn.receive_pending(received)
+    except OSError:
+      return False
+    if not is_open:
+      # Frames sent just before hanging up still reflect the device's state
+      received.pop()
+    LOGGER.debug('Received %d instructions while idle: %s', len(received), received)
+    unsolicited.extend(received)
+    return is_open
+
   def _execute_instruction(
       self,
       instruction: Instruction,
-      conn: socket.socket
+      conn: _Connection
     ) -> list[Instruction]:
-    req_bytes = Codec.encode(instruction)
-    conn.send(req_bytes)
+    received_before = conn.received_byte_count
+    started = time.perf_counter()
+    policy = self._response_policies.policy_for(instruction)
+    fenced = self._fenced and policy == ResponsePolicy.SOMETIMES_REPLIES
+    if fenced:
+      data = Codec.encode(instruction) + Codec.encode(_FENCE)
+    else:
+      data = Codec.encode(instruction)
+    awaits_reply = fenced or policy != ResponsePolicy.NEVER_REPLIES
+    if awaits_reply and self._rtt_estimator is not None:
+      conn.sock.settimeout(self._rtt_estimator.timeout_sec)
+    conn.send(data)
 
     # Device either returns a single instruction specifying the selected input
     # or no response at all.
     result: list[Instruction] = []
-    chunks: list[bytes] = []
-    bytes_received = 0
+    timed_out = False
+    rtt_sec: Optional[float] = None
+    if fenced:
+      try:
+        rtt_sec = self._receive_through_fence(conn, result, started)
+      except TimeoutError:
+        timed_out = True
+        LOGGER.warning('Timed out waiting for fence reply after %s', instruction)
+    elif policy != ResponsePolicy.NEVER_REPLIES:
+      try:
+        conn.receive(result, 1)
+      except TimeoutError:
+        timed_out = True
+        _log_response_timeout(instruction, policy)
+
+    elapsed_sec = time.perf_counter() - started
+    if awaits_reply and self._rtt_estimator is not None:
+      if timed_out:
+        if fenced or policy == ResponsePolicy.EXPECTS_REPLY:
+          self._rtt_estimator.record_timeout()
+      elif len(result) > 0 and result[0].id != Command.NULL_RESPONSE:
+        self._rtt_estimator.record_rtt(elapsed_sec if rtt_sec is None else rtt_sec)
+
+    self._observer.on_exchange(
+      self._endpoint,
+      instruction,
+      elapsed_sec,
+      len(data),
+      conn.received_byte_count - received_before,
+      timed_out
+    )
+    return result
+
+  def _receive_through_fence(
+      self,
+      conn: _Connection,
+      result: list[Instruction],
+      started: float
+    ) -> float:
+    """
+    Read the replies to a fenced instruction, which end with the fence's.
+
+    The fence and the instruction may both reply with the active input, so after
+    the first such reply, a second is waited for briefly: for twice as long as the
+    first took, as the fence was sent alongside the instruction. Leaving the
+    fence's reply unread would have it taken as the reply to the next instruction
+    on a persistent connection. Either way, the replies report the active input
+    after the instruction.
+
+    Returns:
+      float: Seconds from `started` until the first reply arrived.
+    """
+    conn.receive_until(result, Command.CURRENT_ACTIVE_INPUT)
+    first_reply_sec = time.perf_counter() - started
+    if len(result) == 0 or result[-1].id == Command.NULL_RESPONSE:
+      return first_reply_sec
+    if not conn.receive_pending(result):
+      return first_reply_sec
+
+    timeout = conn.sock.gettimeout()
+    settle_sec = max(_FENCE_SETTLE_MIN_SEC, 2 * first_reply_sec)
+    if timeout is not None:
+      settle_sec = min(settle_sec, timeout)
+    conn.sock.settimeout(settle_sec)
+    try:
+      conn.receive_until(result, Command.CURRENT_ACTIVE_INPUT, count = 2)
+    except TimeoutError:
+      # The instruction went unanswered, so the only reply was the fence's
+      pass
+    finally:
+      conn.sock.settimeout(timeout)
+    return first_reply_sec
+
+  def _execute_pipelined(
+      self,
+      instructions: list[Instruction],
+      conn: _Connection
+    ) -> list[list[Instruction]]:
+    started = time.perf_counter()
+    if self._rtt_estimator is not None:
+      conn.sock.settimeout(self._rtt_estimator.timeout_sec)
+    conn.send(Codec.encode_many(instructions))
+
+    policies = [self._response_policies.policy_for(instruction) for instruction in instructions]
+    min_replies = policies.count(ResponsePolicy.EXPECTS_REPLY)
+    max_replies = min_replies + policies.count(ResponsePolicy.SOMETIMES_REPLIES)
+
+    # Read until every possible reply has arrived or, when some commands only
+    # sometimes reply, until the device goes quiet.
+    responses: list[Instruction] = []
     try:
-      while bytes_received < Instruction.SIZE_BYTES:
-        chunk = conn.recv(min(Instruction.SIZE_BYTES - bytes_received, Instruction.SIZE_BYTES))
-        if chunk == b'':
-          instruction = Instruction(Command.NULL_RESPONSE)
-          result.append(instruction)
-          break
-        else:
-          chunks.append(chunk)
-          bytes_received = bytes_received + len(chunk)
-
-      if bytes_received == Instruction.SIZE_BYTES:
-        resp_bytes = b''.join(chunks)
-        instruction = Codec.decode(resp_bytes)
-        result.append(instruction)
+      conn.receive(responses, max_replies)
     except TimeoutError:
-      LOGGER.info(
-        'Timed out waiting for response. Ignoring, since device does not always send '
-        'a response.'
+      if len(responses) < min_replies:
+        if self._rtt_estimator is not None:
+          self._rtt_estimator.record_timeout()
+        LOGGER.warning(
+          'Timed out waiting for responses; received %d of %d expected',
+          len(responses),
+          min_replies
+        )
+      else:
+        LOGGER.info(
+          'Timed out waiting for response. Ignoring, since device does not always send '
+          'a response.'
+        )
+
+    results = _demultiplex(policies, responses)
+    elapsed_sec = time.perf_counter() - started
+    for instruction, policy, result in zip(instructions, policies, results):
+      self._observer.on_exchange(
+        self._endpoint,
+        instruction,
+        elapsed_sec,
+        Instruction.SIZE_BYTES,
+        Instruction.SIZE_BYTES * len(result),
+        policy == ResponsePolicy.EXPECTS_REPLY and len(result) == 0
       )
+    return results
 
-    return result
+_NULL_OBSERVER = DeviceObserver()
+
+# Sent after fenced instructions; its reply marks the end of theirs
+_FENCE = Instruction(Command.QUERY_ACTIVE_INPUT)
+# Shortest wait for the fence's reply once a first reply has arrived
+_FENCE_SETTLE_MIN_SEC = 0.02
+
+def _demultiplex(
+    policies: list[ResponsePolicy],
+    responses: list[Instruction]
+  ) -> list[list[Instruction]]:
+  """
+  Attribute responses, in arrival order, to the instructions that produced them.
+
+  Instructions that always reply claim a response each. Those that only sometimes
+  reply claim one only when more responses remain than are needed by the
+  instructions still to come that always reply.
+  """
+  results: list[list[Instruction]] = []
+  remaining = list(responses)
+  expected_after = policies.count(ResponsePolicy.EXPECTS_REPLY)
+  for policy in policies:
+    result: list[Instruction] = []
+    if policy == ResponsePolicy.EXPECTS_REPLY:
+      expected_after -= 1
+      if len(remaining) > 0:
+        result.append(remaining.pop(0))
+    elif policy == ResponsePolicy.SOMETIMES_REPLIES:
+      if len(remaining) > expected_after:
+        result.append(remaining.pop(0))
+    results.append(result)
+  # Anything unattributed (e.g., unsolicited frames) belongs to the last instruction
+  if len(remaining) > 0 and len(results) > 0:
+    results[-1].extend(remaining)
+  return results
+
+def _log_response_timeout(instruction: Instruction, policy: ResponsePolicy) -> None:
+  if policy == ResponsePolicy.EXPECTS_REPLY:
+    LOGGER.warning('Timed out waiting for response to %s', instruction)
+  else:
+    LOGGER.info(
+      'Timed out waiting for response. Ignoring, since device does not always send '
+      'a response.'
+    )
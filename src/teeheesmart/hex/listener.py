@@ -0,0 +1,167 @@
+import asyncio
+import socket
+import threading
+
+from ..constants import LOGGER
+from .io import FrameDecoder, Instruction, TcpEndpoint
+from typing import Callable, Optional
+
+# Receives the Instructions decoded from each chunk the device sends
+InstructionHandler = Callable[[list[Instruction]], None]
+
+class DeviceListener:
+  """
+  Holds a dedicated connection open to a device and reports the frames it sends
+  unprompted, such as the active input changing via the front panel.
+
+  Frames are read on a background thread, which reconnects whenever the
+  connection drops until `stop` is called.
+  """
+  DEFAULT_RECONNECT_DELAY_SEC: float = 1.0
+  # How often the background thread checks whether it has been stopped
+  POLL_INTERVAL_SEC: float = 0.5
+  RECV_BUFFER_SIZE: int = 256
+
+  def __init__(
+      self,
+      endpoint: TcpEndpoint,
+      on_instructions: InstructionHandler,
+      reconnect_delay_sec: float = DEFAULT_RECONNECT_DELAY_SEC
+    ):
+    self._endpoint = endpoint
+    self._on_instructions = on_instructions
+    self._reconnect_delay_sec = reconnect_delay_sec
+
+    self._stopped = threading.Event()
+    self._thread: Optional[threading.Thread] = None
+    self._conn: Optional[socket.socket] = None
+
+  @property
+  def is_running(self) -> bool:
+    return self._thread is not None and self._thread.is_alive()
+
+  def start(self) -> None:
+    if self.is_running:
+      return
+    self._stopped.clear()
+    self._thread = threading.Thread(
+      target = self._run,
+      name = f'teeheesmart-listener-{self._endpoint.host}:{self._endpoint.port}',
+      daemon = True,
+    )
+    self._thread.start()
+
+  def stop(self, timeout_sec: Optional[float] = None) -> None:
+    self._stopped.set()
+    conn = self._conn
+    if conn is not None:
+      # Wake the background thread from its read, rather than waiting it out
+      try:
+        conn.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
+    if self._thread is not None:
+      self._thread.join(timeout_sec)
+      self._thread = None
+
+  def _run(self) -> None:
+    while not self._stopped.is_set():
+      try:
+        self._listen()
+      except OSError as ex:
+        LOGGER.info('Listener connection to device failed: %s', ex)
+      # Back off before reconnecting, unless stopping
+      self._stopped.wait(self._reconnect_delay_sec)
+
+  def _listen(self) -> None:
+    decoder = FrameDecoder()
+    recv_buffer = memoryview(bytearray(DeviceListener.RECV_BUFFER_SIZE))
+    with self._endpoint.create_connection() as conn:
+      conn.settimeout(DeviceListener.POLL_INTERVAL_SEC)
+      self._conn = conn
+      try:
+        while not self._stopped.is_set():
+          try:
+            byte_count = conn.recv_into(recv_buffer)
+          except TimeoutError:
+            continue
+          if byte_count == 0:
+            if not self._stopped.is_set():
+              LOGGER.info('Device closed listener connection')
+            return
+          self._dispatch(decoder.feed(recv_buffer[:byte_count]))
+      finally:
+        self._conn = None
+
+  def _dispatch(self, instructions: list[Instruction]) -> None:
+    if len(instructions) == 0:
+      return
+    try:
+      self._on_instructions(instructions)
+    except Exception as ex:
+      LOGGER.error('Failed handling instructions from device: %s', ex)
+
+class AsyncDeviceListener:
+  """
+  asyncio counterpart of `DeviceListener`, reading frames in a task rather than a
+  thread
+  """
+
+  def __init__(
+      self,
+      endpoint: TcpEndpoint,
+      on_instructions: InstructionHandler,
+      reconnect_delay_sec: float = DeviceListener.DEFAULT_RECONNECT_DELAY_SEC
+    ):
+    self._endpoint = endpoint
+    self._on_instructions = on_instructions
+    self._reconnect_delay_sec = reconnect_delay_sec
+
+    self._task: Optional[asyncio.Task] = None
+
+  @property
+  def is_running(self) -> bool:
+    return self._task is not None and not self._task.done()
+
+  def start(self) -> None:
+    if self.is_running:
+      return
+    self._task = asyncio.get_running_loop().create_task(self._run())
+
+  async def stop(self) -> None:
+    if self._task is not None:
+      self._task.cancel()
+      try:
+        await self._task
+      except asyncio.CancelledError:
+        pass
+      self._task = None
+
+  async def _run(self) -> None:
+    while True:
+      try:
+        await self._listen()
+      except OSError as ex:
+        LOGGER.info('Listener connection to device failed: %s', ex)
+      await asyncio.sleep(self._reconnect_delay_sec)
+
+  async def _listen(self) -> None:
+    decoder = FrameDecoder()
+    reader, writer = await asyncio.wait_for(
+      asyncio.open_connection(self._endpoint.host, self._endpoint.port),
+      self._endpoint.connect_timeout_sec
+    )
+    try:
+      while True:
+        chunk = await reader.read(DeviceListener.RECV_BUFFER_SIZE)
+        if chunk == b'':
+          LOGGER.info('Device closed listener connection')
+          return
+        instructions = decoder.feed(chunk)
+        if len(instructions) > 0:
+          try:
+            self._on_instructions(instructions)
+          except Exception as ex:
+            LOGGER.error('Failed handling instructions from device: %s', ex)
+    finally:
+      writer.close()
@@ -1,108 +1,597 @@
+import contextlib
+import threading
+import time
+
+from concurrent.futures import Future
+from typing import Iterator, Optional
+
 from ..constants import LOGGER
-from ..media_switch import MediaSwitch as MediaSwitchProtocol
+from ..media_switch import \
+  AsyncMediaSwitch as AsyncMediaSwitchProtocol, \
+  MediaSwitch as MediaSwitchProtocol
+from .aio import AsyncTcpDevice
+from .cache_policy import CachePolicy
+from .coalescer import LastWriteWinsCoalescer
+from .desired_state import DesiredState
 from .io import Command, Instruction, TcpDevice
+from .listener import AsyncDeviceListener, DeviceListener
+from .multiplexer import MultiplexedDevice
+from .worker import DeviceWorker, Priority
 
 MAX_SUPPORTED_INPUTS = 16
 
-class MediaSwitch(MediaSwitchProtocol):
-  def __init__(self, device: TcpDevice):
-    self._device = device 
+class _MediaSwitchState:
+  """
+  Device state and instruction building shared by the blocking and asyncio
+  media switch implementations
+  """
+
+  def __init__(self, input_count: Optional[int] = None):
+    if input_count is not None and input_count not in range(1, MAX_SUPPORTED_INPUTS + 1):
+      raise ValueError(
+        f'Input count must be between 1 and {MAX_SUPPORTED_INPUTS}, inclusive. '
+        f'Received: {input_count}'
+      )
+    # Guards state updated from device responses, which may arrive on any thread
+    self._state_lock = threading.Lock()
     self._selected_source = 0
-    self._input_count = 0
+    # Monotonic time the selected source was last reported by the device
+    self._selected_source_updated_at: Optional[float] = None
+    # Zero until known, either declared up-front or probed from the device
+    self._input_count = input_count or 0
     self._output_count = 1 # Matrix switches not currently supported
-    self.update()
-    self._determine_input_count()
 
-  def select_source(self, input: int) -> None:
+  @property
+  def selected_source(self) -> int:
     """
-    Select the specified video input
+    Returns the input number of the selected source
+    """
+    return self._selected_source
+
+  @property
+  def selected_source_updated_at(self) -> Optional[float]:
+    """
+    Monotonic time the device last reported the selected source, or None if it
+    has not
+    """
+    return self._selected_source_updated_at
+
+  @property
+  def input_count(self) -> int:
+    """
+    The number of inputs the switch has
+    """
+    return self._input_count
+
+  @property
+  def output_count(self) -> int:
+    """
+    The number of outputs the switch has
     """
+    return self._output_count
+
+  def _select_source_instruction(self, input: int) -> Instruction:
     normalized_input = input
     if normalized_input < 1:
       normalized_input = 1
     elif self.input_count > 0 and normalized_input > self.input_count:
       normalized_input = self.input_count
+    return Instruction(Command.SWITCH_VIDEO, normalized_input)
+
+  def _buzzer_muting_instruction(self, mute_buzzer: bool) -> Instruction:
+    return Instruction(Command.MUTE_BUZZER, not mute_buzzer)
+
+  def _led_timeout_instruction(self, led_timeout_seconds: int) -> Instruction:
+    normalized_timeout = led_timeout_seconds
+    if normalized_timeout not in [0, 10, 30]:
+      normalized_timeout = 0
+    return Instruction(Command.LED_TIMEOUT_SECONDS, normalized_timeout)
 
-    instruction = Instruction(Command.SWITCH_VIDEO, normalized_input)
-    self._process(instruction)
+  def _auto_input_detection_instruction(self, enable_auto_input_detection: bool) -> Instruction:
+    return Instruction(Command.ENABLE_INPUT_DETECTION, enable_auto_input_detection)
+
+  def _update_from_instructions(self, instructions: list[Instruction]) -> None:
+    with self._state_lock:
+      for instruction in instructions:
+        match instruction.id:
+          case Command.CURRENT_ACTIVE_INPUT:
+            self._selected_source = instruction.data_value + 1
+            self._selected_source_updated_at = time.monotonic()
+          case _:
+            LOGGER.info('Discarded instruction: %s', instruction)
+
+  def _update_instructions(self) -> list[Instruction]:
+    return [
+      # Queries the currently selected input
+      Instruction(Command.QUERY_ACTIVE_INPUT)
+    ]
+
+class MediaSwitch(_MediaSwitchState, MediaSwitchProtocol):
+  def __init__(
+      self,
+      device: TcpDevice,
+      input_count: Optional[int] = None,
+      cache_policy: Optional[CachePolicy] = None,
+      select_source_window_sec: Optional[float] = None,
+      serialize: bool = False
+    ):
+    """
+    Args:
+      device (TcpDevice): Device to communicate with.
+      input_count (Optional[int]): Number of inputs the switch has, if known.
+        Default: None, which probes the device by selecting inputs until a valid
+        one is found.
+      cache_policy (Optional[CachePolicy]): How long state remains fresh, during
+        which `update` does not query the device. Default: None, which always
+        queries it.
+      select_source_window_sec (Optional[float]): Window, in seconds, within which
+        successive `select_source` calls are coalesced so only the last requested
+        input is sent. Default: None, which sends every call.
+      serialize (bool): Route all device I/O through the shared `DeviceWorker` for
+        the device's host and port, so commands from any thread or switch are
+        sent one at a time, with interactive commands ahead of polling. The
+        worker communicates using the device of the first switch to use it,
+        and closes that device once no switch uses it. Default: False.
+    """
+    super().__init__(input_count)
+    self._device = device
+    self._worker: Optional[DeviceWorker] = None
+    if serialize:
+      self._worker = DeviceWorker.for_device(device)
+    self._listener: Optional[DeviceListener] = None
+    self._cache_policy = cache_policy
+    self._refresh_lock = threading.Lock()
+    self._refresh_in_flight: Optional[threading.Event] = None
+    # Instructions recorded by the calling thread's open `batch`, if any
+    self._batch = threading.local()
+    # Settings last sent to the device, which it cannot be queried for; None
+    # until sent
+    self._buzzer_muted: Optional[bool] = None
+    self._led_timeout_seconds: Optional[int] = None
+    self._auto_input_detection: Optional[bool] = None
+    self._select_source_coalescer: Optional[LastWriteWinsCoalescer[Instruction]] = None
+    if select_source_window_sec is not None:
+      self._select_source_coalescer = LastWriteWinsCoalescer(
+        select_source_window_sec,
+        self._process_interactive
+      )
+    self.update(force = True)
+    if self._input_count == 0:
+      self._determine_input_count()
+
+  def select_source(self, input: int) -> None:
+    """
+    Select the specified video input.
+
+    If coalescing is configured, returns once the last input requested within
+    the window has been sent.
+    """
+    instruction = self._select_source_instruction(input)
+    if self._select_source_coalescer is None or self._is_batching():
+      self._process_interactive(instruction)
+    else:
+      self._select_source_coalescer.submit(instruction)
 
   def set_buzzer_muting(self, mute_buzzer: bool) -> None:
     """
     Enable or disable the buzzer
     """
-    instruction = Instruction(Command.MUTE_BUZZER, not mute_buzzer)
-    self._process(instruction)
+    self._process_interactive(self._buzzer_muting_instruction(mute_buzzer))
 
   def set_led_timeout_seconds(self, led_timeout_seconds: int) -> None:
     """
     Set the LED timeout
     """
-    normalized_timeout = led_timeout_seconds
-    if normalized_timeout not in [0, 10, 30]:
-      normalized_timeout = 0
-    instruction = Instruction(Command.LED_TIMEOUT_SECONDS, normalized_timeout)
-    self._process(instruction)
+    self._process_interactive(self._led_timeout_instruction(led_timeout_seconds))
 
   def set_auto_input_detection(self, enable_auto_input_detection: bool) -> None:
     """
     Enable or disable input auto-detection
     """
-    instruction = Instruction(Command.ENABLE_INPUT_DETECTION, enable_auto_input_detection)
-    self._process(instruction)
+    self._process_interactive(
+      self._auto_input_detection_instruction(enable_auto_input_detection)
+    )
 
-  def update(self) -> None:
-    self._process(self._update_instructions())
+  @property
+  def buzzer_muted(self) -> Optional[bool]:
+    """
+    Whether the buzzer was last muted, or None if not set since creation
+    """
+    return self._buzzer_muted
 
   @property
-  def selected_source(self) -> int:
+  def led_timeout_seconds(self) -> Optional[int]:
     """
-    Returns the input number of the selected source
+    The LED timeout last set, or None if not set since creation
     """
-    return self._selected_source
+    return self._led_timeout_seconds
 
   @property
-  def input_count(self) -> int:
+  def auto_input_detection(self) -> Optional[bool]:
     """
-    The number of inputs the switch has
+    Whether input auto-detection was last enabled, or None if not set since
+    creation
     """
-    return self._input_count
+    return self._auto_input_detection
+
+  def apply(self, desired_state: DesiredState, force_refresh: bool = False) -> list[Instruction]:
+    """
+    Bring the switch to the desired state, sending only the commands needed to
+    change it from its last-known state, together in one exchange.
+
+    Redundant commands are skipped, which also spares the display re-syncing
+    when the desired input is already selected.
+
+    Args:
+      desired_state (DesiredState): Settings to apply.
+      force_refresh (bool): Query the device's selected source before comparing,
+        and resend settings the device cannot be queried for, in case they were
+        changed by other means. Default: False.
+
+    Returns:
+      list[Instruction]: The instructions sent.
+    """
+    if force_refresh:
+      self.update(force = True)
+      with self._state_lock:
+        self._buzzer_muted = None
+        self._led_timeout_seconds = None
+        self._auto_input_detection = None
+
+    instructions: list[Instruction] = []
+    if desired_state.selected_source is not None:
+      instruction = self._select_source_instruction(desired_state.selected_source)
+      if instruction.data_value != self.selected_source:
+        instructions.append(instruction)
+    if desired_state.buzzer_muted is not None and \
+        desired_state.buzzer_muted != self._buzzer_muted:
+      instructions.append(self._buzzer_muting_instruction(desired_state.buzzer_muted))
+    if desired_state.led_timeout_seconds is not None:
+      instruction = self._led_timeout_instruction(desired_state.led_timeout_seconds)
+      if instruction.data_value != self._led_timeout_seconds:
+        instructions.append(instruction)
+    if desired_state.auto_input_detection is not None and \
+        desired_state.auto_input_detection != self._auto_input_detection:
+      instructions.append(
+        self._auto_input_detection_instruction(desired_state.auto_input_detection)
+      )
+
+    if len(instructions) > 0:
+      self._process_interactive(instructions)
+    return instructions
+
+  @contextlib.contextmanager
+  def batch(self) -> Iterator[None]:
+    """
+    Send the commands issued on this thread within the block together, in a
+    single exchange with the device, once the block exits. Over one connection,
+    or, if the device is pipelined, in a single write.
+
+    Batches may be nested, in which case everything is sent when the outermost
+    one exits. Commands are dropped if the block raises. `update` is not
+    batched, and `select_source` is not coalesced within a batch.
+
+    Example:
+      with media_switch.batch():
+        media_switch.set_buzzer_muting(True)
+        media_switch.select_source(3)
+    """
+    if self._is_batching():
+      yield
+      return
+
+    self._batch.instructions = []
+    try:
+      yield
+      instructions = self._batch.instructions
+    finally:
+      self._batch.instructions = None
+    if len(instructions) > 0:
+      self._process_interactive(instructions)
+
+  def update(self, force: bool = False) -> None:
+    """
+    Refresh device state.
+
+    With a cache policy, fresh state is left as is, concurrent refreshes share a
+    single device query and, if configured, stale state is refreshed in the
+    background.
+
+    Args:
+      force (bool): Query the device regardless of the cache policy.
+    """
+    if self._cache_policy is None:
+      self._process(self._update_instructions(), Priority.BACKGROUND)
+    elif force or self._selected_source_updated_at is None:
+      self._refresh()
+    elif self._cache_policy.is_fresh(time.monotonic() - self._selected_source_updated_at):
+      return
+    elif self._cache_policy.stale_while_revalidate:
+      self._refresh_in_background()
+    else:
+      self._refresh()
+
+  def submit_update(self) -> 'Future[None]':
+    """
+    Start refreshing device state, returning a future that completes once the
+    device's replies have been applied, or fails as `update` would raise.
+
+    The device is queried regardless of the cache policy. With a
+    `DeviceMultiplexer`, or a serialized switch, this returns without waiting
+    for the device, so one thread can keep many switches polled by submitting
+    each one's update, then waiting for the futures. Otherwise the device is
+    queried before returning.
+    """
+    updated: Future = Future()
+
+    def apply_replies(replies: 'Future[list[Instruction]]') -> None:
+      try:
+        self._update_from_instructions(replies.result())
+      except Exception as ex:
+        updated.set_exception(ex)
+      else:
+        updated.set_result(None)
+
+    replies = self._submit(self._update_instructions(), Priority.BACKGROUND)
+    replies.add_done_callback(apply_replies)
+    return updated
 
   @property
-  def output_count(self) -> int:
+  def cache_policy(self) -> Optional[CachePolicy]:
+    return self._cache_policy
+
+  def start_listening(self) -> None:
     """
-    The number of outputs the switch has
+    Track changes the device reports unprompted, such as an input being selected
+    via the front panel, as they happen.
+
+    Uses a dedicated connection, read on a background thread.
     """
-    return self._output_count
+    if self._listener is None:
+      self._listener = DeviceListener(self._device.endpoint, self._update_from_instructions)
+    self._listener.start()
+
+  def stop_listening(self) -> None:
+    if self._listener is not None:
+      self._listener.stop()
+      self._listener = None
+
+  @property
+  def is_listening(self) -> bool:
+    return self._listener is not None and self._listener.is_running
 
-  def _process(self, instructions: list[Instruction] | Instruction) -> None:
-    results = self._device.process(instructions)
+  def close(self) -> None:
+    """
+    Stop listening and release the device connection, if one is held open
+    """
+    self.stop_listening()
+    if self._worker is None:
+      self._device.close()
+    else:
+      # The worker's device may still be in use by other switches; it is closed
+      # once the last one releases the worker
+      self._worker.release()
+      self._worker = None
+
+  def _process(
+      self,
+      instructions: list[Instruction] | Instruction,
+      priority: Priority = Priority.NORMAL
+    ) -> None:
+    if self._worker is None:
+      results = self._device.process(instructions)
+    else:
+      results = self._worker.process(instructions, priority)
     self._update_from_instructions(results)
+    # The device closing the connection, or failing to, cuts the exchange short,
+    # after which settings sent may or may not have been applied
+    completed = all(result.id != Command.NULL_RESPONSE for result in results)
+    self._remember_settings(instructions, completed)
 
-  def _update_from_instructions(self, instructions: list[Instruction]) -> None:
-    for instruction in instructions:
-      match instruction.id:
-        case Command.CURRENT_ACTIVE_INPUT:
-          self._selected_source = instruction.data_value + 1
-        case _:
-          LOGGER.info('Discarded instruction: %s', instruction)
+  def _submit(
+      self,
+      instructions: list[Instruction],
+      priority: Priority
+    ) -> 'Future[list[Instruction]]':
+    try:
+      if self._worker is not None:
+        return self._worker.submit(instructions, priority)
+      if isinstance(self._device, MultiplexedDevice):
+        return self._device.submit(instructions)
+      replies = self._device.process(instructions)
+    except Exception as ex:
+      # Reported through the future, as errors from the device's thread are
+      failed: Future = Future()
+      failed.set_exception(ex)
+      return failed
+    completed: Future = Future()
+    completed.set_result(replies)
+    return completed
+
+  def _remember_settings(
+      self,
+      instructions: list[Instruction] | Instruction,
+      completed: bool = True
+    ) -> None:
+    """
+    Track the settings sent, or, if the exchange did not complete, forget them so
+    `apply` sends them again
+    """
+    if isinstance(instructions, Instruction):
+      instructions = [instructions]
+    with self._state_lock:
+      for instruction in instructions:
+        match instruction.id:
+          case Command.MUTE_BUZZER:
+            # Zero turns the buzzer off
+            self._buzzer_muted = instruction.data_value == 0 if completed else None
+          case Command.LED_TIMEOUT_SECONDS:
+            self._led_timeout_seconds = instruction.data_value if completed else None
+          case Command.ENABLE_INPUT_DETECTION:
+            self._auto_input_detection = instruction.data_value != 0 if completed else None
+
+  def _process_interactive(self, instructions: list[Instruction] | Instruction) -> None:
+    if self._is_batching():
+      if isinstance(instructions, Instruction):
+        self._batch.instructions.append(instructions)
+      else:
+        self._batch.instructions.extend(instructions)
+      return
+    self._process(instructions, Priority.INTERACTIVE)
+
+  def _is_batching(self) -> bool:
+    return getattr(self._batch, 'instructions', None) is not None
+
+  def _refresh(self) -> None:
+    # Join a refresh already in flight rather than issuing another
+    with self._refresh_lock:
+      in_flight = self._refresh_in_flight
+      is_leader = in_flight is None
+      if is_leader:
+        in_flight = self._refresh_in_flight = threading.Event()
+
+    if not is_leader:
+      in_flight.wait()
+      return
+
+    try:
+      self._process(self._update_instructions(), Priority.BACKGROUND)
+    finally:
+      with self._refresh_lock:
+        self._refresh_in_flight = None
+      in_flight.set()
+
+  def _refresh_in_background(self) -> None:
+    with self._refresh_lock:
+      if self._refresh_in_flight is not None:
+        return
+    threading.Thread(target = self._refresh_quietly, daemon = True).start()
+
+  def _refresh_quietly(self) -> None:
+    try:
+      self._refresh()
+    except Exception as ex:
+      LOGGER.error('Failed refreshing device state in background: %s', ex)
 
   def _determine_input_count(self) -> None:
     # Determine current selected input
     prev_selected_source = self.selected_source
     self._selected_source = 0
 
-    # Determine highest valid source by selecting them and seeing if it was valid
+    # Determine highest valid source by selecting them and seeing if it was valid.
+    # Sent directly, since each probe depends on the previous one's result.
     for input in range(MAX_SUPPORTED_INPUTS, 0, -1):
-      self.select_source(input)
-      if (self.selected_source != 0):
+      self._process(self._select_source_instruction(input))
+      # Compared with the input, since a fenced device reports the active input
+      # even when the selection is invalid
+      if (self.selected_source == input):
         self._input_count = self.selected_source
         break
 
     # Restore previously selected input
-    self.select_source(prev_selected_source)
-  
-  def _update_instructions(self) -> list[Instruction]:
-    return [
-      # Queries the currently selected input
-      Instruction(Command.QUERY_ACTIVE_INPUT)
-    ]
+    self._process(self._select_source_instruction(prev_selected_source))
+
+class AsyncMediaSwitch(_MediaSwitchState, AsyncMediaSwitchProtocol):
+  """
+  asyncio counterpart of `MediaSwitch`.
+
+  Construction does no I/O, so `initialize` must be awaited before use; `create`
+  does both.
+  """
+
+  def __init__(self, device: AsyncTcpDevice, input_count: Optional[int] = None):
+    super().__init__(input_count)
+    self._device = device
+    self._listener: Optional[AsyncDeviceListener] = None
+
+  @classmethod
+  async def create(
+      cls,
+      device: AsyncTcpDevice,
+      input_count: Optional[int] = None
+    ) -> 'AsyncMediaSwitch':
+    media_switch = cls(device, input_count)
+    await media_switch.initialize()
+    return media_switch
+
+  async def initialize(self) -> None:
+    """
+    Load device state and, unless declared, determine the number of inputs
+    """
+    await self.update()
+    if self._input_count == 0:
+      await self._determine_input_count()
+
+  async def select_source(self, input: int) -> None:
+    """
+    Select the specified video input
+    """
+    await self._process(self._select_source_instruction(input))
+
+  async def set_buzzer_muting(self, mute_buzzer: bool) -> None:
+    """
+    Enable or disable the buzzer
+    """
+    await self._process(self._buzzer_muting_instruction(mute_buzzer))
+
+  async def set_led_timeout_seconds(self, led_timeout_seconds: int) -> None:
+    """
+    Set the LED timeout
+    """
+    await self._process(self._led_timeout_instruction(led_timeout_seconds))
+
+  async def set_auto_input_detection(self, enable_auto_input_detection: bool) -> None:
+    """
+    Enable or disable input auto-detection
+    """
+    await self._process(self._auto_input_detection_instruction(enable_auto_input_detection))
+
+  async def update(self) -> None:
+    await self._process(self._update_instructions())
+
+  def start_listening(self) -> None:
+    """
+    Track changes the device reports unprompted, such as an input being selected
+    via the front panel, as they happen.
+
+    Uses a dedicated connection, read by a task on the running event loop.
+    """
+    if self._listener is None:
+      self._listener = AsyncDeviceListener(
+        self._device.endpoint,
+        self._update_from_instructions
+      )
+    self._listener.start()
+
+  async def stop_listening(self) -> None:
+    if self._listener is not None:
+      await self._listener.stop()
+      self._listener = None
+
+  @property
+  def is_listening(self) -> bool:
+    return self._listener is not None and self._listener.is_running
+
+  async def close(self) -> None:
+    """
+    Stop listening and release the device connection, if one is held open
+    """
+    await self.stop_listening()
+    await self._device.close()
+
+  async def _process(self, instructions: list[Instruction] | Instruction) -> None:
+    results = await self._device.process(instructions)
+    self._update_from_instructions(results)
+
+  async def _determine_input_count(self) -> None:
+    # See `MediaSwitch._determine_input_count`
+    prev_selected_source = self.selected_source
+    self._selected_source = 0
+
+    for input in range(MAX_SUPPORTED_INPUTS, 0, -1):
+      await self.select_source(input)
+      if (self.selected_source == input):
+        self._input_count = self.selected_source
+        break
+
+    await self.select_source(prev_selected_source)
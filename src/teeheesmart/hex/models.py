@@ -0,0 +1,69 @@
+"""
+Known TESmart device models using the Hex protocol
+"""
+from typing import Optional
+
+from .io import Command, ResponsePolicy
+
+class DeviceModel:
+  """
+  Static characteristics of a device model, used to skip probing the device
+  """
+
+  def __init__(
+      self,
+      name: str,
+      input_count: int,
+      response_policies: Optional[dict[Command, ResponsePolicy]] = None
+    ):
+    self._name = name
+    self._input_count = input_count
+    self._response_policies = response_policies or {}
+
+  @property
+  def name(self) -> str:
+    return self._name
+
+  @property
+  def input_count(self) -> int:
+    return self._input_count
+
+  @property
+  def response_policies(self) -> dict[Command, ResponsePolicy]:
+    """
+    Overrides for `DEFAULT_RESPONSE_POLICIES` specific to this model
+    """
+    return dict(self._response_policies)
+
+  def __repr__(self) -> str:
+    return f'DeviceModel({self.name!r}, input_count={self.input_count})'
+
+MODELS: dict[str, DeviceModel] = {
+  model.name: model for model in [
+    DeviceModel('HSW-401', 4),
+    DeviceModel('HSW-801', 8),
+    DeviceModel('HSW-1601', 16),
+  ]
+}
+
+def _normalized_model_name(name: str) -> str:
+  return name.strip().upper().replace('-', '').replace('_', '')
+
+_MODELS_BY_NORMALIZED_NAME: dict[str, DeviceModel] = {
+  _normalized_model_name(name): model for name, model in MODELS.items()
+}
+
+def find_model(name: str) -> DeviceModel:
+  """
+  Look up a device model by name, ignoring case and separators (e.g., `hsw1601`
+  matches `HSW-1601`.)
+
+  Raises:
+    ValueError: The model is not known.
+  """
+  model = _MODELS_BY_NORMALIZED_NAME.get(_normalized_model_name(name))
+  if model is None:
+    raise ValueError(
+      f'Unknown model: {name}. Known models: {", ".join(MODELS.keys())}'
+    )
+  return model
@@ -0,0 +1,643 @@
+import collections
+import errno
+import heapq
+import itertools
+import os
+import selectors
+import socket
+import threading
+import time
+
+from concurrent.futures import Future
+from enum import Enum, unique
+from typing import Callable, Optional
+
+from ..constants import LOGGER
+from .breaker import CircuitBreaker
+from .instrumentation import DeviceObserver
+from .io import \
+  _NULL_OBSERVER, Command, FrameDecoder, Instruction, ResponsePolicies, ResponsePolicy, \
+  TcpEndpoint, _log_response_timeout
+from .resolver import AddressInfo
+from .rtt import RttEstimator
+
+class DeviceMultiplexer:
+  """
+  Drives I/O for many devices from a single background thread.
+
+  Each `MultiplexedDevice` holds a non-blocking socket, which the multiplexer
+  watches with `selectors`, advancing that device's connect, send, receive and
+  timeout steps as its socket becomes ready. Devices are independent: one waiting
+  out a timeout does not hold up the rest, so one thread keeps hundreds of
+  switches polled.
+
+  The thread starts with the first request and runs until `close`.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._thread: Optional[threading.Thread] = None
+    self._closed = False
+    # Work handed to the background thread, which owns all device state
+    self._calls: collections.deque[Callable[[], None]] = collections.deque()
+    self._selector: Optional[selectors.BaseSelector] = None
+    self._wake_reader: Optional[socket.socket] = None
+    self._wake_writer: Optional[socket.socket] = None
+    # Pending timeouts, as deadline, tie-breaker, channel and the channel's
+    # deadline token at the time; entries whose token is stale are ignored.
+    self._deadlines: list[tuple[float, int, '_Channel', int]] = []
+    self._sequence = itertools.count()
+    self._channels: set['_Channel'] = set()
+
+  @property
+  def closed(self) -> bool:
+    return self._closed
+
+  def close(self, timeout_sec: Optional[float] = None) -> None:
+    """
+    Stop the background thread, failing outstanding requests with
+    `ConnectionError` and closing every connection
+    """
+    with self._lock:
+      if self._closed:
+        return
+      self._closed = True
+      thread = self._thread
+      if thread is not None:
+        self._wake()
+    if thread is not None and thread is not threading.current_thread():
+      thread.join(timeout_sec)
+
+  def __enter__(self) -> 'DeviceMultiplexer':
+    return self
+
+  def __exit__(self, *_) -> None:
+    self.close()
+
+  def _call_soon(self, call: Callable[[], None]) -> None:
+    """
+    Run `call` on the background thread, starting it if needed
+    """
+    with self._lock:
+      if self._closed:
+        raise ConnectionError('Device multiplexer is closed')
+      self._calls.append(call)
+      if self._thread is None:
+        self._start()
+      else:
+        self._wake()
+
+  def _start(self) -> None:
+    self._selector = selectors.DefaultSelector()
+    self._wake_reader, self._wake_writer = socket.socketpair()
+    self._wake_reader.setblocking(False)
+    self._wake_writer.setblocking(False)
+    self._selector.register(self._wake_reader, selectors.EVENT_READ, None)
+    self._thread = threading.Thread(
+      target = self._run,
+      name = 'teeheesmart-multiplexer',
+      daemon = True,
+    )
+    self._thread.start()
+
+  def _wake(self) -> None:
+    try:
+      self._wake_writer.send(b'\0')
+    except BlockingIOError:
+      # Already full of wake-ups the thread has yet to read
+      pass
+
+  def _run(self) -> None:
+    try:
+      while not self._closed:
+        self._run_calls()
+        self._expire_deadlines()
+        for key, events in self._selector.select(self._next_timeout_sec()):
+          if key.data is None:
+            self._drain_wake_ups()
+          else:
+            key.data.on_ready(events)
+    except Exception as ex:
+      LOGGER.error('Device multiplexer failed: %s', ex)
+      with self._lock:
+        self._closed = True
+    finally:
+      self._shut_down()
+
+  def _run_calls(self) -> None:
+    while True:
+      with self._lock:
+        if len(self._calls) == 0:
+          return
+        call = self._calls.popleft()
+      call()
+
+  def _drain_wake_ups(self) -> None:
+    try:
+      while self._wake_reader.recv(64):
+        pass
+    except BlockingIOError:
+      pass
+
+  def _schedule(self, channel: '_Channel', delay_sec: float) -> None:
+    heapq.heappush(
+      self._deadlines,
+      (time.monotonic() + delay_sec, next(self._sequence), channel, channel.deadline_token)
+    )
+
+  def _next_timeout_sec(self) -> Optional[float]:
+    self._discard_stale_deadlines()
+    if len(self._deadlines) == 0:
+      return None
+    return max(0.0, self._deadlines[0][0] - time.monotonic())
+
+  def _expire_deadlines(self) -> None:
+    now = time.monotonic()
+    self._discard_stale_deadlines()
+    while len(self._deadlines) > 0 and self._deadlines[0][0] <= now:
+      _, _, channel, _ = heapq.heappop(self._deadlines)
+      channel.on_deadline()
+      self._discard_stale_deadlines()
+
+  def _discard_stale_deadlines(self) -> None:
+    while len(self._deadlines) > 0:
+      _, _, channel, token = self._deadlines[0]
+      if token == channel.deadline_token:
+        return
+      heapq.heappop(self._deadlines)
+
+  def _shut_down(self) -> None:
+    with self._lock:
+      calls = list(self._calls)
+      self._calls.clear()
+    # Let queued work register with its channel, so it is failed below
+    for call in calls:
+      call()
+    for channel in list(self._channels):
+      channel.fail_all(ConnectionError('Device multiplexer is closed'))
+    self._selector.close()
+    self._wake_reader.close()
+    self._wake_writer.close()
+
+class MultiplexedDevice:
+  """
+  Stands in for a `TcpDevice`, performing its I/O on a `DeviceMultiplexer`
+  thread rather than the calling one.
+
+  Instructions are sent one at a time, as by a non-pipelined `TcpDevice`, and
+  requests from different threads are queued and sent in turn.
+  """
+
+  def __init__(
+      self,
+      multiplexer: DeviceMultiplexer,
+      endpoint: TcpEndpoint,
+      persistent: bool = False,
+      response_policies: Optional[dict[Command, ResponsePolicy]] = None,
+      observer: Optional[DeviceObserver] = None,
+      circuit_breaker: Optional[CircuitBreaker] = None,
+      rtt_estimator: Optional[RttEstimator] = None
+    ):
+    """
+    Args:
+      multiplexer (DeviceMultiplexer): Performs the device's I/O.
+      endpoint (TcpEndpoint): Location of the device.
+      persistent (bool): Keep the connection open between calls to `process`,
+        rather than connecting for each call. Default: False.
+      response_policies (Optional[dict[Command, ResponsePolicy]]): Overrides for
+        `DEFAULT_RESPONSE_POLICIES`.
+      observer (Optional[DeviceObserver]): Notified of connect times, round-trip
+        times, timeouts, traffic and errors.
+      circuit_breaker (Optional[CircuitBreaker]): Fails `process` fast with
+        `CircuitOpenError` while the device keeps failing.
+      rtt_estimator (Optional[RttEstimator]): Sets the timeout for each reply
+        from the round-trip times measured.
+    """
+    self._multiplexer = multiplexer
+    self._endpoint = endpoint
+    self._persistent = persistent
+    self._response_policies = ResponsePolicies(response_policies)
+    self._observer = observer or _NULL_OBSERVER
+    self._circuit_breaker = circuit_breaker
+    self._rtt_estimator = rtt_estimator
+    self._channel = _Channel(self)
+    # Resolved on first use, outside the background thread, so slow name
+    # resolution never holds up other devices
+    self._addresses: Optional[list[AddressInfo]] = None
+
+  @property
+  def endpoint(self) -> TcpEndpoint:
+    return self._endpoint
+
+  @property
+  def persistent(self) -> bool:
+    return self._persistent
+
+  @property
+  def response_policies(self) -> ResponsePolicies:
+    return self._response_policies
+
+  @property
+  def multiplexer(self) -> DeviceMultiplexer:
+    return self._multiplexer
+
+  def submit(self, instructions: list[Instruction] | Instruction) -> 'Future[list[Instruction]]':
+    """
+    Queue instructions to be sent, returning a future for their responses.
+
+    The future fails with `OSError` if the device could not be connected to.
+    Failures after connecting are logged, and the responses received until then
+    returned.
+    """
+    try:
+      _ = iter(instructions)
+    except TypeError:
+      # Single instruction provided; wrap it.
+      instructions = [instructions]
+
+    if self._circuit_breaker is not None:
+      self._circuit_breaker.check()
+
+    try:
+      addresses = self._addresses
+      if addresses is None:
+        addresses = self._addresses = self._resolve()
+
+      future: Future = Future()
+      request = _Request(list(instructions), addresses, future)
+      self._multiplexer._call_soon(lambda: self._channel.enqueue(request))
+    except Exception:
+      # Otherwise a probe let through by the breaker would never report back
+      if self._circuit_breaker is not None:
+        self._circuit_breaker.record_failure()
+      raise
+    return future
+
+  def process(self, instructions: list[Instruction] | Instruction) -> list[Instruction]:
+    return self.submit(instructions).result()
+
+  def close(self) -> None:
+    """
+    Close the persistent connection, if one is open, once queued requests finish
+    """
+    try:
+      self._multiplexer._call_soon(self._channel.close_when_idle)
+    except ConnectionError:
+      # Closing the multiplexer already closed the connection
+      pass
+
+  def __enter__(self) -> 'MultiplexedDevice':
+    return self
+
+  def __exit__(self, *_) -> None:
+    self.close()
+
+  def _reply_timeout_sec(self) -> Optional[float]:
+    if self._rtt_estimator is not None:
+      return self._rtt_estimator.timeout_sec
+    return self._endpoint.timeout_sec
+
+  def _resolve(self) -> list[AddressInfo]:
+    host, port = self._endpoint.host, self._endpoint.port
+    if self._endpoint.resolver is not None:
+      addresses = self._endpoint.resolver.resolve(host, port)
+    else:
+      addresses = socket.getaddrinfo(host, port, type = socket.SOCK_STREAM)
+    if len(addresses) == 0:
+      raise OSError(f'{host} resolved to no addresses')
+    return addresses
+
+class _Request:
+  def __init__(self, instructions: list[Instruction], addresses: list[AddressInfo], future: Future):
+    self.instructions = instructions
+    # Tried in turn until one connects
+    self.addresses = addresses
+    self.address_index = 0
+    self.future = future
+    self.results: list[Instruction] = []
+    # Index of the instruction being sent or awaiting its reply
+    self.position = 0
+
+@unique
+class _ChannelState(Enum):
+  IDLE = 'idle'
+  CONNECTING = 'connecting'
+  SENDING = 'sending'
+  RECEIVING = 'receiving'
+
+class _Channel:
+  """
+  A device's connection and request queue, accessed only from the multiplexer's
+  background thread
+  """
+  RECV_BUFFER_SIZE: int = 256
+
+  def __init__(self, device: MultiplexedDevice):
+    self._device = device
+    self._multiplexer = device._multiplexer
+    self._queue: collections.deque[_Request] = collections.deque()
+    self._request: Optional[_Request] = None
+    self._state = _ChannelState.IDLE
+    self._sock: Optional[socket.socket] = None
+    self._events = 0
+    self._decoder = FrameDecoder()
+    self._recv_buffer = memoryview(bytearray(_Channel.RECV_BUFFER_SIZE))
+    self._unsent = b''
+    self._started = 0.0
+    self._received_byte_count = 0
+    self._close_when_idle = False
+    # Frames received while idle, such as front panel changes, returned ahead of
+    # the next request's replies, as by `TcpDevice`
+    self._unsolicited: list[Instruction] = []
+    # Changed whenever the pending timeout is replaced or cancelled
+    self.deadline_token = 0
+
+  def enqueue(self, request: _Request) -> None:
+    self._close_when_idle = False
+    self._queue.append(request)
+    self._multiplexer._channels.add(self)
+    if self._state == _ChannelState.IDLE:
+      self._start_next()
+
+  def close_when_idle(self) -> None:
+    if self._state == _ChannelState.IDLE and len(self._queue) == 0:
+      self._close_socket()
+      self._multiplexer._channels.discard(self)
+    else:
+      self._close_when_idle = True
+
+  def fail_all(self, error: Exception) -> None:
+    if self._request is not None:
+      self._request.future.set_exception(error)
+      self._request = None
+    while len(self._queue) > 0:
+      request = self._queue.popleft()
+      if request.future.set_running_or_notify_cancel():
+        request.future.set_exception(error)
+    self._close_socket()
+
+  def on_ready(self, events: int) -> None:
+    try:
+      if self._state == _ChannelState.CONNECTING:
+        self._on_connected()
+      elif self._state == _ChannelState.SENDING:
+        self._send_unsent()
+      elif self._state == _ChannelState.RECEIVING:
+        self._receive()
+      else:
+        self._receive_while_idle()
+    except OSError as ex:
+      self._fail_exchange(ex)
+
+  def on_deadline(self) -> None:
+    self.deadline_token += 1
+    if self._state == _ChannelState.CONNECTING:
+      self._fail_connect(TimeoutError('Timed out connecting'))
+    elif self._state == _ChannelState.RECEIVING:
+      instruction = self._current_instruction()
+      _log_response_timeout(instruction, self._device._response_policies.policy_for(instruction))
+      self._complete_instruction([], timed_out = True)
+    elif self._state == _ChannelState.SENDING:
+      self._fail_exchange(TimeoutError('Timed out sending'))
+
+  def _start_next(self) -> None:
+    while self._request is None and len(self._queue) > 0:
+      request = self._queue.popleft()
+      if request.future.set_running_or_notify_cancel():
+        self._request = request
+
+    if self._request is not None and len(self._unsolicited) > 0:
+      self._request.results.extend(self._unsolicited)
+      self._unsolicited = []
+
+    if self._request is None:
+      self._state = _ChannelState.IDLE
+      if self._close_when_idle or not self._device._persistent:
+        self._close_socket()
+      if self._close_when_idle:
+        self._multiplexer._channels.discard(self)
+      elif self._sock is not None:
+        # Notice the device dropping the idle connection, or reporting changes
+        self._watch(selectors.EVENT_READ)
+      return
+
+    if len(self._request.instructions) == 0:
+      self._finish_request()
+    elif self._sock is None:
+      self._connect()
+    else:
+      self._send_current()
+
+  def _connect(self) -> None:
+    family, type, proto, _, sockaddr = self._request.addresses[self._request.address_index]
+    self._started = time.perf_counter()
+    self._state = _ChannelState.CONNECTING
+    sock = socket.socket(family, type, proto)
+    try:
+      sock.setblocking(False)
+      error = sock.connect_ex(sockaddr)
+    except OSError as ex:
+      sock.close()
+      self._fail_connect(ex)
+      return
+    if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+      sock.close()
+      self._fail_connect(OSError(error, os.strerror(error)))
+      return
+    self._sock = sock
+    self._watch(selectors.EVENT_WRITE)
+    self._set_deadline(self._device._endpoint.connect_timeout_sec)
+
+  def _on_connected(self) -> None:
+    error = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+    if error != 0:
+      self._fail_connect(OSError(error, os.strerror(error)))
+      return
+    self._device._observer.on_connect(self._device._endpoint, time.perf_counter() - self._started)
+    request = self._request
+    if request.address_index > 0:
+      # Try the address that connected first next time
+      winner = request.addresses[request.address_index]
+      self._device._addresses = [winner] + [
+        address for address in request.addresses if address != winner
+      ]
+    self._decoder.reset()
+    self._send_current()
+
+  def _fail_connect(self, error: OSError) -> None:
+    self._close_socket()
+    device = self._device
+    device._observer.on_error(device._endpoint, None, error)
+    request = self._request
+    if request.address_index + 1 < len(request.addresses):
+      LOGGER.debug('Failed connecting to %s: %s', request.addresses[request.address_index][4], error)
+      request.address_index += 1
+      self._connect()
+      return
+
+    # Resolve again next time, in case the addresses changed
+    device._addresses = None
+    endpoint = device._endpoint
+    if endpoint.resolver is not None:
+      endpoint.resolver.invalidate(endpoint.host, endpoint.port)
+    if device._circuit_breaker is not None:
+      device._circuit_breaker.record_failure()
+    request, self._request = self._request, None
+    request.future.set_exception(error)
+    self._start_next()
+
+  def _send_current(self) -> None:
+    self._started = time.perf_counter()
+    self._received_byte_count = 0
+    self._unsent = self._current_instruction().frame_bytes
+    self._state = _ChannelState.SENDING
+    self._send_unsent()
+
+  def _send_unsent(self) -> None:
+    try:
+      sent = self._sock.send(self._unsent)
+    except BlockingIOError:
+      sent = 0
+    self._unsent = self._unsent[sent:]
+    if len(self._unsent) > 0:
+      self._watch(selectors.EVENT_WRITE)
+      self._set_deadline(self._device._endpoint.timeout_sec)
+      return
+
+    instruction = self._current_instruction()
+    policy = self._device._response_policies.policy_for(instruction)
+    if policy == ResponsePolicy.NEVER_REPLIES:
+      self._complete_instruction([])
+      return
+    self._state = _ChannelState.RECEIVING
+    self._watch(selectors.EVENT_READ)
+    self._set_deadline(self._device._reply_timeout_sec())
+
+  def _receive(self) -> None:
+    byte_count = self._read()
+    if byte_count is None:
+      return
+    if byte_count == 0:
+      # The device closed the connection, so nothing further can be sent
+      self._close_socket()
+      self._complete_instruction([Instruction(Command.NULL_RESPONSE)])
+      return
+    responses = self._decoder.feed(self._recv_buffer[:byte_count])
+    if len(responses) > 0:
+      self._complete_instruction(responses)
+
+  def _receive_while_idle(self) -> None:
+    byte_count = self._read()
+    if byte_count == 0:
+      LOGGER.debug('Device closed idle connection')
+      self._close_socket()
+    elif byte_count is not None:
+      received = self._decoder.feed(self._recv_buffer[:byte_count])
+      if len(received) > 0:
+        LOGGER.debug('Received %d instructions while idle: %s', len(received), received)
+        self._unsolicited.extend(received)
+
+  def _read(self) -> Optional[int]:
+    try:
+      byte_count = self._sock.recv_into(self._recv_buffer)
+    except BlockingIOError:
+      return None
+    self._received_byte_count += byte_count
+    return byte_count
+
+  def _complete_instruction(self, responses: list[Instruction], timed_out: bool = False) -> None:
+    request = self._request
+    instruction = self._current_instruction()
+    elapsed_sec = time.perf_counter() - self._started
+    self._record_rtt(instruction, responses, elapsed_sec, timed_out)
+    self._device._observer.on_exchange(
+      self._device._endpoint,
+      instruction,
+      elapsed_sec,
+      Instruction.SIZE_BYTES,
+      self._received_byte_count,
+      timed_out
+    )
+    request.results.extend(responses)
+    request.position += 1
+
+    if request.position < len(request.instructions) and self._sock is not None:
+      self._send_current()
+    else:
+      self._finish_request()
+
+  def _record_rtt(
+      self,
+      instruction: Instruction,
+      responses: list[Instruction],
+      elapsed_sec: float,
+      timed_out: bool
+    ) -> None:
+    estimator = self._device._rtt_estimator
+    if estimator is None:
+      return
+    if timed_out:
+      if self._device._response_policies.policy_for(instruction) == ResponsePolicy.EXPECTS_REPLY:
+        estimator.record_timeout()
+    elif len(responses) > 0 and responses[0].id != Command.NULL_RESPONSE:
+      estimator.record_rtt(elapsed_sec)
+
+  def _finish_request(self) -> None:
+    request, self._request = self._request, None
+    self._state = _ChannelState.IDLE
+    self._cancel_deadline()
+    if self._device._circuit_breaker is not None:
+      self._device._circuit_breaker.record_success()
+    request.future.set_result(request.results)
+    self._start_next()
+
+  def _fail_exchange(self, error: OSError) -> None:
+    LOGGER.error('Failed communicating with device: %s', error)
+    self._close_socket()
+    request, self._request = self._request, None
+    self._state = _ChannelState.IDLE
+    if request is not None:
+      device = self._device
+      instruction = request.instructions[request.position]
+      device._observer.on_error(device._endpoint, instruction, error)
+      if device._circuit_breaker is not None:
+        device._circuit_breaker.record_failure()
+      # As with `TcpDevice`, return whatever was received before the failure,
+      # marked as cut short
+      request.results.append(Instruction(Command.NULL_RESPONSE))
+      request.future.set_result(request.results)
+    self._start_next()
+
+  def _current_instruction(self) -> Instruction:
+    return self._request.instructions[self._request.position]
+
+  def _watch(self, events: int) -> None:
+    if events == self._events:
+      return
+    selector = self._multiplexer._selector
+    if self._events == 0:
+      selector.register(self._sock, events, self)
+    else:
+      selector.modify(self._sock, events, self)
+    self._events = events
+
+  def _set_deadline(self, delay_sec: Optional[float]) -> None:
+    self._cancel_deadline()
+    if delay_sec is not None:
+      self._multiplexer._schedule(self, delay_sec)
+
+  def _cancel_deadline(self) -> None:
+    self.deadline_token += 1
+
+  def _close_socket(self) -> None:
+    self._cancel_deadline()
+    if self._sock is None:
+      return
+    if self._events != 0:
+      self._multiplexer._selector.unregister(self._sock)
+      self._events = 0
+    try:
+      self._sock.close()
+    except OSError as ex:
+      LOGGER.debug('Failed closing connection: %s', ex)
+    self._sock = None
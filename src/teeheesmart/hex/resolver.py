@@ -0,0 +1,206 @@
+import errno
+import os
+import selectors
+import socket
+import threading
+import time
+
+from typing import Callable, Optional
+
+from ..constants import LOGGER
+
+# Resolved address, as returned by `socket.getaddrinfo`: family, type, protocol,
+# canonical name and socket address
+AddressInfo = tuple[int, int, int, str, tuple]
+
+class ResolverCache:
+  """
+  Caches host name resolution, and connects by racing the resolved addresses.
+
+  Resolving names such as `switch.local` via mDNS can take hundreds of
+  milliseconds, so results are kept for `ttl_sec`. Connecting tries the addresses
+  happy eyeballs style (RFC 8305): alternating IPv6 and IPv4, starting the next
+  attempt if the previous one has not connected within `stagger_sec`, and
+  keeping whichever connects first. The winner is tried first next time.
+  """
+  DEFAULT_TTL_SEC: float = 60.0
+  DEFAULT_STAGGER_SEC: float = 0.25
+
+  _shared: Optional['ResolverCache'] = None
+  _shared_lock = threading.Lock()
+
+  def __init__(
+      self,
+      ttl_sec: float = DEFAULT_TTL_SEC,
+      stagger_sec: float = DEFAULT_STAGGER_SEC,
+      clock: Callable[[], float] = time.monotonic,
+      getaddrinfo: Callable[..., list[AddressInfo]] = socket.getaddrinfo
+    ):
+    """
+    Args:
+      ttl_sec (float): How long resolved addresses are reused.
+      stagger_sec (float): Delay before racing the next address while earlier
+        connection attempts are still pending.
+      clock (Callable[[], float]): Source of monotonic time, in seconds.
+      getaddrinfo (Callable[..., list[AddressInfo]]): Resolves names; see
+        `socket.getaddrinfo`.
+    """
+    if ttl_sec < 0:
+      raise ValueError(f'ttl_sec must not be negative. Received: {ttl_sec}')
+    self._ttl_sec = ttl_sec
+    self._stagger_sec = stagger_sec
+    self._clock = clock
+    self._getaddrinfo = getaddrinfo
+
+    self._lock = threading.Lock()
+    # Addresses and expiry time, keyed by host and port
+    self._entries: dict[tuple[str, int], tuple[list[AddressInfo], float]] = {}
+
+  @classmethod
+  def shared(cls) -> 'ResolverCache':
+    """
+    Return the process-wide cache, creating it with default settings if needed
+    """
+    with cls._shared_lock:
+      if cls._shared is None:
+        cls._shared = cls()
+      return cls._shared
+
+  @property
+  def ttl_sec(self) -> float:
+    return self._ttl_sec
+
+  def resolve(self, host: str, port: int) -> list[AddressInfo]:
+    """
+    Return the addresses of `host`, most recently successful first, resolving
+    them if not cached or expired
+    """
+    key = (host, port)
+    now = self._clock()
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[1] > now:
+        return list(entry[0])
+
+    addresses = _interleave_families(
+      self._getaddrinfo(host, port, type = socket.SOCK_STREAM)
+    )
+    with self._lock:
+      self._entries[key] = (addresses, now + self._ttl_sec)
+    return list(addresses)
+
+  def invalidate(self, host: str, port: int) -> None:
+    with self._lock:
+      self._entries.pop((host, port), None)
+
+  def connect(self, host: str, port: int, timeout_sec: Optional[float] = None) -> socket.socket:
+    """
+    Connect to `host` using its cached addresses.
+
+    Returns:
+      socket.socket: Connected socket, in blocking mode.
+
+    Raises:
+      OSError: No address could be connected to, in which case the cached
+        addresses are discarded.
+    """
+    addresses = self.resolve(host, port)
+    try:
+      sock, winner = _race_connections(addresses, timeout_sec, self._stagger_sec)
+    except OSError:
+      self.invalidate(host, port)
+      raise
+    self._remember(host, port, winner)
+    return sock
+
+  def _remember(self, host: str, port: int, winner: AddressInfo) -> None:
+    with self._lock:
+      entry = self._entries.get((host, port))
+      if entry is None or entry[0][0] == winner:
+        return
+      addresses = [winner] + [address for address in entry[0] if address != winner]
+      self._entries[(host, port)] = (addresses, entry[1])
+
+def _interleave_families(addresses: list[AddressInfo]) -> list[AddressInfo]:
+  """
+  Alternate address families, starting with the first one listed, so a broken
+  family delays connecting by at most one stagger
+  """
+  first_family = addresses[0][0] if len(addresses) > 0 else None
+  preferred = [address for address in addresses if address[0] == first_family]
+  others = [address for address in addresses if address[0] != first_family]
+  interleaved: list[AddressInfo] = []
+  for index in range(max(len(preferred), len(others))):
+    interleaved.extend(preferred[index:index + 1])
+    interleaved.extend(others[index:index + 1])
+  return interleaved
+
+def _race_connections(
+    addresses: list[AddressInfo],
+    timeout_sec: Optional[float],
+    stagger_sec: float
+  ) -> tuple[socket.socket, AddressInfo]:
+  if len(addresses) == 0:
+    raise OSError('Host name resolved to no addresses')
+
+  deadline = None if timeout_sec is None else time.monotonic() + timeout_sec
+  remaining = list(addresses)
+  attempts: dict[socket.socket, AddressInfo] = {}
+  errors: list[OSError] = []
+  next_attempt_at = time.monotonic()
+
+  with selectors.DefaultSelector() as selector:
+    try:
+      while len(remaining) > 0 or len(attempts) > 0:
+        now = time.monotonic()
+        if len(remaining) > 0 and (len(attempts) == 0 or now >= next_attempt_at):
+          address = remaining.pop(0)
+          sock = _start_connection(address, errors)
+          if sock is not None:
+            attempts[sock] = address
+            selector.register(sock, selectors.EVENT_WRITE)
+            next_attempt_at = now + stagger_sec
+          continue
+
+        wait_sec = None
+        if len(remaining) > 0:
+          wait_sec = max(0.0, next_attempt_at - now)
+        if deadline is not None:
+          if now >= deadline:
+            raise TimeoutError('Timed out connecting')
+          wait_sec = deadline - now if wait_sec is None else min(wait_sec, deadline - now)
+
+        for key, _ in selector.select(wait_sec):
+          sock = key.fileobj
+          selector.unregister(sock)
+          address = attempts.pop(sock)
+          error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+          if error == 0:
+            sock.setblocking(True)
+            return sock, address
+          sock.close()
+          errors.append(OSError(error, os.strerror(error)))
+          LOGGER.debug('Failed connecting to %s: %s', address[4], errors[-1])
+          # Start the next attempt now, rather than waiting out the stagger
+          next_attempt_at = now
+    finally:
+      for sock in attempts:
+        sock.close()
+
+  raise errors[-1]
+
+def _start_connection(address: AddressInfo, errors: list[OSError]) -> Optional[socket.socket]:
+  family, type, proto, _, sockaddr = address
+  sock = socket.socket(family, type, proto)
+  try:
+    sock.setblocking(False)
+    error = sock.connect_ex(sockaddr)
+  except OSError as ex:
+    sock.close()
+    errors.append(ex)
+    return None
+  if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+    sock.close()
+    errors.append(OSError(error, os.strerror(error)))
+    return None
+  return sock
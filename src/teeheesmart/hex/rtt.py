@@ -0,0 +1,121 @@
+import threading
+
+from typing import Optional
+
+class RttEstimator:
+  """
+  Derives the timeout for device replies from the round-trip times observed,
+  as TCP derives its retransmission timeout (RFC 6298).
+
+  A smoothed round-trip time and its mean deviation are updated with each reply,
+  and the timeout set to the former plus four times the latter, within
+  `min_timeout_sec` and `max_timeout_sec`. An expected reply that times out
+  doubles the timeout, so a device that has slowed is soon waited on long enough.
+  """
+  DEFAULT_INITIAL_TIMEOUT_SEC: float = 0.250
+  DEFAULT_MIN_TIMEOUT_SEC: float = 0.050
+  DEFAULT_MAX_TIMEOUT_SEC: float = 2.0
+  # Weights of each new sample in the smoothed round-trip time and its deviation
+  _ALPHA: float = 1 / 8
+  _BETA: float = 1 / 4
+  # Deviations from the smoothed round-trip time allowed before timing out
+  _K: int = 4
+
+  _registry: dict[tuple[str, int], 'RttEstimator'] = {}
+  _registry_lock = threading.Lock()
+
+  def __init__(
+      self,
+      initial_timeout_sec: float = DEFAULT_INITIAL_TIMEOUT_SEC,
+      min_timeout_sec: float = DEFAULT_MIN_TIMEOUT_SEC,
+      max_timeout_sec: float = DEFAULT_MAX_TIMEOUT_SEC
+    ):
+    """
+    Args:
+      initial_timeout_sec (float): Timeout until a round trip has been measured.
+      min_timeout_sec (float): Floor of the timeout, allowing for devices that
+        occasionally take longer than their usual round trip.
+      max_timeout_sec (float): Ceiling of the timeout.
+    """
+    if min_timeout_sec <= 0 or max_timeout_sec < min_timeout_sec:
+      raise ValueError(
+        'Timeouts must satisfy 0 < min_timeout_sec <= max_timeout_sec. '
+        f'Received: {min_timeout_sec}, {max_timeout_sec}'
+      )
+    self._min_timeout_sec = min_timeout_sec
+    self._max_timeout_sec = max_timeout_sec
+
+    self._lock = threading.Lock()
+    self._smoothed_rtt_sec: Optional[float] = None
+    self._rtt_deviation_sec = 0.0
+    self._timeout_sec = self._clamp(initial_timeout_sec)
+
+  @classmethod
+  def for_endpoint(
+      cls,
+      host: str,
+      port: int,
+      initial_timeout_sec: float = DEFAULT_INITIAL_TIMEOUT_SEC
+    ) -> 'RttEstimator':
+    """
+    Return the estimator shared by everything communicating with `host` and
+    `port`, creating it with `initial_timeout_sec` and otherwise default settings
+    if there is none
+    """
+    with cls._registry_lock:
+      estimator = cls._registry.get((host, port))
+      if estimator is None:
+        estimator = cls._registry[(host, port)] = cls(initial_timeout_sec)
+      return estimator
+
+  @property
+  def timeout_sec(self) -> float:
+    return self._timeout_sec
+
+  @property
+  def smoothed_rtt_sec(self) -> Optional[float]:
+    """
+    Smoothed round-trip time, or None until one has been measured
+    """
+    return self._smoothed_rtt_sec
+
+  @property
+  def min_timeout_sec(self) -> float:
+    return self._min_timeout_sec
+
+  @property
+  def max_timeout_sec(self) -> float:
+    return self._max_timeout_sec
+
+  def record_rtt(self, rtt_sec: float) -> None:
+    """
+    Update the estimate with the time between sending an instruction and its
+    reply arriving
+    """
+    with self._lock:
+      if self._smoothed_rtt_sec is None:
+        self._smoothed_rtt_sec = rtt_sec
+        self._rtt_deviation_sec = rtt_sec / 2
+      else:
+        self._rtt_deviation_sec += \
+          self._BETA * (abs(self._smoothed_rtt_sec - rtt_sec) - self._rtt_deviation_sec)
+        self._smoothed_rtt_sec += self._ALPHA * (rtt_sec - self._smoothed_rtt_sec)
+      self._timeout_sec = self._clamp(
+        self._smoothed_rtt_sec + self._K * self._rtt_deviation_sec
+      )
+
+  def record_timeout(self) -> None:
+    """
+    Back off after a reply that always arrives did not arrive in time
+    """
+    with self._lock:
+      self._timeout_sec = self._clamp(self._timeout_sec * 2)
+
+  def _clamp(self, timeout_sec: float) -> float:
+    return min(max(timeout_sec, self._min_timeout_sec), self._max_timeout_sec)
+
+  def __repr__(self) -> str:
+    return (
+      f'RttEstimator(timeout_sec={self.timeout_sec:.3f}, '
+      f'smoothed_rtt_sec={self.smoothed_rtt_sec})'
+    )
@@ -0,0 +1,144 @@
+import itertools
+import queue
+import threading
+
+from concurrent.futures import Future
+from enum import IntEnum, unique
+from typing import Optional
+
+from ..constants import LOGGER
+from .io import Instruction, TcpDevice
+
+@unique
+class Priority(IntEnum):
+  """
+  Order in which queued device work is performed; lower values go first
+  """
+  # User-initiated commands, such as selecting an input
+  INTERACTIVE = 0
+  NORMAL = 1
+  # Periodic polling
+  BACKGROUND = 2
+
+# Queued after all other work, so pending commands finish before the worker stops
+_STOP_PRIORITY = max(Priority) + 1
+
+class DeviceWorker:
+  """
+  Serializes all I/O for one device (host and port) through a priority queue
+  processed by a single background thread.
+
+  Interactive commands queued while background polls are waiting are sent first,
+  so they are delayed by at most the command already in progress. Use
+  `for_device` to share one worker among everything talking to the same device.
+
+  A shared worker communicates using the device it was created with, keeping that
+  device's options, and closes it once every reference has been released; the
+  devices passed when obtaining an existing worker are not used.
+  """
+  _registry: dict[tuple[str, int], 'DeviceWorker'] = {}
+  _registry_lock = threading.Lock()
+
+  def __init__(self, device: TcpDevice):
+    self._device = device
+    self._queue: queue.PriorityQueue = queue.PriorityQueue()
+    # Tie-breaker keeping equal-priority work in submission order
+    self._sequence = itertools.count()
+    self._lock = threading.Lock()
+    self._thread: Optional[threading.Thread] = None
+    self._ref_count = 0
+
+  @classmethod
+  def for_device(cls, device: TcpDevice) -> 'DeviceWorker':
+    """
+    Return the worker for the device's host and port, creating it using `device`
+    if there is none, in which case the worker takes ownership of `device`. Call
+    `release` when done with it.
+    """
+    key = cls._key(device)
+    with cls._registry_lock:
+      worker = cls._registry.get(key)
+      if worker is None:
+        worker = cls._registry[key] = cls(device)
+      worker._ref_count += 1
+      return worker
+
+  @property
+  def device(self) -> TcpDevice:
+    return self._device
+
+  def submit(
+      self,
+      instructions: list[Instruction] | Instruction,
+      priority: Priority = Priority.NORMAL
+    ) -> 'Future[list[Instruction]]':
+    future: Future = Future()
+    with self._lock:
+      self._ensure_started()
+      self._queue.put((priority, next(self._sequence), instructions, future))
+    return future
+
+  def process(
+      self,
+      instructions: list[Instruction] | Instruction,
+      priority: Priority = Priority.NORMAL
+    ) -> list[Instruction]:
+    """
+    Queue instructions and wait for their results
+    """
+    return self.submit(instructions, priority).result()
+
+  def release(self) -> None:
+    """
+    Give up a reference obtained from `for_device`, stopping the worker and
+    closing its device once none remain
+    """
+    key = self._key(self._device)
+    with DeviceWorker._registry_lock:
+      self._ref_count -= 1
+      if self._ref_count > 0:
+        return
+      if DeviceWorker._registry.get(key) is self:
+        del DeviceWorker._registry[key]
+    self.stop()
+    self._device.close()
+
+  def stop(self) -> None:
+    """
+    Finish queued work, then stop the background thread
+    """
+    with self._lock:
+      thread = self._thread
+      if thread is None:
+        return
+      self._queue.put((_STOP_PRIORITY, next(self._sequence), None, None))
+      self._thread = None
+    if thread is not threading.current_thread():
+      thread.join()
+
+  @staticmethod
+  def _key(device: TcpDevice) -> tuple[str, int]:
+    return (device.endpoint.host, device.endpoint.port)
+
+  def _ensure_started(self) -> None:
+    if self._thread is None:
+      endpoint = self._device.endpoint
+      self._thread = threading.Thread(
+        target = self._run,
+        name = f'teeheesmart-worker-{endpoint.host}:{endpoint.port}',
+        daemon = True,
+      )
+      self._thread.start()
+
+  def _run(self) -> None:
+    while True:
+      _, _, instructions, future = self._queue.get()
+      if future is None:
+        return
+      if not future.set_running_or_notify_cancel():
+        continue
+      try:
+        future.set_result(self._device.process(instructions))
+      except BaseException as ex:
+        LOGGER.error('Failed processing queued instructions: %s', ex)
+        future.set_exception(ex)
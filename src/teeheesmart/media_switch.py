@@ -1,4 +1,4 @@
-from typing import Protocol
+from typing import Optional, Protocol
 
 class MediaSwitch(Protocol):
   """
@@ -33,12 +33,106 @@ class MediaSwitch(Protocol):
     Refresh device state.
     """
 
+  def start_listening(self) -> None:
+    """
+    Track state changes reported by the device as they happen, rather than only
+    on `update`
+    """
+
+  def stop_listening(self) -> None:
+    """
+    Stop tracking state changes reported by the device
+    """
+
+  def close(self) -> None:
+    """
+    Release any resources, such as open connections, held for the device
+    """
+
   @property
   def selected_source(self) -> int:
     """
     Returns the input number of the selected source
     """
 
+  @property
+  def selected_source_updated_at(self) -> Optional[float]:
+    """
+    Returns the monotonic time the device last reported the selected source, or
+    None if it has not
+    """
+
+  @property
+  def input_count(self) -> int:
+    """
+    Returns the number of inputs the switch has
+    """
+
+  @property
+  def output_count(self) -> int:
+    """
+    Returns the number of outputs the switch has
+    """
+
+class AsyncMediaSwitch(Protocol):
+  """
+  asyncio counterpart of `MediaSwitch`, whose device operations are coroutines
+  """
+
+  async def select_source(self, input: int) -> None:
+    """
+    Select the specified video input
+    """
+
+  async def set_buzzer_muting(self, mute_buzzer: bool) -> None:
+    """
+    Enable or disable the buzzer
+    """
+
+  async def set_led_timeout_seconds(self, led_timeout_seconds: int) -> None:
+    """
+    Set the LED timeout
+    """
+
+  async def set_auto_input_detection(self, enable_auto_input_detection: bool) -> None:
+    """
+    Enable or disable input auto-detection
+    """
+
+  async def update(self) -> None:
+    """
+    Refresh device state.
+    """
+
+  def start_listening(self) -> None:
+    """
+    Track state changes reported by the device as they happen, rather than only
+    on `update`
+    """
+
+  async def stop_listening(self) -> None:
+    """
+    Stop tracking state changes reported by the device
+    """
+
+  async def close(self) -> None:
+    """
+    Release any resources, such as open connections, held for the device
+    """
+
+  @property
+  def selected_source(self) -> int:
+    """
+    Returns the input number of the selected source
+    """
+
+  @property
+  def selected_source_updated_at(self) -> Optional[float]:
+    """
+    Returns the monotonic time the device last reported the selected source, or
+    None if it has not
+    """
+
   @property
   def input_count(self) -> int:
     """
@@ -0,0 +1,156 @@
+import threading
+
+from typing import Callable, Optional
+
+from .constants import LOGGER
+from .media_switch import MediaSwitch
+from .url_parser import Endpoint, parse_url
+
+# Identifies a device independently of how its URL was written
+RegistryKey = tuple[str, str, Optional[int], str]
+
+def registry_key(endpoint: Endpoint) -> RegistryKey:
+  """
+  Normalize an endpoint for comparison: names are case-insensitive and options
+  do not identify the device
+  """
+  return (
+    endpoint.scheme.lower(),
+    endpoint.host.lower(),
+    endpoint.port,
+    endpoint.protocol.lower(),
+  )
+
+class _Entry:
+  def __init__(self):
+    # Held while the switch is created, so concurrent callers wait for it rather
+    # than connecting and probing the device again
+    self.lock = threading.Lock()
+    self.media_switch: Optional[MediaSwitch] = None
+    self.ref_count = 0
+
+class SwitchRegistry:
+  """
+  Shares one media switch among everything in the process controlling the same
+  device, so each device has one set of connections and is only probed once.
+
+  `acquire` returns a `SharedMediaSwitch` handle; the underlying switch is closed
+  once every handle has been closed.
+  """
+  _default: Optional['SwitchRegistry'] = None
+  _default_lock = threading.Lock()
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._entries: dict[RegistryKey, _Entry] = {}
+
+  @classmethod
+  def default(cls) -> 'SwitchRegistry':
+    """
+    Return the process-wide registry used by `get_media_switch`
+    """
+    with cls._default_lock:
+      if cls._default is None:
+        cls._default = cls()
+      return cls._default
+
+  def __len__(self) -> int:
+    with self._lock:
+      return len(self._entries)
+
+  def __contains__(self, url: str) -> bool:
+    with self._lock:
+      return registry_key(parse_url(url)) in self._entries
+
+  def acquire(self, url: str, factory: Callable[[str], MediaSwitch]) -> 'SharedMediaSwitch':
+    """
+    Return a handle to the switch for `url`, creating it with `factory` if no
+    handle to it is open.
+
+    The switch keeps the options it was created with; those requested when
+    acquiring an existing switch are ignored.
+
+    Raises:
+      Exception: Whatever `factory` raises, in which case nothing is registered.
+    """
+    key = registry_key(parse_url(url))
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        entry = self._entries[key] = _Entry()
+      entry.ref_count += 1
+
+    try:
+      with entry.lock:
+        if entry.media_switch is None:
+          entry.media_switch = factory(url)
+    except BaseException:
+      self._release(key, entry)
+      raise
+    return SharedMediaSwitch(self, key, entry)
+
+  def _release(self, key: RegistryKey, entry: _Entry) -> None:
+    with self._lock:
+      entry.ref_count -= 1
+      if entry.ref_count > 0:
+        return
+      if self._entries.get(key) is entry:
+        del self._entries[key]
+
+    with entry.lock:
+      media_switch = entry.media_switch
+      entry.media_switch = None
+    if media_switch is not None:
+      LOGGER.debug('Closing shared media switch for %s:%s', key[1], key[2])
+      media_switch.close()
+
+class SharedMediaSwitch:
+  """
+  Handle to a media switch shared through a `SwitchRegistry`.
+
+  Behaves as the switch itself, except that `close` gives up this handle, closing
+  the switch only once no other handles remain. The switch's state, listening and
+  settings are shared by all handles.
+  """
+
+  def __init__(self, registry: SwitchRegistry, key: RegistryKey, entry: _Entry):
+    self._registry = registry
+    self._key = key
+    self._entry: Optional[_Entry] = entry
+    self._media_switch = entry.media_switch
+
+  @property
+  def closed(self) -> bool:
+    return self._entry is None
+
+  @property
+  def media_switch(self) -> MediaSwitch:
+    """
+    The underlying switch, shared with other handles
+    """
+    if self._entry is None:
+      raise RuntimeError('Shared media switch has been closed')
+    return self._media_switch
+
+  def close(self) -> None:
+    """
+    Give up this handle; further calls have no effect
+    """
+    entry, self._entry = self._entry, None
+    if entry is not None:
+      self._registry._release(self._key, entry)
+
+  def __getattr__(self, name: str):
+    if name.startswith('_'):
+      raise AttributeError(name)
+    return getattr(self.media_switch, name)
+
+  def __enter__(self) -> 'SharedMediaSwitch':
+    return self
+
+  def __exit__(self, *_) -> None:
+    self.close()
+
+  def __repr__(self) -> str:
+    state = 'closed' if self.closed else 'open'
+    return f'SharedMediaSwitch({self._key[1]}:{self._key[2]}, {state})'
@@ -1,5 +1,5 @@
 from typing import Optional
-from urllib.parse import urlparse
+from urllib.parse import parse_qsl, urlparse
 
 from .constants import PROTOCOL_HEX, SCHEME_TCP
 
@@ -18,7 +18,8 @@ class Endpoint:
       scheme: Optional[str] = None,
       host: Optional[str] = None,
       port:Optional[int] = None,
-      protocol: Optional[str] = None
+      protocol: Optional[str] = None,
+      options: Optional[dict[str, str]] = None
     ):
     if _is_empty(scheme):
       self._scheme = _DEFAULT_SCHEME
@@ -40,6 +41,11 @@ class Endpoint:
     else:
       self._protocol = protocol
 
+    if options is None:
+      self._options = {}
+    else:
+      self._options = dict(options)
+
   @property
   def scheme(self):
     return self._scheme
@@ -56,6 +62,10 @@ class Endpoint:
   def protocol(self):
     return self._protocol
 
+  @property
+  def options(self) -> dict[str, str]:
+    return dict(self._options)
+
   def _default_port(self, scheme: str) -> Optional[int]:
     if scheme == SCHEME_TCP:
       return _DEFAULT_PORT_TCP
@@ -71,6 +81,7 @@ def parse_url(url: str) -> Endpoint:
     scheme = parsed_url.scheme,
     host = parsed_url.hostname,
     port = parsed_url.port,
-    protocol = parsed_url.fragment
+    protocol = parsed_url.fragment,
+    options = dict(parse_qsl(parsed_url.query))
   )
   return endpoint
@@ -0,0 +1,163 @@
+import pytest
+import socket
+import threading
+import time
+
+from teeheesmart import CircuitOpenError
+from teeheesmart.fleet import SwitchFleet
+from teeheesmart.hex.emulator import EmulatorPool
+from teeheesmart.hex.io import Command, ResponsePolicy
+
+class StubSwitch:
+  def __init__(self, selected_source: int = 1, input_count: int = 16, delay_sec: float = 0):
+    self.selected_source = selected_source
+    self.selected_source_updated_at = time.monotonic()
+    self.input_count = input_count
+    self.output_count = 1
+    self.delay_sec = delay_sec
+    self.replies = True
+    self.update_count = 0
+    self.close_count = 0
+
+  def update(self) -> None:
+    time.sleep(self.delay_sec)
+    self.update_count += 1
+    if self.replies:
+      self.selected_source_updated_at = time.monotonic()
+
+  def close(self) -> None:
+    self.close_count += 1
+
+class TestSwitchFleet:
+  def test_poll_returns_state_of_each_switch(self):
+    switches = {
+      'switch1.local': StubSwitch(selected_source = 3, input_count = 8),
+      'switch2.local': StubSwitch(selected_source = 5, input_count = 16),
+    }
+    sut = SwitchFleet(switches.keys(), switch_factory = switches.get)
+
+    result = sut.poll()
+
+    assert result.ok
+    assert result.states['switch1.local'].selected_source == 3
+    assert result.states['switch1.local'].input_count == 8
+    assert result.states['switch2.local'].selected_source == 5
+    assert result.states['switch2.local'].input_count == 16
+
+  def test_poll_reuses_switches_after_first_poll(self):
+    switch = StubSwitch()
+    created_count = 0
+    def factory(url):
+      nonlocal created_count
+      created_count += 1
+      return switch
+    sut = SwitchFleet(['switch.local'], switch_factory = factory)
+
+    sut.poll()
+    sut.poll()
+
+    assert created_count == 1
+    assert switch.update_count == 1
+
+  def test_poll_reports_per_device_errors(self):
+    error = ConnectionRefusedError()
+    def factory(url):
+      if url == 'dead.local':
+        raise error
+      return StubSwitch()
+    sut = SwitchFleet(['alive.local', 'dead.local'], switch_factory = factory)
+
+    result = sut.poll()
+
+    assert not result.ok
+    assert list(result.states.keys()) == ['alive.local']
+    assert result.errors == {'dead.local': error}
+
+  def test_poll_reports_switch_that_stops_replying(self):
+    switch = StubSwitch()
+    sut = SwitchFleet(['switch.local'], switch_factory = lambda _: switch)
+    sut.poll()
+    switch.replies = False
+
+    result = sut.poll()
+
+    assert not result.ok
+    assert result.states == {}
+    assert isinstance(result.errors['switch.local'], TimeoutError)
+
+  def test_poll_reports_emulated_switch_that_never_replies(self):
+    policies = {Command.QUERY_ACTIVE_INPUT: ResponsePolicy.NEVER_REPLIES}
+    with EmulatorPool(input_count = 4, response_policies = policies) as pool:
+      url = f'{pool.urls[0]}?inputs=4'
+      sut = SwitchFleet([url], timeout_sec = 0.05)
+
+      results = [sut.poll(), sut.poll()]
+      sut.close()
+
+    for result in results:
+      assert result.states == {}
+      assert isinstance(result.errors[url], TimeoutError)
+
+  def test_poll_queries_switches_concurrently(self):
+    delay_sec = 0.1
+    urls = [f'switch{i}.local' for i in range(8)]
+    switches = {url: StubSwitch(delay_sec = delay_sec) for url in urls}
+    sut = SwitchFleet(urls, max_concurrency = len(urls), switch_factory = switches.get)
+    sut.poll()
+
+    start = time.monotonic()
+    sut.poll()
+    elapsed = time.monotonic() - start
+
+    assert elapsed < delay_sec * len(urls) / 2
+
+  def test_poll_limits_concurrency(self):
+    max_concurrency = 2
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+    def factory(url):
+      nonlocal active, peak
+      with lock:
+        active += 1
+        peak = max(peak, active)
+      time.sleep(0.02)
+      with lock:
+        active -= 1
+      return StubSwitch()
+    urls = [f'switch{i}.local' for i in range(6)]
+    sut = SwitchFleet(urls, max_concurrency = max_concurrency, switch_factory = factory)
+
+    sut.poll()
+
+    assert peak == max_concurrency
+
+  def test_ignores_duplicate_urls(self):
+    sut = SwitchFleet(['a.local', 'b.local', 'a.local'], switch_factory = lambda _: StubSwitch())
+
+    assert sut.urls == ['a.local', 'b.local']
+
+  def test_rejects_invalid_concurrency(self):
+    with pytest.raises(ValueError):
+      SwitchFleet(['a.local'], max_concurrency = 0)
+
+  def test_close_closes_created_switches(self):
+    switch = StubSwitch()
+    sut = SwitchFleet(['switch.local'], switch_factory = lambda _: switch)
+    sut.poll()
+
+    sut.close()
+
+    assert switch.close_count == 1
+    assert sut.switches == {}
+
+  def test_poll_fails_fast_for_unreachable_switches(self):
+    # Nothing listens on a port just released by the OS
+    with socket.create_server(('127.0.0.1', 0)) as server:
+      url = f'127.0.0.1:{server.getsockname()[1]}'
+    sut = SwitchFleet([url])
+
+    results = [sut.poll() for _ in range(4)]
+
+    assert isinstance(results[0].errors[url], ConnectionRefusedError)
+    assert isinstance(results[-1].errors[url], CircuitOpenError)
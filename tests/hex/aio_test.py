@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import pytest
+
+from teeheesmart.hex.aio import AsyncTcpDevice
+from teeheesmart.hex.io import Codec, Command, Instruction, TcpEndpoint
+
+from fakes import FakeStreamReader, FakeStreamWriter
+
+class TestAsyncTcpDevice:
+  def test_opens_connection_using_specified_endpoint_details(self, monkeypatch: pytest.MonkeyPatch):
+    expected_host = '10.0.0.1'
+    expected_port = 1337
+    captured = None
+    async def capture_open_connection(host, port):
+      nonlocal captured
+      captured = (host, port)
+      return (FakeStreamReader(), FakeStreamWriter())
+    monkeypatch.setattr(asyncio, 'open_connection', capture_open_connection)
+    sut = AsyncTcpDevice(TcpEndpoint(expected_host, expected_port))
+
+    asyncio.run(sut.process(Instruction(Command.QUERY_ACTIVE_INPUT)))
+
+    assert captured == (expected_host, expected_port)
+
+  def test_process_dispatches_multiple_instructions(self, monkeypatch: pytest.MonkeyPatch):
+    instructions = [
+      Instruction(Command.QUERY_ACTIVE_INPUT),
+      Instruction(Command.SWITCH_VIDEO, 1),
+    ]
+    (_, writer) = self.stub_streams(monkeypatch)
+    sut = self.create_device()
+
+    asyncio.run(sut.process(instructions))
+
+    assert writer.request_bytes == [Codec.encode(i) for i in instructions]
+
+  def test_process_returns_response_instructions(self, monkeypatch: pytest.MonkeyPatch):
+    (reader, _) = self.stub_streams(monkeypatch)
+    reader.response_bytes = b'\xAA\xBB\x03\x11\x05\xEE'
+    sut = self.create_device()
+
+    results = asyncio.run(sut.process(Instruction(Command.QUERY_ACTIVE_INPUT)))
+
+    assert results == [Instruction(Command.CURRENT_ACTIVE_INPUT, 5)]
+
+  def test_process_continues_without_erroring_when_no_response_received(
+      self,
+      caplog: pytest.LogCaptureFixture,
+      monkeypatch: pytest.MonkeyPatch
+    ):
+    caplog.set_level(logging.INFO)
+    (reader, writer) = self.stub_streams(monkeypatch)
+    reader.should_timeout = True
+    sut = self.create_device()
+
+    results = asyncio.run(sut.process([
+      Instruction(Command.QUERY_ACTIVE_INPUT),
+      Instruction(Command.SWITCH_VIDEO, 2),
+    ]))
+
+    assert 'Timed out' in caplog.text
+    assert len(writer.request_bytes) == 2
+    assert len(results) == 0
+
+  def test_process_does_not_wait_for_commands_that_never_reply(self, monkeypatch: pytest.MonkeyPatch):
+    (reader, writer) = self.stub_streams(monkeypatch)
+    sut = self.create_device()
+
+    results = asyncio.run(sut.process(Instruction(Command.MUTE_BUZZER, 1)))
+
+    assert len(writer.request_bytes) == 1
+    assert reader.read_count == 0
+    assert results == []
+
+  def test_process_returns_null_response_when_connection_closed(self, monkeypatch: pytest.MonkeyPatch):
+    (reader, _) = self.stub_streams(monkeypatch)
+    reader.eof = True
+    sut = self.create_device()
+
+    results = asyncio.run(sut.process(Instruction(Command.QUERY_ACTIVE_INPUT)))
+
+    assert results == [Instruction(Command.NULL_RESPONSE)]
+
+  def test_process_closes_connection_when_complete(self, monkeypatch: pytest.MonkeyPatch):
+    (_, writer) = self.stub_streams(monkeypatch)
+    sut = self.create_device()
+
+    asyncio.run(sut.process(Instruction(Command.QUERY_ACTIVE_INPUT)))
+
+    assert writer.was_closed
+
+  def test_persistent_process_reuses_connection_until_closed(self, monkeypatch: pytest.MonkeyPatch):
+    open_count = 0
+    writer = FakeStreamWriter()
+    async def open_connection(*_):
+      nonlocal open_count
+      open_count += 1
+      return (FakeStreamReader(), writer)
+    monkeypatch.setattr(asyncio, 'open_connection', open_connection)
+    sut = self.create_device(persistent = True)
+    instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+
+    async def exercise():
+      await sut.process(instruction)
+      await sut.process(instruction)
+      was_closed = writer.was_closed
+      await sut.close()
+      return was_closed
+
+    was_closed_before_close = asyncio.run(exercise())
+
+    assert open_count == 1
+    assert not was_closed_before_close
+    assert writer.was_closed
+
+  def test_persistent_process_returns_frames_received_while_idle_ahead_of_replies(
+      self,
+      monkeypatch: pytest.MonkeyPatch
+    ):
+    (reader, _) = self.stub_streams(monkeypatch)
+    sut = self.create_device(persistent = True)
+    instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+
+    async def exercise():
+      await sut.process(instruction)
+      reader.pending_bytes = bytearray(b'\xAA\xBB\x03\x11\x02\xEE')
+      return await sut.process(instruction)
+
+    results = asyncio.run(exercise())
+
+    assert results == [
+      Instruction(Command.CURRENT_ACTIVE_INPUT, 2),
+      Instruction(Command.CURRENT_ACTIVE_INPUT, 0),
+    ]
+
+  def stub_streams(self, patch: pytest.MonkeyPatch) -> tuple[FakeStreamReader, FakeStreamWriter]:
+    reader = FakeStreamReader()
+    writer = FakeStreamWriter()
+    async def open_connection(*_):
+      return (reader, writer)
+    patch.setattr(asyncio, 'open_connection', open_connection)
+    return (reader, writer)
+
+  def create_device(self, endpoint: TcpEndpoint = TcpEndpoint('localhost'), **kwargs):
+    return AsyncTcpDevice(endpoint, **kwargs)
@@ -0,0 +1,119 @@
+import pytest
+
+from teeheesmart.hex.breaker import CircuitBreaker, CircuitOpenError, CircuitState
+
+class FakeClock:
+  def __init__(self):
+    self.now = 100.0
+
+  def __call__(self) -> float:
+    return self.now
+
+class TestCircuitBreaker:
+  def test_stays_closed_below_failure_threshold(self):
+    sut = CircuitBreaker(failure_threshold = 3)
+
+    sut.record_failure()
+    sut.record_failure()
+    sut.check()
+
+    assert sut.state == CircuitState.CLOSED
+
+  def test_success_resets_consecutive_failures(self):
+    sut = CircuitBreaker(failure_threshold = 2)
+
+    sut.record_failure()
+    sut.record_success()
+    sut.record_failure()
+
+    assert sut.state == CircuitState.CLOSED
+
+  def test_opens_at_failure_threshold_and_fails_fast(self):
+    sut = self.open_breaker(FakeClock())
+
+    with pytest.raises(CircuitOpenError):
+      sut.check()
+
+    assert sut.state == CircuitState.OPEN
+
+  def test_allows_single_probe_after_cooldown(self):
+    clock = FakeClock()
+    sut = self.open_breaker(clock)
+    clock.now += 1.0
+
+    sut.check()
+
+    assert sut.state == CircuitState.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+      sut.check()
+
+  def test_successful_probe_closes_circuit(self):
+    clock = FakeClock()
+    sut = self.open_breaker(clock)
+    clock.now += 1.0
+    sut.check()
+
+    sut.record_success()
+
+    assert sut.state == CircuitState.CLOSED
+    assert sut.cooldown_sec == 1.0
+
+  def test_failed_probe_reopens_with_doubled_cooldown(self):
+    clock = FakeClock()
+    sut = self.open_breaker(clock)
+    clock.now += 1.0
+    sut.check()
+
+    sut.record_failure()
+    clock.now += 1.5
+
+    assert sut.state == CircuitState.OPEN
+    assert sut.cooldown_sec == 2.0
+    with pytest.raises(CircuitOpenError):
+      sut.check()
+
+  def test_probe_without_outcome_counts_as_failed_after_cooldown(self):
+    clock = FakeClock()
+    sut = self.open_breaker(clock)
+    clock.now += 1.0
+    sut.check()
+
+    clock.now += 1.0
+    with pytest.raises(CircuitOpenError):
+      sut.check()
+    state_after_abandoned_probe = sut.state
+    clock.now += 2.0
+    sut.check()
+
+    assert state_after_abandoned_probe == CircuitState.OPEN
+    assert sut.cooldown_sec == 2.0
+    assert sut.state == CircuitState.HALF_OPEN
+
+  def test_cooldown_is_capped(self):
+    clock = FakeClock()
+    sut = self.open_breaker(clock, max_cooldown_sec = 3.0)
+
+    for _ in range(4):
+      clock.now += sut.cooldown_sec
+      sut.check()
+      sut.record_failure()
+
+    assert sut.cooldown_sec == 3.0
+
+  def test_for_endpoint_shares_breaker_per_host_and_port(self):
+    result = CircuitBreaker.for_endpoint('10.0.0.1', 5000)
+
+    assert result is CircuitBreaker.for_endpoint('10.0.0.1', 5000)
+    assert result is not CircuitBreaker.for_endpoint('10.0.0.1', 5001)
+
+  def test_rejects_invalid_settings(self):
+    with pytest.raises(ValueError):
+      CircuitBreaker(failure_threshold = 0)
+    with pytest.raises(ValueError):
+      CircuitBreaker(base_cooldown_sec = 10.0, max_cooldown_sec = 1.0)
+
+  def open_breaker(self, clock: FakeClock, **kwargs) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold = 2, base_cooldown_sec = 1.0, clock = clock, **kwargs)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
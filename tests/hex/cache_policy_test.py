@@ -0,0 +1,19 @@
+import pytest
+
+from teeheesmart.hex.cache_policy import CachePolicy
+
+class TestCachePolicy:
+  def test_is_fresh_within_max_age(self):
+    sut = CachePolicy(max_age_sec = 1.0)
+
+    assert sut.is_fresh(0.5)
+    assert sut.is_fresh(1.0)
+
+  def test_is_not_fresh_beyond_max_age(self):
+    sut = CachePolicy(max_age_sec = 1.0)
+
+    assert not sut.is_fresh(1.5)
+
+  def test_rejects_negative_max_age(self):
+    with pytest.raises(ValueError):
+      CachePolicy(max_age_sec = -1)
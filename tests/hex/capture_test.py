@@ -0,0 +1,194 @@
+import pytest
+import socket
+import time
+
+from teeheesmart import get_media_switch
+from teeheesmart.hex.capture import \
+  CaptureRecord, CaptureRecorder, Direction, ReplayDevice, read_capture
+from teeheesmart.hex.emulator import EmulatorPool
+from teeheesmart.hex.io import Codec, Command, Instruction, TcpDevice, TcpEndpoint
+from teeheesmart.hex.media_switch import MediaSwitch
+
+from fakes import FakeSocket
+
+_QUERY = Codec.encode(Instruction(Command.QUERY_ACTIVE_INPUT))
+_REPLY = Codec.encode(Instruction(Command.CURRENT_ACTIVE_INPUT, 2))
+
+class TestCaptureRecorder:
+  def test_records_are_read_back_in_order(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+
+    with CaptureRecorder(path) as sut:
+      sut.record_connected(TcpEndpoint('10.0.0.1', 1337))
+      sut.record_sent(_QUERY)
+      sut.record_received(memoryview(_REPLY))
+
+    result = list(read_capture(path))
+    assert [(record.direction, record.data) for record in result] == [
+      (Direction.CONNECTED, b'10.0.0.1:1337'),
+      (Direction.SENT, _QUERY),
+      (Direction.RECEIVED, _REPLY),
+    ]
+    assert result[0].timestamp_ns <= result[1].timestamp_ns <= result[2].timestamp_ns
+
+  def test_appends_to_existing_capture(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    with CaptureRecorder(path) as first:
+      first.record_sent(_QUERY)
+
+    with CaptureRecorder(path) as sut:
+      sut.record_sent(_QUERY)
+
+    assert len(list(read_capture(path))) == 2
+
+  def test_read_ignores_truncated_final_record(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    with CaptureRecorder(path) as sut:
+      sut.record_sent(_QUERY)
+      sut.record_received(_REPLY)
+    path.write_bytes(path.read_bytes()[:-2])
+
+    result = list(read_capture(path))
+
+    assert [record.direction for record in result] == [Direction.SENT]
+
+  def test_read_rejects_other_files(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    path.write_bytes(b'not a capture')
+
+    with pytest.raises(ValueError):
+      list(read_capture(path))
+
+  def test_tcp_device_records_exchanges(self, monkeypatch, tmp_path):
+    fake_socket = FakeSocket()
+    fake_socket.response_bytes = _REPLY
+    monkeypatch.setattr(socket, 'create_connection', lambda *_: fake_socket)
+    path = tmp_path / 'capture.bin'
+    device = TcpDevice(TcpEndpoint('10.0.0.1'), recorder = CaptureRecorder(path))
+
+    device.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+    device.close()
+
+    assert [(record.direction, record.data) for record in read_capture(path)] == [
+      (Direction.CONNECTED, b'10.0.0.1:5000'),
+      (Direction.SENT, _QUERY),
+      (Direction.RECEIVED, _REPLY),
+    ]
+
+class TestReplayDevice:
+  def test_process_returns_captured_replies(self):
+    sut = ReplayDevice(gen_records(), speed = None)
+
+    result = sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 2)]
+    assert sut.endpoint.host == '10.0.0.1'
+    assert sut.endpoint.port == 1337
+
+  def test_process_raises_when_capture_is_exhausted(self):
+    sut = ReplayDevice(gen_records(), speed = None)
+    sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    with pytest.raises(EOFError):
+      sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+  def test_process_replays_connection_closed_as_null_response(self):
+    records = [CaptureRecord(Direction.SENT, 0, _QUERY), CaptureRecord(Direction.RECEIVED, 1, b'')]
+    sut = ReplayDevice(records, speed = None)
+
+    result = sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert result == [Instruction(Command.NULL_RESPONSE)]
+
+  def test_process_splits_pipelined_batches(self):
+    batch = Codec.encode_many([Instruction(Command.MUTE_BUZZER, 1), Instruction(Command.QUERY_ACTIVE_INPUT)])
+    records = [CaptureRecord(Direction.SENT, 0, batch), CaptureRecord(Direction.RECEIVED, 1, _REPLY)]
+    sut = ReplayDevice(records, speed = None)
+
+    result = sut.process([Instruction(Command.MUTE_BUZZER, 1), Instruction(Command.QUERY_ACTIVE_INPUT)])
+
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 2)]
+    assert sut.remaining_record_count == 0
+
+  def test_process_skips_fence_sent_after_instruction(self):
+    select = Instruction(Command.SWITCH_VIDEO, 3)
+    mute = Instruction(Command.MUTE_BUZZER, 1)
+    records = [
+      CaptureRecord(Direction.SENT, 0, Codec.encode(select) + _QUERY),
+      CaptureRecord(Direction.RECEIVED, 1, _REPLY * 2),
+      CaptureRecord(Direction.SENT, 2, Codec.encode(mute)),
+      CaptureRecord(Direction.SENT, 3, Codec.encode(select) + _QUERY),
+      CaptureRecord(Direction.RECEIVED, 4, _REPLY * 2),
+    ]
+    sut = ReplayDevice(records, speed = None)
+
+    first = sut.process([select, mute])
+    second = sut.process(select)
+
+    assert first == [Instruction(Command.CURRENT_ACTIVE_INPUT, 2)] * 2
+    assert second == [Instruction(Command.CURRENT_ACTIVE_INPUT, 2)] * 2
+    assert sut.remaining_record_count == 0
+
+  def test_speed_scales_original_reply_delay(self):
+    records = [
+      CaptureRecord(Direction.SENT, 0, _QUERY),
+      CaptureRecord(Direction.RECEIVED, 200_000_000, _REPLY),
+    ]
+    sut = ReplayDevice(records, speed = 4.0)
+    started = time.monotonic()
+
+    sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert 0.05 <= time.monotonic() - started < 0.2
+
+  def test_rejects_non_positive_speed(self):
+    with pytest.raises(ValueError):
+      ReplayDevice([], speed = 0)
+
+  def test_media_switch_session_replays_from_capture(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    with EmulatorPool(input_count = 16) as pool:
+      recorded = get_media_switch(pool.urls[0], capture_path = path)
+      recorded.select_source(5)
+      recorded.close()
+
+    replayed = MediaSwitch(ReplayDevice(path, speed = None))
+    replayed.select_source(5)
+
+    assert replayed.input_count == 16
+    assert replayed.selected_source == 5
+
+  def test_fenced_media_switch_session_replays_from_capture(self, tmp_path):
+    path = tmp_path / 'capture.bin'
+    inputs = [3, 1, 4, 2]
+    with EmulatorPool(input_count = 4) as pool:
+      recorded = get_media_switch(
+        pool.urls[0],
+        input_count = 4,
+        capture_path = path,
+        fenced = True,
+      )
+      live = []
+      for input in inputs:
+        recorded.select_source(input)
+        live.append(recorded.selected_source)
+      recorded.close()
+
+    replayed = MediaSwitch(ReplayDevice(path, speed = None), input_count = 4)
+    replay = []
+    for input in inputs:
+      replayed.select_source(input)
+      replay.append(replayed.selected_source)
+
+    assert live == inputs
+    assert replay == inputs
+
+#
+# Helpers
+#
+def gen_records() -> list[CaptureRecord]:
+  return [
+    CaptureRecord(Direction.CONNECTED, 0, b'10.0.0.1:1337'),
+    CaptureRecord(Direction.SENT, 1_000, _QUERY),
+    CaptureRecord(Direction.RECEIVED, 2_000, _REPLY),
+  ]
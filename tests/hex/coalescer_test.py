@@ -0,0 +1,61 @@
+import pytest
+import threading
+import time
+
+from teeheesmart.hex.coalescer import LastWriteWinsCoalescer
+
+class TestLastWriteWinsCoalescer:
+  def test_sends_single_value(self):
+    sent = []
+    sut = LastWriteWinsCoalescer(0, sent.append)
+
+    sut.submit(3)
+
+    assert sent == [3]
+
+  def test_sends_only_last_value_submitted_within_window(self):
+    sent = []
+    sut = LastWriteWinsCoalescer(0.1, sent.append)
+    threads = []
+
+    for value in range(1, 6):
+      thread = threading.Thread(target = sut.submit, args = (value,))
+      thread.start()
+      threads.append(thread)
+      time.sleep(0.005)
+    for thread in threads:
+      thread.join()
+
+    assert sent == [5]
+
+  def test_all_callers_in_window_receive_send_error(self):
+    def fail(_):
+      raise ConnectionError()
+    sut = LastWriteWinsCoalescer(0.05, fail)
+    errors = []
+    def submit(value):
+      try:
+        sut.submit(value)
+      except ConnectionError as ex:
+        errors.append(ex)
+    threads = [threading.Thread(target = submit, args = (value,)) for value in range(3)]
+
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    assert len(errors) == 3
+
+  def test_sends_again_after_window_closes(self):
+    sent = []
+    sut = LastWriteWinsCoalescer(0, sent.append)
+
+    sut.submit(1)
+    sut.submit(2)
+
+    assert sent == [1, 2]
+
+  def test_rejects_negative_window(self):
+    with pytest.raises(ValueError):
+      LastWriteWinsCoalescer(-1, lambda _: None)
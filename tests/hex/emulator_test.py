@@ -0,0 +1,207 @@
+import asyncio
+import random
+import socket
+import time
+
+from teeheesmart import SwitchFleet, get_media_switch
+from teeheesmart.hex.emulator import EmulatedSwitch, EmulatorPool, EmulatorServer
+from teeheesmart.hex.io import Codec, Command, FrameDecoder, Instruction, ResponsePolicy
+
+from fakes import wait_until
+
+class TestEmulatedSwitch:
+  def test_switch_video_selects_valid_input_and_replies(self):
+    sut = EmulatedSwitch(input_count = 4)
+
+    result = sut.handle(Instruction(Command.SWITCH_VIDEO, 3))
+
+    assert sut.selected_source == 3
+    assert result == Instruction(Command.CURRENT_ACTIVE_INPUT, 2)
+
+  def test_switch_video_ignores_invalid_input(self):
+    sut = EmulatedSwitch(input_count = 4)
+
+    result = sut.handle(Instruction(Command.SWITCH_VIDEO, 5))
+
+    assert sut.selected_source == 1
+    assert result is None
+
+  def test_settings_are_applied_without_reply(self):
+    sut = EmulatedSwitch()
+
+    results = [
+      sut.handle(Instruction(Command.MUTE_BUZZER, 0)),
+      sut.handle(Instruction(Command.LED_TIMEOUT_SECONDS, 30)),
+      sut.handle(Instruction(Command.ENABLE_INPUT_DETECTION, 1)),
+    ]
+
+    assert results == [None, None, None]
+    assert sut.buzzer_muted is True
+    assert sut.led_timeout_seconds == 30
+    assert sut.auto_input_detection is True
+
+  def test_response_policies_can_be_overridden(self):
+    sut = EmulatedSwitch(response_policies = {Command.QUERY_ACTIVE_INPUT: ResponsePolicy.NEVER_REPLIES})
+
+    result = sut.handle(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert result is None
+
+  def test_sometimes_replies_is_random(self):
+    sut = EmulatedSwitch(
+      response_policies = {Command.QUERY_ACTIVE_INPUT: ResponsePolicy.SOMETIMES_REPLIES},
+      rand = random.Random(16),
+    )
+
+    results = [sut.handle(Instruction(Command.QUERY_ACTIVE_INPUT)) for _ in range(100)]
+
+    assert 0 < results.count(None) < 100
+
+class TestEmulatorServer:
+  def test_replies_over_tcp(self):
+    async def exchange():
+      async with EmulatorServer() as server:
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        writer.write(Codec.encode(Instruction(Command.QUERY_ACTIVE_INPUT)))
+        reply = await reader.readexactly(Instruction.SIZE_BYTES)
+        writer.close()
+        return reply
+
+    result = asyncio.run(exchange())
+
+    assert Codec.decode(result) == Instruction(Command.CURRENT_ACTIVE_INPUT, 0)
+
+  def test_drops_replies(self):
+    async def exchange():
+      async with EmulatorServer(drop_rate = 1.0) as server:
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        writer.write(Codec.encode(Instruction(Command.QUERY_ACTIVE_INPUT)))
+        try:
+          return await asyncio.wait_for(reader.read(Instruction.SIZE_BYTES), 0.1)
+        except asyncio.TimeoutError:
+          return None
+        finally:
+          writer.close()
+
+    result = asyncio.run(exchange())
+
+    assert result is None
+
+class TestEmulatorPool:
+  def test_media_switch_detects_emulated_input_count(self):
+    with EmulatorPool(input_count = 8) as pool:
+      # Probing inputs the switch lacks waits out the timeout
+      media_switch = get_media_switch(pool.urls[0], timeout_sec = 0.02)
+
+      assert media_switch.input_count == 8
+
+  def test_fenced_media_switch_detects_input_count_without_timeouts(self):
+    with EmulatorPool(input_count = 8) as pool:
+      started = time.monotonic()
+
+      media_switch = get_media_switch(pool.urls[0], timeout_sec = 5, fenced = True)
+
+      assert media_switch.input_count == 8
+      assert time.monotonic() - started < 2
+
+  def test_persistent_fenced_media_switch_reports_each_selection(self):
+    with EmulatorPool(input_count = 4, latency_sec = 0.02) as pool:
+      media_switch = get_media_switch(
+        pool.urls[0],
+        persistent = True,
+        fenced = True,
+        input_count = 4,
+      )
+      reported = []
+
+      for input in [2, 4, 1, 3]:
+        media_switch.select_source(input)
+        reported.append(media_switch.selected_source)
+      media_switch.close()
+
+      assert reported == [2, 4, 1, 3]
+
+  def test_media_switch_controls_emulated_switch(self):
+    with EmulatorPool() as pool:
+      media_switch = get_media_switch(pool.urls[0], input_count = 4)
+
+      media_switch.select_source(3)
+      media_switch.set_buzzer_muting(True)
+
+      assert media_switch.selected_source == 3
+      assert pool.servers[0].switch.selected_source == 3
+      # Muting is not acknowledged, so may still be in flight
+      assert wait_until(lambda: pool.servers[0].switch.buzzer_muted)
+
+  def test_fleet_polls_many_emulated_switches(self):
+    with EmulatorPool(count = 20) as pool:
+      fleet = SwitchFleet(pool.urls, switch_factory = lambda url: get_media_switch(url, input_count = 4))
+
+      result = fleet.poll()
+
+      assert result.ok
+      assert len(result.states) == 20
+
+  def test_latency_delays_replies(self):
+    with EmulatorPool(latency_sec = 0.05) as pool:
+      media_switch = get_media_switch(pool.urls[0], input_count = 4)
+      started = time.monotonic()
+
+      media_switch.update()
+
+      assert time.monotonic() - started >= 0.05
+
+  def test_rejects_connections_over_limit(self):
+    with EmulatorPool(max_connections = 1) as pool:
+      server = pool.servers[0]
+      first = socket.create_connection((server.host, server.port))
+      assert wait_until(lambda: server.connection_count == 1)
+
+      second = socket.create_connection((server.host, server.port))
+      second.settimeout(1.0)
+
+      assert second.recv(1) == b''
+      assert server.rejected_count == 1
+      first.close()
+      second.close()
+
+  def test_front_panel_selection_is_reported_to_clients(self):
+    with EmulatorPool() as pool:
+      server = pool.servers[0]
+      client = socket.create_connection((server.host, server.port))
+      client.settimeout(1.0)
+      assert wait_until(lambda: server.connection_count == 1)
+
+      pool.select_from_front_panel(server, 2)
+
+      assert FrameDecoder().feed(client.recv(256)) == [Instruction(Command.CURRENT_ACTIVE_INPUT, 1)]
+      client.close()
+
+  def test_persistent_media_switch_is_not_put_behind_by_front_panel_selection(self):
+    with EmulatorPool(input_count = 4, latency_sec = 0.02) as pool:
+      media_switch = get_media_switch(pool.urls[0], persistent = True, input_count = 4)
+      pool.select_from_front_panel(pool.servers[0], 3)
+      time.sleep(0.05)
+
+      selected = []
+      for input in [2, 4]:
+        media_switch.select_source(input)
+        selected.append(media_switch.selected_source)
+      media_switch.close()
+
+      assert selected == [2, 4]
+
+  def test_close_finishes_serving_open_connections(self):
+    pool = EmulatorPool(latency_sec = 0.2)
+    pool.start()
+    server = pool.servers[0]
+    client = socket.create_connection((server.host, server.port))
+    assert wait_until(lambda: server.connection_count == 1)
+    # Leaves the connection's handler delaying its reply
+    client.sendall(Codec.encode(Instruction(Command.QUERY_ACTIVE_INPUT)))
+    time.sleep(0.05)
+
+    pool.close()
+
+    assert server.connection_count == 0
+    client.close()
@@ -1,3 +1,9 @@
+import asyncio
+import socket
+import threading
+import time
+from typing import Optional
+
 from teeheesmart.hex.io import Instruction
 
 #
@@ -9,32 +15,92 @@ class FakeSocket:
   def __init__(self):
     self.request_bytes: list[bytes] = []
     self.response_bytes: bytes = FakeSocket.FAKE_INSTRUCTION_BYTES
+    # When set, replies are read from this stream, as a real socket would, rather
+    # than `response_bytes` being returned for every read. Timeout once drained.
+    self.response_stream: Optional[bytearray] = None
+    # Largest chunk a single read of `response_stream` returns
+    self.max_read_size: Optional[int] = None
+    # Sent by the peer while the socket sat idle, e.g., unsolicited frames; read
+    # ahead of any replies
+    self.pending_bytes = bytearray()
+    # Sent by the peer after a delay; only a read that waits, once
+    # `response_stream` is drained, returns it
+    self.delayed_bytes = bytearray()
     self.response_buffer_size = 0
     self.response_index = 0
     self.timeout = None
 
     self.should_timeout = False
+    self.peer_closed = False
+    self.send_error: Optional[OSError] = None
 
     self.send_count = 0
     self.recv_count = 0
+    self.peek_count = 0
     self.close_count= 0
     self.was_closed = False
+    self.options: dict[tuple[int, int], int] = {}
 
   def send(self, data: bytes) -> None:
+    if self.send_error is not None:
+      raise self.send_error
     self.send_count += 1
     self.request_bytes.append(data)
 
-  def recv(self, bufsize: int) -> bytes:
+  def sendall(self, data: bytes) -> None:
+    self.send(data)
+
+  def recv(self, bufsize: int, flags: int = 0) -> bytes:
+    if flags & socket.MSG_PEEK:
+      # Liveness probe: nothing is pending unless sent while idle or the peer hung up
+      self.peek_count += 1
+      if len(self.pending_bytes) > 0:
+        return bytes(self.pending_bytes[:bufsize])
+      if self.peer_closed:
+        return b''
+      raise BlockingIOError
     self.recv_count += 1
     self.response_buffer_size = bufsize
+    if len(self.pending_bytes) > 0:
+      chunk = bytes(self.pending_bytes[:bufsize])
+      del self.pending_bytes[:bufsize]
+      return chunk
+    if self.timeout == 0.0 and self.response_stream is None:
+      # Non-blocking read; replies only arrive once sent for
+      raise BlockingIOError
     if self.should_timeout:
       raise TimeoutError
+    elif self.response_stream is not None:
+      if len(self.response_stream) == 0:
+        if self.timeout != 0.0 and len(self.delayed_bytes) > 0:
+          chunk = bytes(self.delayed_bytes[:bufsize])
+          del self.delayed_bytes[:bufsize]
+          return chunk
+        raise TimeoutError
+      size = bufsize if self.max_read_size is None else min(bufsize, self.max_read_size)
+      chunk = bytes(self.response_stream[:size])
+      del self.response_stream[:size]
+      return chunk
     else:
       return self.response_bytes
 
+  def recv_into(self, buffer: memoryview, nbytes: int = 0) -> int:
+    data = self.recv(nbytes or len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
   def settimeout(self, value: float | None) -> None:
     self.timeout = value
 
+  def gettimeout(self) -> float | None:
+    return self.timeout
+
+  def setblocking(self, flag: bool) -> None:
+    self.timeout = None if flag else 0.0
+
+  def setsockopt(self, level: int, option: int, value: int) -> None:
+    self.options[(level, option)] = value
+
   def close(self) -> None:
     self.close_count += 1
     self.was_closed = True
@@ -46,12 +112,16 @@ class FakeDevice:
 
     self.response_index = 0
     self.process_count = 0
+    self.close_count = 0
+    self.delay_sec = 0.0
 
   def process(self, instructions: list[Instruction] | Instruction) -> list[Instruction]:
     try:
       _ = iter(instructions)
     except TypeError:
       instructions = [instructions]
+    if self.delay_sec > 0:
+      time.sleep(self.delay_sec)
     self.process_count += 1
     self.processed_instructions.extend(instructions)
     response = []
@@ -60,6 +130,9 @@ class FakeDevice:
       self.response_index += 1
     return response
 
+  def close(self) -> None:
+    self.close_count += 1
+
   def clear_processed_instructions(self):
     self.processed_instructions = []
 
@@ -69,4 +142,125 @@ class FakeDevice:
 
   def clear_instructions(self):
     self.clear_processed_instructions()
-    self.clear_response_instructions()
\ No newline at end of file
+    self.clear_response_instructions()
+class FakeStreamReader:
+  def __init__(self):
+    self.response_bytes: bytes = FakeSocket.FAKE_INSTRUCTION_BYTES
+    # When set, replies are read from this stream, as a real socket would, rather
+    # than `response_bytes` being returned for every read. Timeout once drained.
+    self.response_stream: Optional[bytearray] = None
+    # Largest chunk a single read of `response_stream` returns
+    self.max_read_size: Optional[int] = None
+    # Received while the stream sat idle, e.g., unsolicited frames; read ahead of
+    # any replies, without waiting
+    self.pending_bytes = bytearray()
+    self.should_timeout = False
+    self.eof = False
+    self.read_count = 0
+
+  async def read(self, n: int = -1) -> bytes:
+    self.read_count += 1
+    if len(self.pending_bytes) > 0:
+      chunk = bytes(self.pending_bytes)
+      self.pending_bytes.clear()
+      return chunk
+    # Replies arrive after a moment, as from a real device
+    await asyncio.sleep(0)
+    if self.should_timeout:
+      raise TimeoutError
+    if self.eof:
+      return b''
+    return self.response_bytes
+
+  def at_eof(self) -> bool:
+    return self.eof
+
+class FakeStreamWriter:
+  def __init__(self):
+    self.request_bytes: list[bytes] = []
+    self.was_closed = False
+
+  def write(self, data: bytes) -> None:
+    self.request_bytes.append(data)
+
+  async def drain(self) -> None:
+    pass
+
+  def is_closing(self) -> bool:
+    return self.was_closed
+
+  def close(self) -> None:
+    self.was_closed = True
+
+  async def wait_closed(self) -> None:
+    pass
+
+class FakeAsyncDevice(FakeDevice):
+  async def process(self, instructions: list[Instruction] | Instruction) -> list[Instruction]:
+    return super().process(instructions)
+
+  async def close(self) -> None:
+    super().close()
+
+class FakeServer:
+  """
+  Accepts real TCP connections on localhost, so code holding long-lived
+  connections can be exercised end to end
+  """
+
+  def __init__(self):
+    self._server = socket.create_server(('127.0.0.1', 0))
+    self._server.settimeout(0.1)
+    self._clients: list[socket.socket] = []
+    self._lock = threading.Lock()
+    self._stopped = threading.Event()
+    self.connection_count = 0
+    self._thread = threading.Thread(target = self._accept, daemon = True)
+    self._thread.start()
+
+  @property
+  def port(self) -> int:
+    return self._server.getsockname()[1]
+
+  def wait_for_connections(self, count: int, timeout_sec: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout_sec
+    while time.monotonic() < deadline:
+      if self.connection_count >= count:
+        return True
+      time.sleep(0.01)
+    return False
+
+  def send(self, data: bytes) -> None:
+    with self._lock:
+      for client in self._clients:
+        client.sendall(data)
+
+  def disconnect_clients(self) -> None:
+    with self._lock:
+      for client in self._clients:
+        client.close()
+      self._clients = []
+
+  def close(self) -> None:
+    self._stopped.set()
+    self._thread.join()
+    self.disconnect_clients()
+    self._server.close()
+
+  def _accept(self) -> None:
+    while not self._stopped.is_set():
+      try:
+        client, _ = self._server.accept()
+      except TimeoutError:
+        continue
+      with self._lock:
+        self._clients.append(client)
+        self.connection_count += 1
+
+def wait_until(condition, timeout_sec: float = 2.0) -> bool:
+  deadline = time.monotonic() + timeout_sec
+  while time.monotonic() < deadline:
+    if condition():
+      return True
+    time.sleep(0.01)
+  return condition()
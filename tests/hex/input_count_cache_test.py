@@ -0,0 +1,33 @@
+from teeheesmart.hex.input_count_cache import InputCountCache
+
+class TestInputCountCache:
+  def test_get_returns_none_when_file_missing(self, tmp_path):
+    sut = InputCountCache(tmp_path / 'cache.json')
+
+    assert sut.get('10.0.0.1', 5000) is None
+
+  def test_get_returns_value_previously_set(self, tmp_path):
+    path = tmp_path / 'cache.json'
+    InputCountCache(path).set('10.0.0.1', 5000, 8)
+
+    sut = InputCountCache(path)
+
+    assert sut.get('10.0.0.1', 5000) == 8
+    assert sut.get('10.0.0.1', 5001) is None
+
+  def test_set_preserves_other_entries(self, tmp_path):
+    sut = InputCountCache(tmp_path / 'cache.json')
+
+    sut.set('10.0.0.1', 5000, 8)
+    sut.set('10.0.0.2', 5000, 16)
+
+    assert sut.get('10.0.0.1', 5000) == 8
+    assert sut.get('10.0.0.2', 5000) == 16
+
+  def test_get_ignores_corrupt_file(self, tmp_path):
+    path = tmp_path / 'cache.json'
+    path.write_text('{not json')
+
+    sut = InputCountCache(path)
+
+    assert sut.get('10.0.0.1', 5000) is None
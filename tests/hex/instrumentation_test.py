@@ -0,0 +1,84 @@
+import pytest
+
+from teeheesmart.hex.instrumentation import HistogramCollector, LatencyHistogram
+from teeheesmart.hex.io import Command, Instruction, TcpEndpoint
+
+class TestLatencyHistogram:
+  def test_empty_histogram_has_no_statistics(self):
+    sut = LatencyHistogram()
+
+    assert sut.count == 0
+    assert sut.mean_sec is None
+    assert sut.percentile(50) is None
+
+  def test_record_tracks_count_mean_and_extremes(self):
+    sut = LatencyHistogram()
+
+    for elapsed_sec in [0.010, 0.020, 0.030]:
+      sut.record(elapsed_sec)
+
+    assert sut.count == 3
+    assert sut.mean_sec == pytest.approx(0.020)
+    assert (sut.min_sec, sut.max_sec) == (0.010, 0.030)
+
+  def test_percentile_returns_bucket_bound_within_quarter_of_value(self):
+    sut = LatencyHistogram()
+
+    for _ in range(99):
+      sut.record(0.005)
+    sut.record(2.0)
+
+    assert 0.005 <= sut.percentile(50) <= 0.005 * 1.25
+    assert sut.percentile(100) == 2.0
+
+  def test_percentile_is_capped_at_maximum(self):
+    sut = LatencyHistogram()
+
+    sut.record(100.0)
+
+    assert sut.percentile(99) == 100.0
+
+  def test_percentile_rejects_out_of_range_values(self):
+    sut = LatencyHistogram()
+
+    with pytest.raises(ValueError):
+      sut.percentile(101)
+
+class TestHistogramCollector:
+  _endpoint = TcpEndpoint('10.0.0.1', 5000)
+
+  def test_on_connect_records_connect_time(self):
+    sut = HistogramCollector()
+
+    sut.on_connect(self._endpoint, 0.002)
+
+    assert sut.for_endpoint('10.0.0.1', 5000).connect.count == 1
+
+  def test_on_exchange_aggregates_by_command(self):
+    sut = HistogramCollector()
+    query = Instruction(Command.QUERY_ACTIVE_INPUT)
+
+    sut.on_exchange(self._endpoint, query, 0.010, 6, 6, False)
+    sut.on_exchange(self._endpoint, query, 0.250, 6, 0, True)
+    sut.on_exchange(self._endpoint, Instruction(Command.SWITCH_VIDEO, 1), 0.010, 6, 6, False)
+
+    stats = sut.for_endpoint('10.0.0.1', 5000).commands[Command.QUERY_ACTIVE_INPUT]
+    assert stats.round_trip.count == 1
+    assert stats.timeout_count == 1
+    assert (stats.bytes_sent, stats.bytes_received) == (12, 6)
+
+  def test_on_error_counts_connection_and_command_errors(self):
+    sut = HistogramCollector()
+    instruction = Instruction(Command.SWITCH_VIDEO, 1)
+
+    sut.on_error(self._endpoint, None, ConnectionRefusedError())
+    sut.on_error(self._endpoint, instruction, BrokenPipeError())
+
+    stats = sut.for_endpoint('10.0.0.1', 5000)
+    assert stats.connect_error_count == 1
+    assert stats.commands[Command.SWITCH_VIDEO].error_count == 1
+
+  def test_for_endpoint_returns_none_for_unseen_devices(self):
+    sut = HistogramCollector()
+
+    assert sut.for_endpoint('10.0.0.2', 5000) is None
@@ -1,10 +1,18 @@
 import logging
+import mmap
+import pickle
 import pytest
 import random
 import socket
 
+import teeheesmart.hex.io
+
+from teeheesmart.hex.breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from teeheesmart.hex.instrumentation import DeviceObserver
+from teeheesmart.hex.rtt import RttEstimator
 from teeheesmart.hex.io import \
-  Command, Instruction, Codec, TcpDevice, TcpEndpoint, _VALID_RANGE
+  Command, Instruction, Codec, FrameDecoder, ResponsePolicies, ResponsePolicy, TcpDevice, \
+  TcpEndpoint, _VALID_RANGE, _demultiplex
 
 from fakes import FakeSocket
 
@@ -23,6 +31,11 @@ class TestCommand:
 
     assert result is False
 
+  def test_is_supported_returns_false_for_out_of_range_command_id(self):
+    result = [Command.is_supported(cmd_id) for cmd_id in (-1, 256, 1000)]
+
+    assert result == [False, False, False]
+
 class TestInstruction:
   def test_name_returns_command_name_for_supported_commands(self):
     valid_cmd = gen_valid_cmd()
@@ -77,6 +90,49 @@ class TestInstruction:
 
     assert result == expected
 
+  def test_construction_returns_interned_instance(self):
+    valid_cmd = gen_valid_cmd()
+    data_value = gen_valid_io_value()
+
+    result = Instruction(valid_cmd.value, data_value)
+
+    assert result is Instruction(valid_cmd, data_value)
+
+  def test_unsupported_commands_are_interned(self):
+    invalid_cmd_id = gen_invalid_cmd_id()
+
+    result = Instruction(invalid_cmd_id, 1)
+
+    assert result is Instruction(invalid_cmd_id, 1)
+
+  def test_bool_data_value_is_normalized_to_int(self):
+    result = Instruction(Command.MUTE_BUZZER, True)
+
+    assert result.data_value == 1
+    assert type(result.data_value) is int
+
+  def test_invalid_command_id_raises_exception(self):
+    with pytest.raises(ValueError):
+      Instruction(256)
+
+  def test_attributes_cannot_be_set(self):
+    instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+
+    with pytest.raises(AttributeError):
+      instruction._data_value = 3
+
+  def test_equal_instructions_hash_equally(self):
+    result = {Instruction(Command.SWITCH_VIDEO, 2), Instruction(Command.SWITCH_VIDEO, 2)}
+
+    assert result == {Instruction(Command.SWITCH_VIDEO, 2)}
+
+  def test_unpickling_returns_interned_instance(self):
+    instruction = Instruction(Command.CURRENT_ACTIVE_INPUT, 3)
+
+    result = pickle.loads(pickle.dumps(instruction))
+
+    assert result is instruction
+
 class TestCodec:
   def test_encode_generates_valid_bytes(self):
     expected = b'\xAA\xBB\x03\x10\x00\xEE'
@@ -110,6 +166,192 @@ class TestCodec:
 
     assert result == input
 
+  def test_decode_accepts_buffers(self):
+    data = memoryview(bytearray(b'\xAA\xBB\x03\x11\x03\xEE'))
+
+    result = Codec.decode(data)
+
+    assert result is Instruction(Command.CURRENT_ACTIVE_INPUT, 3)
+
+  def test_encode_many_concatenates_frames(self):
+    instructions = [Instruction(Command.SWITCH_VIDEO, 2), Instruction(Command.QUERY_ACTIVE_INPUT)]
+
+    result = Codec.encode_many(instructions)
+
+    assert result == b'\xAA\xBB\x03\x01\x02\xEE\xAA\xBB\x03\x10\x00\xEE'
+
+  @pytest.mark.parametrize('vectorized', [False, True])
+  def test_decode_many_returns_columns_of_valid_frames(self, monkeypatch, vectorized):
+    use_decode_many_backend(monkeypatch, vectorized)
+    data = (
+      b'\x00\xAA\xBB\x03\x11\x05\xEE' +
+      # Invalid data value and missing footer
+      b'\xAA\xBB\x03\x11\xFF\xEE\xAA\xBB\x03\x11\x05\x00' +
+      b'\xAA\xBB\x03\x01\x02\xEE\xAA\xBB'
+    )
+
+    result = Codec.decode_many(data)
+
+    assert list(result.command_ids) == [0x11, 0x01]
+    assert list(result.data_values) == [5, 2]
+    assert list(result.offsets) == [1, 19]
+    assert result.instructions() == [
+      Instruction(Command.CURRENT_ACTIVE_INPUT, 5),
+      Instruction(Command.SWITCH_VIDEO, 2),
+    ]
+
+  @pytest.mark.parametrize('vectorized', [False, True])
+  def test_decode_many_matches_frame_decoder(self, monkeypatch, vectorized):
+    use_decode_many_backend(monkeypatch, vectorized)
+    rand = random.Random(13)
+    frames = [Instruction(gen_valid_cmd(rand), gen_valid_io_value(rand)) for _ in range(200)]
+    data = b''.join(
+      bytes(rand.randrange(256) for _ in range(rand.randrange(4))) + frame.frame_bytes
+      for frame in frames
+    )
+
+    result = Codec.decode_many(memoryview(data))
+
+    assert result.instructions() == FrameDecoder().feed(data)
+
+  @pytest.mark.parametrize('vectorized', [False, True])
+  def test_decode_many_accepts_mmap(self, monkeypatch, tmp_path, vectorized):
+    use_decode_many_backend(monkeypatch, vectorized)
+    path = tmp_path / 'capture.bin'
+    path.write_bytes(Codec.encode_many([Instruction(Command.CURRENT_ACTIVE_INPUT, 3)] * 3))
+
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+      result = Codec.decode_many(data)
+
+      assert len(result) == 3
+      assert list(result.offsets) == [0, 6, 12]
+
+  @pytest.mark.parametrize('vectorized', [False, True])
+  def test_decode_many_handles_short_buffers(self, monkeypatch, vectorized):
+    use_decode_many_backend(monkeypatch, vectorized)
+
+    result = Codec.decode_many(b'\xAA\xBB\x03')
+
+    assert len(result) == 0
+    assert result.instructions() == []
+
+  def test_encode_returns_cached_frame(self):
+    instruction = Instruction(Command.SWITCH_VIDEO, 4)
+
+    result = Codec.encode(instruction)
+
+    assert result is Codec.encode(instruction)
+
+class TestFrameDecoder:
+  _frame = b'\xAA\xBB\x03\x11\x05\xEE'
+
+  def test_feed_decodes_complete_frame(self):
+    sut = FrameDecoder()
+
+    result = sut.feed(self._frame)
+
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 5)]
+    assert sut.pending_byte_count == 0
+
+  def test_feed_decodes_multiple_frames_in_one_chunk(self):
+    frame2 = b'\xAA\xBB\x03\x01\x02\xEE'
+    sut = FrameDecoder()
+
+    result = sut.feed(self._frame + frame2)
+
+    assert result == [
+      Instruction(Command.CURRENT_ACTIVE_INPUT, 5),
+      Instruction(Command.SWITCH_VIDEO, 2),
+    ]
+
+  def test_feed_buffers_partial_frames_until_complete(self):
+    sut = FrameDecoder()
+
+    results = [sut.feed(self._frame[i:i + 1]) for i in range(len(self._frame))]
+
+    assert results[:-1] == [[]] * (len(self._frame) - 1)
+    assert results[-1] == [Instruction(Command.CURRENT_ACTIVE_INPUT, 5)]
+
+  def test_feed_skips_garbage_before_frame(self):
+    garbage = b'\x00\xAA\xEE\xAA\xBB'
+    sut = FrameDecoder()
+
+    result = sut.feed(garbage + self._frame)
+
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 5)]
+    assert sut.discarded_byte_count == len(garbage)
+
+  def test_feed_resynchronizes_after_corrupt_frame(self):
+    corrupt = b'\xAA\xBB\x03\x11\x05\x00'
+    sut = FrameDecoder()
+
+    result = sut.feed(corrupt + self._frame)
+
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 5)]
+    assert sut.discarded_byte_count == len(corrupt)
+
+  def test_feed_accepts_memoryview(self):
+    buffer = memoryview(bytearray(self._frame * 2))
+    sut = FrameDecoder()
+
+    result = sut.feed(buffer[:len(self._frame)])
+
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 5)]
+
+  def test_reset_drops_partial_frame(self):
+    sut = FrameDecoder()
+    sut.feed(self._frame[:4])
+
+    sut.reset()
+    result = sut.feed(self._frame[4:])
+
+    assert result == []
+    assert sut.pending_byte_count == 0
+
+class TestResponsePolicies:
+  def test_policy_for_returns_default_policy(self):
+    sut = ResponsePolicies()
+
+    result = sut.policy_for(Instruction(Command.MUTE_BUZZER, 1))
+
+    assert result == ResponsePolicy.NEVER_REPLIES
+
+  def test_policy_for_returns_override_when_specified(self):
+    sut = ResponsePolicies({Command.MUTE_BUZZER: ResponsePolicy.EXPECTS_REPLY})
+
+    result = sut.policy_for(Instruction(Command.MUTE_BUZZER, 1))
+
+    assert result == ResponsePolicy.EXPECTS_REPLY
+
+  def test_policy_for_returns_sometimes_replies_for_unsupported_commands(self):
+    sut = ResponsePolicies()
+
+    result = sut.policy_for(Instruction(gen_invalid_cmd_id()))
+
+    assert result == ResponsePolicy.SOMETIMES_REPLIES
+
+class TestDemultiplex:
+  def test_attributes_responses_to_instructions_that_always_reply_first(self):
+    policies = [
+      ResponsePolicy.SOMETIMES_REPLIES,
+      ResponsePolicy.NEVER_REPLIES,
+      ResponsePolicy.EXPECTS_REPLY,
+    ]
+    response = Instruction(Command.CURRENT_ACTIVE_INPUT, 2)
+
+    result = _demultiplex(policies, [response])
+
+    assert result == [[], [], [response]]
+
+  def test_attributes_surplus_responses_to_instructions_that_sometimes_reply(self):
+    policies = [ResponsePolicy.SOMETIMES_REPLIES, ResponsePolicy.EXPECTS_REPLY]
+    response1 = Instruction(Command.CURRENT_ACTIVE_INPUT, 1)
+    response2 = Instruction(Command.CURRENT_ACTIVE_INPUT, 2)
+
+    result = _demultiplex(policies, [response1, response2])
+
+    assert result == [[response1], [response2]]
+
 class TestTcpEndpoint:
   _host = 'localhost'
 
@@ -151,27 +393,36 @@ class TestTcpEndpoint:
 
     assert sut.timeout_sec == TcpEndpoint.DEFAULT_TIMEOUT_SEC
 
+  def test_connect_timeout_returns_default_when_elided(self):
+    sut = TcpEndpoint(self._host, gen_port())
+
+    assert sut.connect_timeout_sec == TcpEndpoint.DEFAULT_CONNECT_TIMEOUT_SEC
+
 class TestTcpDevice:
   def test_creates_connection_using_specified_endpoint_details(self, monkeypatch: pytest.MonkeyPatch):
     expected_host = '10.0.0.1'
     expected_port = 1337
     expected_timeout = 0.101
+    expected_connect_timeout = 0.5
     captured_host = False
     captured_port = False
+    captured_connect_timeout = False
     fake_socket = FakeSocket()
-    def capture_create_connection(host_port_tuple):
-      nonlocal captured_host, captured_port
+    def capture_create_connection(host_port_tuple, timeout):
+      nonlocal captured_host, captured_port, captured_connect_timeout
       captured_host = host_port_tuple[0]
       captured_port = host_port_tuple[1]
+      captured_connect_timeout = timeout
       return fake_socket
     monkeypatch.setattr(socket, 'create_connection', capture_create_connection)
-    endpoint = TcpEndpoint(expected_host, expected_port, expected_timeout)
+    endpoint = TcpEndpoint(expected_host, expected_port, expected_timeout, expected_connect_timeout)
     sut = TcpDevice(endpoint)
 
     sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
 
     assert captured_host == expected_host
     assert captured_port == expected_port
+    assert captured_connect_timeout == expected_connect_timeout
     assert fake_socket.timeout == expected_timeout
 
   def test_process_dispatches_single_instruction(self, monkeypatch: pytest.MonkeyPatch):
@@ -245,17 +496,437 @@ class TestTcpDevice:
 
     assert fake_socket.was_closed
 
+  def test_process_does_not_wait_for_commands_that_never_reply(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    sut = self.create_device()
+
+    result = sut.process([
+      Instruction(Command.MUTE_BUZZER, 1),
+      Instruction(Command.LED_TIMEOUT_SECONDS, 10),
+    ])
+
+    assert fake_socket.send_count == 2
+    assert fake_socket.recv_count == 0
+    assert result == []
+
+  def test_process_waits_for_reply_when_policy_overridden(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    sut = self.create_device(
+      response_policies = {Command.MUTE_BUZZER: ResponsePolicy.SOMETIMES_REPLIES}
+    )
+
+    result = sut.process(Instruction(Command.MUTE_BUZZER, 1))
+
+    assert fake_socket.recv_count == 1
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)]
+
+  def test_process_warns_when_expected_reply_times_out(
+      self,
+      caplog: pytest.LogCaptureFixture,
+      monkeypatch: pytest.MonkeyPatch
+    ):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.should_timeout = True
+    sut = self.create_device()
+
+    sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert any(
+      record.levelno == logging.WARNING and 'Timed out' in record.message
+      for record in caplog.records
+    )
+
+  def test_pipelined_process_sends_all_instructions_at_once(self, monkeypatch: pytest.MonkeyPatch):
+    instructions = [
+      Instruction(Command.MUTE_BUZZER, 1),
+      Instruction(Command.SWITCH_VIDEO, 2),
+      Instruction(Command.QUERY_ACTIVE_INPUT),
+    ]
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_stream = bytearray(b'\xAA\xBB\x03\x11\x01\xEE' * 2)
+    sut = self.create_device(pipelined = True)
+
+    result = sut.process(instructions)
+
+    assert fake_socket.send_count == 1
+    assert fake_socket.request_bytes[0] == b''.join(Codec.encode(i) for i in instructions)
+    assert result == [
+      Instruction(Command.CURRENT_ACTIVE_INPUT, 1),
+      Instruction(Command.CURRENT_ACTIVE_INPUT, 1),
+    ]
+
+  def test_pipelined_process_stops_reading_once_all_replies_received(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_stream = bytearray(
+      b'\xAA\xBB\x03\x11\x01\xEE\xAA\xBB\x03\x11\x02\xEE'
+    )
+    sut = self.create_device(pipelined = True)
+
+    result = sut.process([
+      Instruction(Command.QUERY_ACTIVE_INPUT),
+      Instruction(Command.QUERY_ACTIVE_INPUT),
+    ])
+
+    assert len(fake_socket.response_stream) == 0
+    assert fake_socket.recv_count == 1
+    assert result == [
+      Instruction(Command.CURRENT_ACTIVE_INPUT, 1),
+      Instruction(Command.CURRENT_ACTIVE_INPUT, 2),
+    ]
+
+  def test_process_decodes_reply_split_across_reads(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_stream = bytearray(b'\xAA\xBB\x03\x11\x05\xEE')
+    fake_socket.max_read_size = 4
+    sut = self.create_device()
+
+    result = sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert fake_socket.recv_count == 2
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 5)]
+
+  def test_fenced_process_follows_command_with_query(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.SWITCH_VIDEO, 2)
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_stream = bytearray(b'\xAA\xBB\x03\x11\x00\xEE')
+    sut = self.create_device(fenced = True)
+
+    result = sut.process(instruction)
+
+    assert fake_socket.request_bytes[0] == \
+      Codec.encode(instruction) + Codec.encode(Instruction(Command.QUERY_ACTIVE_INPUT))
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)]
+
+  def test_fenced_process_stops_reading_at_fence_reply(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_stream = bytearray(b'\xAA\xBB\x03\x11\x00\xEE')
+    sut = self.create_device(fenced = True)
+
+    sut.process(Instruction(Command.SWITCH_VIDEO, 2))
+
+    # Further reads check for replies that already arrived, then wait briefly for
+    # a second reply, in case the first was the command's
+    assert fake_socket.recv_count == 3
+    assert fake_socket.timeout == TcpEndpoint.DEFAULT_TIMEOUT_SEC
+
+  def test_fenced_process_includes_command_reply(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_stream = bytearray(b'\xAA\xBB\x03\x11\x01\xEE' * 2)
+    sut = self.create_device(fenced = True)
+
+    result = sut.process(Instruction(Command.SWITCH_VIDEO, 2))
+
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 1)] * 2
+
+  def test_persistent_fenced_process_reads_fence_reply_arriving_after_command_reply(
+      self,
+      monkeypatch: pytest.MonkeyPatch
+    ):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_stream = bytearray(b'\xAA\xBB\x03\x11\x01\xEE')
+    fake_socket.delayed_bytes = bytearray(b'\xAA\xBB\x03\x11\x01\xEE')
+    sut = self.create_device(persistent = True, fenced = True)
+
+    first = sut.process(Instruction(Command.SWITCH_VIDEO, 2))
+    fake_socket.response_stream = bytearray(b'\xAA\xBB\x03\x11\x03\xEE' * 2)
+    second = sut.process(Instruction(Command.SWITCH_VIDEO, 4))
+
+    assert first == [Instruction(Command.CURRENT_ACTIVE_INPUT, 1)] * 2
+    assert second == [Instruction(Command.CURRENT_ACTIVE_INPUT, 3)] * 2
+
+  def test_fenced_process_does_not_fence_commands_that_never_reply(
+      self,
+      monkeypatch: pytest.MonkeyPatch
+    ):
+    instruction = Instruction(Command.MUTE_BUZZER, 1)
+    fake_socket = self.stub_socket(monkeypatch)
+    sut = self.create_device(fenced = True)
+
+    sut.process(instruction)
+
+    assert fake_socket.request_bytes == [Codec.encode(instruction)]
+
+  def test_process_waits_for_reply_using_estimated_timeout(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    estimator = RttEstimator(initial_timeout_sec = 0.08)
+    sut = self.create_device(rtt_estimator = estimator)
+
+    sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert fake_socket.timeout == 0.08
+    assert estimator.smoothed_rtt_sec is not None
+
+  def test_process_backs_off_estimated_timeout_when_expected_reply_times_out(
+      self,
+      monkeypatch: pytest.MonkeyPatch
+    ):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.should_timeout = True
+    estimator = RttEstimator(initial_timeout_sec = 0.1)
+    sut = self.create_device(rtt_estimator = estimator)
+
+    sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert estimator.timeout_sec == 0.2
+    assert estimator.smoothed_rtt_sec is None
+
+  def test_process_keeps_estimated_timeout_when_optional_reply_is_absent(
+      self,
+      monkeypatch: pytest.MonkeyPatch
+    ):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.should_timeout = True
+    estimator = RttEstimator(initial_timeout_sec = 0.1)
+    sut = self.create_device(rtt_estimator = estimator)
+
+    sut.process(Instruction(Command.SWITCH_VIDEO, 9))
+
+    assert estimator.timeout_sec == 0.1
+
+  def test_pipelined_process_returns_partial_replies_on_timeout(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_stream = bytearray(b'\xAA\xBB\x03\x11\x04\xEE')
+    sut = self.create_device(pipelined = True)
+
+    result = sut.process([
+      Instruction(Command.SWITCH_VIDEO, 16),
+      Instruction(Command.SWITCH_VIDEO, 5),
+    ])
+
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 4)]
+
+  def test_persistent_process_reuses_connection(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+    connect_count = self.count_connections(monkeypatch, [FakeSocket()])
+    sut = self.create_device(persistent = True)
+
+    sut.process(instruction)
+    sut.process(instruction)
+
+    assert connect_count() == 1
+
+  def test_persistent_process_leaves_connection_open_until_closed(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+    fake_socket = self.stub_socket(monkeypatch)
+    sut = self.create_device(persistent = True)
+
+    sut.process(instruction)
+    was_closed_after_process = fake_socket.was_closed
+    sut.close()
+
+    assert not was_closed_after_process
+    assert fake_socket.was_closed
+
+  def test_persistent_process_enables_keepalive(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    sut = self.create_device(persistent = True)
+
+    sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert fake_socket.options[(socket.SOL_SOCKET, socket.SO_KEEPALIVE)] == 1
+
+  def test_persistent_process_reconnects_when_peer_closed(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+    first_socket = FakeSocket()
+    second_socket = FakeSocket()
+    connect_count = self.count_connections(monkeypatch, [first_socket, second_socket])
+    sut = self.create_device(persistent = True)
+
+    sut.process(instruction)
+    first_socket.peer_closed = True
+    sut.process(instruction)
+
+    assert connect_count() == 2
+    assert first_socket.was_closed
+    assert second_socket.send_count == 1
+
+  def test_persistent_process_reconnects_when_idle_timeout_elapsed(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+    connect_count = self.count_connections(monkeypatch, [FakeSocket(), FakeSocket()])
+    sut = self.create_device(persistent = True, idle_timeout_sec = 0)
+
+    sut.process(instruction)
+    sut.process(instruction)
+
+    assert connect_count() == 2
+
+  def test_persistent_process_retries_on_fresh_connection_when_send_fails(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+    first_socket = FakeSocket()
+    second_socket = FakeSocket()
+    self.count_connections(monkeypatch, [first_socket, second_socket])
+    sut = self.create_device(persistent = True)
+
+    sut.process(instruction)
+    first_socket.send_error = BrokenPipeError()
+    result = sut.process(instruction)
+
+    assert second_socket.send_count == 1
+    assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)]
+
+  def test_persistent_process_returns_frames_received_while_idle_ahead_of_replies(
+      self,
+      monkeypatch: pytest.MonkeyPatch
+    ):
+    instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+    fake_socket = self.stub_socket(monkeypatch)
+    sut = self.create_device(persistent = True)
+
+    sut.process(instruction)
+    fake_socket.pending_bytes = bytearray(b'\xAA\xBB\x03\x11\x02\xEE')
+    result = sut.process(instruction)
+
+    assert result == [
+      Instruction(Command.CURRENT_ACTIVE_INPUT, 2),
+      Instruction(Command.CURRENT_ACTIVE_INPUT, 0),
+    ]
+    assert fake_socket.send_count == 2
+
+  def test_observer_receives_connect_and_exchange_events(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.QUERY_ACTIVE_INPUT)
+    self.stub_socket(monkeypatch)
+    observer = RecordingObserver()
+    sut = self.create_device(observer = observer)
+
+    sut.process(instruction)
+
+    assert [event[0] for event in observer.events] == ['connect', 'exchange']
+    _, _, exchanged, elapsed_sec, bytes_sent, bytes_received, timed_out = observer.events[1]
+    assert exchanged is instruction
+    assert elapsed_sec >= 0
+    assert (bytes_sent, bytes_received, timed_out) == (6, 6, False)
+
+  def test_observer_receives_response_timeouts(self, monkeypatch: pytest.MonkeyPatch):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.should_timeout = True
+    observer = RecordingObserver()
+    sut = self.create_device(observer = observer)
+
+    sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert observer.events[-1][-1] is True
+
+  @pytest.mark.parametrize('persistent', [False, True])
+  def test_failed_exchange_ends_with_null_response(
+      self,
+      monkeypatch: pytest.MonkeyPatch,
+      persistent: bool
+    ):
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.send_error = BrokenPipeError()
+    sut = self.create_device(persistent = persistent)
+
+    result = sut.process(Instruction(Command.MUTE_BUZZER, 0))
+
+    assert result == [Instruction(Command.NULL_RESPONSE)]
+
+  def test_observer_receives_errors_for_instruction_in_flight(self, monkeypatch: pytest.MonkeyPatch):
+    instruction = Instruction(Command.SWITCH_VIDEO, 2)
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.send_error = BrokenPipeError()
+    observer = RecordingObserver()
+    sut = self.create_device(observer = observer)
+
+    sut.process([instruction])
+
+    assert observer.events[-1] == ('error', sut.endpoint, instruction, fake_socket.send_error)
+
+  def test_observer_receives_connection_errors(self, monkeypatch: pytest.MonkeyPatch):
+    error = ConnectionRefusedError()
+    def refuse_connection(*_):
+      raise error
+    monkeypatch.setattr(socket, 'create_connection', refuse_connection)
+    observer = RecordingObserver()
+    sut = self.create_device(observer = observer)
+
+    with pytest.raises(ConnectionRefusedError):
+      sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert observer.events == [('error', sut.endpoint, None, error)]
+
+  def test_observer_receives_exchange_per_pipelined_instruction(self, monkeypatch: pytest.MonkeyPatch):
+    instructions = [Instruction(Command.MUTE_BUZZER, 1), Instruction(Command.QUERY_ACTIVE_INPUT)]
+    fake_socket = self.stub_socket(monkeypatch)
+    fake_socket.response_stream = bytearray(FakeSocket.FAKE_INSTRUCTION_BYTES)
+    observer = RecordingObserver()
+    sut = self.create_device(observer = observer, pipelined = True)
+
+    sut.process(instructions)
+
+    exchanges = [event for event in observer.events if event[0] == 'exchange']
+    assert [event[2] for event in exchanges] == instructions
+    assert [event[5] for event in exchanges] == [0, 6]
+
+  def test_circuit_breaker_fails_fast_after_repeated_connection_failures(
+      self,
+      monkeypatch: pytest.MonkeyPatch
+    ):
+    attempts = 0
+    def refuse_connection(*_):
+      nonlocal attempts
+      attempts += 1
+      raise ConnectionRefusedError()
+    monkeypatch.setattr(socket, 'create_connection', refuse_connection)
+    sut = self.create_device(circuit_breaker = CircuitBreaker(failure_threshold = 2))
+    for _ in range(2):
+      with pytest.raises(ConnectionRefusedError):
+        sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    with pytest.raises(CircuitOpenError):
+      sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+
+    assert attempts == 2
+
+  def test_circuit_breaker_records_successful_exchanges(self, monkeypatch: pytest.MonkeyPatch):
+    self.stub_socket(monkeypatch)
+    breaker = CircuitBreaker(failure_threshold = 2)
+    breaker.record_failure()
+    sut = self.create_device(circuit_breaker = breaker)
+
+    sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+    breaker.record_failure()
+
+    assert breaker.state == CircuitState.CLOSED
+
   def stub_socket(self, patch: pytest.MonkeyPatch) -> FakeSocket:
     fake_socket = FakeSocket()
     patch.setattr(socket, 'create_connection', lambda *_: fake_socket)
     return fake_socket
 
-  def create_device(self, endpoint: TcpEndpoint = TcpEndpoint('localhost')):
-    return TcpDevice(endpoint)
+  def count_connections(self, patch: pytest.MonkeyPatch, fake_sockets: list[FakeSocket]):
+    remaining = list(fake_sockets)
+    def create_connection(*_):
+      return remaining.pop(0)
+    patch.setattr(socket, 'create_connection', create_connection)
+    return lambda: len(fake_sockets) - len(remaining)
+
+  def create_device(self, endpoint: TcpEndpoint = TcpEndpoint('localhost'), **kwargs):
+    return TcpDevice(endpoint, **kwargs)
+
+class RecordingObserver(DeviceObserver):
+  def __init__(self):
+    self.events = []
+
+  def on_connect(self, endpoint, elapsed_sec):
+    self.events.append(('connect', endpoint, elapsed_sec))
+
+  def on_exchange(self, endpoint, instruction, elapsed_sec, bytes_sent, bytes_received, timed_out):
+    self.events.append(
+      ('exchange', endpoint, instruction, elapsed_sec, bytes_sent, bytes_received, timed_out)
+    )
+
+  def on_error(self, endpoint, instruction, error):
+    self.events.append(('error', endpoint, instruction, error))
 
 #
 # Helpers
 #
+def use_decode_many_backend(monkeypatch, vectorized: bool) -> None:
+  if vectorized:
+    pytest.importorskip('numpy')
+  else:
+    monkeypatch.setattr(teeheesmart.hex.io, 'numpy', None)
+
 def gen_invalid_cmd_id(rand = random) -> int:
   return rand.randrange(64, 128)
 
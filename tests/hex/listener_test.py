@@ -0,0 +1,100 @@
+import asyncio
+
+from teeheesmart.hex.io import Command, Instruction, TcpEndpoint
+from teeheesmart.hex.listener import AsyncDeviceListener, DeviceListener
+from teeheesmart.hex.media_switch import MediaSwitch
+
+from fakes import FakeDevice, FakeServer, wait_until
+
+FRAME = b'\xAA\xBB\x03\x11\x04\xEE'
+
+class TestDeviceListener:
+  def test_reports_frames_sent_by_device(self):
+    server = FakeServer()
+    received = []
+    sut = DeviceListener(TcpEndpoint('127.0.0.1', server.port), received.extend)
+    try:
+      sut.start()
+      server.wait_for_connections(1)
+
+      server.send(FRAME)
+
+      assert wait_until(lambda: len(received) > 0)
+      assert received == [Instruction(Command.CURRENT_ACTIVE_INPUT, 4)]
+    finally:
+      sut.stop()
+      server.close()
+
+  def test_reconnects_when_device_closes_connection(self):
+    server = FakeServer()
+    received = []
+    sut = DeviceListener(
+      TcpEndpoint('127.0.0.1', server.port),
+      received.extend,
+      reconnect_delay_sec = 0.01
+    )
+    try:
+      sut.start()
+      server.wait_for_connections(1)
+
+      server.disconnect_clients()
+      server.wait_for_connections(2)
+      server.send(FRAME)
+
+      assert wait_until(lambda: len(received) > 0)
+    finally:
+      sut.stop()
+      server.close()
+
+  def test_stop_ends_background_thread(self):
+    server = FakeServer()
+    sut = DeviceListener(TcpEndpoint('127.0.0.1', server.port), lambda _: None)
+    sut.start()
+    server.wait_for_connections(1)
+
+    sut.stop()
+
+    assert not sut.is_running
+    server.close()
+
+class TestAsyncDeviceListener:
+  def test_reports_frames_sent_by_device(self):
+    server = FakeServer()
+    received = []
+    sut = AsyncDeviceListener(TcpEndpoint('127.0.0.1', server.port), received.extend)
+
+    async def exercise():
+      sut.start()
+      while server.connection_count == 0:
+        await asyncio.sleep(0.01)
+      server.send(FRAME)
+      while len(received) == 0:
+        await asyncio.sleep(0.01)
+      await sut.stop()
+
+    try:
+      asyncio.run(asyncio.wait_for(exercise(), 2.0))
+
+      assert received == [Instruction(Command.CURRENT_ACTIVE_INPUT, 4)]
+      assert not sut.is_running
+    finally:
+      server.close()
+
+class TestMediaSwitchListening:
+  def test_selected_source_tracks_frames_sent_by_device(self):
+    server = FakeServer()
+    fake_device = FakeDevice()
+    fake_device.endpoint = TcpEndpoint('127.0.0.1', server.port)
+    sut = MediaSwitch(fake_device, input_count = 16)
+    try:
+      sut.start_listening()
+      server.wait_for_connections(1)
+
+      server.send(FRAME)
+
+      assert wait_until(lambda: sut.selected_source == 5)
+    finally:
+      sut.close()
+      server.close()
+
+    assert not sut.is_listening
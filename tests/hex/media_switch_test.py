@@ -1,9 +1,15 @@
+import asyncio
+import pytest
+import threading
+import time
 from typing import Optional
 
+from teeheesmart.hex.cache_policy import CachePolicy
+from teeheesmart.hex.desired_state import DesiredState
 from teeheesmart.hex.io import Command, Instruction
-from teeheesmart.hex.media_switch import MediaSwitch
+from teeheesmart.hex.media_switch import AsyncMediaSwitch, MediaSwitch
 
-from fakes import FakeDevice
+from fakes import FakeAsyncDevice, FakeDevice, wait_until
 
 class TestMediaSwitch:
   def test_initializes_state_from_device(self):
@@ -119,9 +125,364 @@ class TestMediaSwitch:
     assert sut.selected_source == expected_source
     assert fake_device.processed_instructions == expected
 
+  def test_declared_input_count_skips_probing(self):
+    input_count = 8
+    selected_source = 3
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, selected_source - 1)],
+    ]
+
+    sut = MediaSwitch(fake_device, input_count = input_count)
+
+    assert sut.input_count == input_count
+    assert sut.selected_source == selected_source
+    assert fake_device.processed_instructions == [Instruction(Command.QUERY_ACTIVE_INPUT)]
+
+  def test_rejects_invalid_declared_input_count(self):
+    with pytest.raises(ValueError):
+      MediaSwitch(FakeDevice(), input_count = 17)
+
+  def test_update_skips_device_while_state_is_fresh(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)],
+    ]
+    sut = MediaSwitch(fake_device, input_count = 16, cache_policy = CachePolicy(60))
+    fake_device.clear_instructions()
+
+    sut.update()
+
+    assert fake_device.processed_instructions == []
+
+  def test_update_queries_device_once_state_is_stale(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)],
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, 6)],
+    ]
+    sut = MediaSwitch(fake_device, input_count = 16, cache_policy = CachePolicy(0))
+
+    sut.update()
+
+    assert fake_device.process_count == 2
+    assert sut.selected_source == 7
+
+  def test_update_queries_device_when_forced(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)],
+    ]
+    sut = MediaSwitch(fake_device, input_count = 16, cache_policy = CachePolicy(60))
+
+    sut.update(force = True)
+
+    assert fake_device.process_count == 2
+
+  def test_concurrent_updates_share_one_device_query(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16, cache_policy = CachePolicy(0))
+    fake_device.process_count = 0
+    fake_device.delay_sec = 0.1
+    threads = [threading.Thread(target = sut.update) for _ in range(5)]
+
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    assert fake_device.process_count == 1
+
+  def test_update_refreshes_stale_state_in_background_when_configured(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)],
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, 4)],
+    ]
+    sut = MediaSwitch(
+      fake_device,
+      input_count = 16,
+      cache_policy = CachePolicy(0, stale_while_revalidate = True)
+    )
+    fake_device.delay_sec = 0.1
+
+    sut.update()
+    selected_source_before_refresh = sut.selected_source
+
+    assert selected_source_before_refresh == 1
+    assert wait_until(lambda: sut.selected_source == 5)
+
+  def test_select_source_sends_only_last_input_within_window(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16, select_source_window_sec = 0.1)
+    fake_device.clear_instructions()
+    threads = []
+
+    for input in [2, 7, 4]:
+      thread = threading.Thread(target = sut.select_source, args = (input,))
+      thread.start()
+      threads.append(thread)
+      time.sleep(0.005)
+    for thread in threads:
+      thread.join()
+
+    assert fake_device.processed_instructions == [Instruction(Command.SWITCH_VIDEO, 4)]
+
+  def test_batch_sends_commands_in_one_exchange(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16)
+    fake_device.clear_instructions()
+    fake_device.process_count = 0
+    fake_device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, 2)],
+    ]
+
+    with sut.batch():
+      sut.set_buzzer_muting(True)
+      sut.set_led_timeout_seconds(30)
+      sut.select_source(3)
+      processed_within_batch = list(fake_device.processed_instructions)
+
+    assert processed_within_batch == []
+    assert fake_device.process_count == 1
+    assert fake_device.processed_instructions == [
+      Instruction(Command.MUTE_BUZZER, 0),
+      Instruction(Command.LED_TIMEOUT_SECONDS, 30),
+      Instruction(Command.SWITCH_VIDEO, 3),
+    ]
+    assert sut.selected_source == 3
+
+  def test_nested_batches_send_when_outermost_exits(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16)
+    fake_device.process_count = 0
+
+    with sut.batch():
+      with sut.batch():
+        sut.select_source(2)
+      process_count_after_inner = fake_device.process_count
+      sut.select_source(4)
+
+    assert process_count_after_inner == 0
+    assert fake_device.process_count == 1
+
+  def test_batch_drops_commands_when_block_raises(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16)
+    fake_device.clear_instructions()
+
+    with pytest.raises(RuntimeError):
+      with sut.batch():
+        sut.select_source(2)
+        raise RuntimeError()
+    sut.select_source(5)
+
+    assert fake_device.processed_instructions == [Instruction(Command.SWITCH_VIDEO, 5)]
+
+  def test_batch_bypasses_select_source_coalescing(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16, select_source_window_sec = 5)
+    fake_device.clear_instructions()
+    started = time.monotonic()
+
+    with sut.batch():
+      sut.select_source(2)
+      sut.select_source(7)
+
+    assert time.monotonic() - started < 1
+    assert fake_device.processed_instructions == [
+      Instruction(Command.SWITCH_VIDEO, 2),
+      Instruction(Command.SWITCH_VIDEO, 7),
+    ]
+
+  def test_batch_only_records_commands_from_its_thread(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16)
+    fake_device.clear_instructions()
+
+    with sut.batch():
+      thread = threading.Thread(target = sut.select_source, args = (6,))
+      thread.start()
+      thread.join()
+      processed_within_batch = list(fake_device.processed_instructions)
+
+    assert processed_within_batch == [Instruction(Command.SWITCH_VIDEO, 6)]
+
+  def test_apply_sends_only_changed_settings(self):
+    fake_device = FakeDevice()
+    fake_device.response_instructions = [[Instruction(Command.CURRENT_ACTIVE_INPUT, 0)]]
+    sut = MediaSwitch(fake_device, input_count = 16)
+    sut.set_buzzer_muting(True)
+    sut.set_led_timeout_seconds(30)
+    fake_device.clear_instructions()
+    fake_device.process_count = 0
+
+    result = sut.apply(DesiredState(
+      selected_source = 1,
+      buzzer_muted = True,
+      led_timeout_seconds = 10,
+      auto_input_detection = False,
+    ))
+
+    assert result == [
+      Instruction(Command.LED_TIMEOUT_SECONDS, 10),
+      Instruction(Command.ENABLE_INPUT_DETECTION, 0),
+    ]
+    assert fake_device.process_count == 1
+    assert fake_device.processed_instructions == result
+
+  def test_apply_sends_nothing_when_already_in_state(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16)
+    desired_state = DesiredState(selected_source = 4, buzzer_muted = False)
+    fake_device.response_instructions = [[Instruction(Command.CURRENT_ACTIVE_INPUT, 3)]]
+    sut.apply(desired_state)
+    fake_device.clear_instructions()
+
+    result = sut.apply(desired_state)
+
+    assert result == []
+    assert fake_device.processed_instructions == []
+
+  def test_apply_tracks_settings_sent(self):
+    sut = MediaSwitch(FakeDevice(), input_count = 16)
+
+    sut.apply(DesiredState(buzzer_muted = True, led_timeout_seconds = 30))
+
+    assert sut.buzzer_muted is True
+    assert sut.led_timeout_seconds == 30
+    assert sut.auto_input_detection is None
+
+  def test_apply_resends_settings_whose_exchange_failed(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16)
+    sut.set_buzzer_muting(False)
+    fake_device.clear_instructions()
+    fake_device.response_instructions = [[Instruction(Command.NULL_RESPONSE)]]
+
+    sut.apply(DesiredState(buzzer_muted = True))
+    result = sut.apply(DesiredState(buzzer_muted = True))
+
+    assert sut.buzzer_muted is True
+    assert result == [Instruction(Command.MUTE_BUZZER, 0)]
+    assert fake_device.processed_instructions == result * 2
+
+  def test_apply_with_force_refresh_queries_device_and_resends_settings(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16)
+    sut.set_buzzer_muting(True)
+    fake_device.clear_instructions()
+    fake_device.response_instructions = [[Instruction(Command.CURRENT_ACTIVE_INPUT, 5)]]
+
+    result = sut.apply(DesiredState(selected_source = 1, buzzer_muted = True), force_refresh = True)
+
+    assert fake_device.processed_instructions[0] == Instruction(Command.QUERY_ACTIVE_INPUT)
+    assert result == [
+      Instruction(Command.SWITCH_VIDEO, 1),
+      Instruction(Command.MUTE_BUZZER, 0),
+    ]
+
+  def test_submit_update_applies_replies_when_done(self):
+    fake_device = FakeDevice()
+    sut = MediaSwitch(fake_device, input_count = 16)
+    fake_device.clear_instructions()
+    fake_device.response_instructions = [[Instruction(Command.CURRENT_ACTIVE_INPUT, 6)]]
+
+    future = sut.submit_update()
+
+    assert future.result() is None
+    assert sut.selected_source == 7
+    assert fake_device.processed_instructions == [Instruction(Command.QUERY_ACTIVE_INPUT)]
+
+  def test_close_closes_device(self):
+    fake_device = FakeDevice()
+    (sut, _) = self.create_media_switch(device = fake_device)
+
+    sut.close()
+
+    assert fake_device.close_count == 1
+
   def create_media_switch(
       self,
       device = FakeDevice()
     ) -> tuple[MediaSwitch, FakeDevice]:
     return (MediaSwitch(device), device)
 
+
+class TestAsyncMediaSwitch:
+  def test_create_initializes_state_from_device(self):
+    input_count = 14
+    selected_source = 3
+    fake_device = FakeAsyncDevice()
+    fake_device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, selected_source - 1)],
+      [], # SWITCH_VIDEO: 16
+      [], # SWITCH_VIDEO: 15
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, input_count - 1)],
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, selected_source - 1)]
+    ]
+
+    sut = asyncio.run(AsyncMediaSwitch.create(fake_device))
+
+    assert sut.input_count == input_count
+    assert sut.output_count == 1
+    assert sut.selected_source == selected_source
+
+  def test_create_ignores_stray_report_while_probing(self):
+    input_count = 14
+    selected_source = 3
+    fake_device = FakeAsyncDevice()
+    fake_device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, selected_source - 1)],
+      # SWITCH_VIDEO: 16 goes unanswered, but a front panel change arrives
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, selected_source - 1)],
+      [], # SWITCH_VIDEO: 15
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, input_count - 1)],
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, selected_source - 1)]
+    ]
+
+    sut = asyncio.run(AsyncMediaSwitch.create(fake_device))
+
+    assert sut.input_count == input_count
+    assert sut.selected_source == selected_source
+
+  def test_create_with_declared_input_count_skips_probing(self):
+    fake_device = FakeAsyncDevice()
+    fake_device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)],
+    ]
+
+    sut = asyncio.run(AsyncMediaSwitch.create(fake_device, input_count = 4))
+
+    assert sut.input_count == 4
+    assert fake_device.process_count == 1
+
+  def test_constructor_does_not_perform_io(self):
+    fake_device = FakeAsyncDevice()
+
+    AsyncMediaSwitch(fake_device)
+
+    assert fake_device.process_count == 0
+
+  def test_select_source_sends_switch_video_instruction(self):
+    selected_source = 5
+    fake_device = FakeAsyncDevice()
+    fake_device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, selected_source - 1)],
+    ]
+    sut = AsyncMediaSwitch(fake_device)
+
+    asyncio.run(sut.select_source(selected_source))
+
+    assert sut.selected_source == selected_source
+    assert fake_device.processed_instructions == [
+      Instruction(Command.SWITCH_VIDEO, selected_source)
+    ]
+
+  def test_close_closes_device(self):
+    fake_device = FakeAsyncDevice()
+    sut = AsyncMediaSwitch(fake_device)
+
+    asyncio.run(sut.close())
+
+    assert fake_device.close_count == 1
@@ -0,0 +1,20 @@
+import pytest
+
+from teeheesmart.hex.models import MODELS, find_model
+
+class TestFindModel:
+  def test_returns_model_by_exact_name(self):
+    result = find_model('HSW-1601')
+
+    assert result is MODELS['HSW-1601']
+    assert result.input_count == 16
+
+  def test_ignores_case_and_separators(self):
+    result = find_model(' hsw801 ')
+
+    assert result is MODELS['HSW-801']
+    assert result.input_count == 8
+
+  def test_raises_for_unknown_model(self):
+    with pytest.raises(ValueError):
+      find_model('HSW-9999')
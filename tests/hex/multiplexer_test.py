@@ -0,0 +1,232 @@
+import pytest
+import socket
+import time
+
+from teeheesmart import get_media_switch
+from teeheesmart.hex.breaker import CircuitBreaker, CircuitState
+from teeheesmart.hex.emulator import EmulatorPool
+from teeheesmart.hex.io import Command, Instruction, ResponsePolicy, TcpEndpoint
+from teeheesmart.hex.multiplexer import DeviceMultiplexer, MultiplexedDevice
+from teeheesmart.hex.resolver import ResolverCache
+from teeheesmart.hex.rtt import RttEstimator
+
+from fakes import FakeServer, wait_until
+
+QUERY = Instruction(Command.QUERY_ACTIVE_INPUT)
+
+def endpoint_for(server, timeout_sec: float = 0.2) -> TcpEndpoint:
+  return TcpEndpoint(server.host, server.port, timeout_sec)
+
+class TestMultiplexedDevice:
+  def test_process_returns_replies(self):
+    with EmulatorPool(1, input_count = 4) as pool, DeviceMultiplexer() as multiplexer:
+      sut = MultiplexedDevice(multiplexer, endpoint_for(pool.servers[0]))
+
+      result = sut.process([Instruction(Command.SWITCH_VIDEO, 3), QUERY])
+
+      assert result == [
+        Instruction(Command.CURRENT_ACTIVE_INPUT, 2),
+        Instruction(Command.CURRENT_ACTIVE_INPUT, 2),
+      ]
+
+  def test_commands_that_never_reply_do_not_wait(self):
+    with EmulatorPool(1) as pool, DeviceMultiplexer() as multiplexer:
+      sut = MultiplexedDevice(multiplexer, endpoint_for(pool.servers[0], timeout_sec = 5))
+      started = time.monotonic()
+
+      result = sut.process(Instruction(Command.MUTE_BUZZER, 0))
+
+      assert result == []
+      assert time.monotonic() - started < 1
+      assert wait_until(lambda: pool.servers[0].switch.buzzer_muted)
+
+  def test_missing_reply_times_out_empty(self):
+    policies = {Command.QUERY_ACTIVE_INPUT: ResponsePolicy.NEVER_REPLIES}
+    with EmulatorPool(1, response_policies = policies) as pool, \
+        DeviceMultiplexer() as multiplexer:
+      sut = MultiplexedDevice(multiplexer, endpoint_for(pool.servers[0], timeout_sec = 0.05))
+
+      result = sut.process(QUERY)
+
+      assert result == []
+
+  def test_persistent_device_reuses_connection(self):
+    with EmulatorPool(1) as pool, DeviceMultiplexer() as multiplexer:
+      sut = MultiplexedDevice(multiplexer, endpoint_for(pool.servers[0]), persistent = True)
+
+      sut.process(QUERY)
+      sut.process(QUERY)
+
+      assert pool.servers[0].connection_count == 1
+
+  def test_persistent_device_returns_frames_received_while_idle_ahead_of_replies(self):
+    with EmulatorPool(1, input_count = 4) as pool, DeviceMultiplexer() as multiplexer:
+      sut = MultiplexedDevice(multiplexer, endpoint_for(pool.servers[0]), persistent = True)
+      sut.process(QUERY)
+
+      pool.select_from_front_panel(pool.servers[0], 3)
+      time.sleep(0.05)
+      result = sut.process(Instruction(Command.SWITCH_VIDEO, 2))
+
+      assert result == [
+        Instruction(Command.CURRENT_ACTIVE_INPUT, 2),
+        Instruction(Command.CURRENT_ACTIVE_INPUT, 1),
+      ]
+
+  def test_transient_device_closes_connection_after_call(self):
+    with EmulatorPool(1) as pool, DeviceMultiplexer() as multiplexer:
+      sut = MultiplexedDevice(multiplexer, endpoint_for(pool.servers[0]))
+
+      sut.process(QUERY)
+
+      assert wait_until(lambda: pool.servers[0].connection_count == 0)
+
+  def test_dropped_idle_connection_is_replaced(self):
+    server = FakeServer()
+    try:
+      with DeviceMultiplexer() as multiplexer:
+        endpoint = TcpEndpoint('127.0.0.1', server.port)
+        sut = MultiplexedDevice(multiplexer, endpoint, persistent = True)
+        sut.process(Instruction(Command.MUTE_BUZZER, 1))
+        assert server.wait_for_connections(1)
+
+        server.disconnect_clients()
+        time.sleep(0.05)
+        sut.process(Instruction(Command.MUTE_BUZZER, 0))
+
+        assert server.wait_for_connections(2)
+    finally:
+      server.close()
+
+  def test_connect_failure_raises(self):
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    with DeviceMultiplexer() as multiplexer:
+      sut = MultiplexedDevice(multiplexer, TcpEndpoint('127.0.0.1', port))
+
+      with pytest.raises(ConnectionRefusedError):
+        sut.process(QUERY)
+
+  def test_connect_failure_tries_next_address(self):
+    listener = socket.create_server(('127.0.0.1', 0))
+    closed_port = listener.getsockname()[1]
+    listener.close()
+    with EmulatorPool(1) as pool, DeviceMultiplexer() as multiplexer:
+      server = pool.servers[0]
+      addresses = [
+        (socket.AF_INET, socket.SOCK_STREAM, 0, '', ('127.0.0.1', closed_port)),
+        (socket.AF_INET, socket.SOCK_STREAM, 0, '', (server.host, server.port)),
+      ]
+      resolver = ResolverCache(getaddrinfo = lambda *_, **__: addresses)
+      endpoint = TcpEndpoint('switch.local', resolver = resolver)
+      sut = MultiplexedDevice(multiplexer, endpoint)
+
+      result = sut.process(QUERY)
+
+      assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)]
+      assert sut._addresses[0] == addresses[1]
+
+  def test_resolution_failure_is_recorded_by_circuit_breaker(self):
+    clock = [0.0]
+    breaker = CircuitBreaker(failure_threshold = 1, base_cooldown_sec = 1.0, clock = lambda: clock[0])
+    breaker.record_failure()
+    clock[0] = 1.0
+
+    def fail_resolution(*_, **__):
+      raise socket.gaierror('Name does not resolve')
+
+    with DeviceMultiplexer() as multiplexer:
+      resolver = ResolverCache(getaddrinfo = fail_resolution)
+      endpoint = TcpEndpoint('switch.invalid', resolver = resolver)
+      sut = MultiplexedDevice(multiplexer, endpoint, circuit_breaker = breaker)
+
+      with pytest.raises(socket.gaierror):
+        sut.process(QUERY)
+
+      assert breaker.state == CircuitState.OPEN
+
+  def test_slow_device_does_not_delay_others(self):
+    slow_policies = {Command.QUERY_ACTIVE_INPUT: ResponsePolicy.NEVER_REPLIES}
+    with EmulatorPool(1, response_policies = slow_policies) as slow_pool, \
+        EmulatorPool(1) as fast_pool, \
+        DeviceMultiplexer() as multiplexer:
+      slow = MultiplexedDevice(multiplexer, endpoint_for(slow_pool.servers[0], timeout_sec = 1))
+      fast = MultiplexedDevice(multiplexer, endpoint_for(fast_pool.servers[0]))
+      slow_future = slow.submit(QUERY)
+      started = time.monotonic()
+
+      result = fast.process(QUERY)
+
+      assert result == [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)]
+      assert time.monotonic() - started < 0.5
+      assert not slow_future.done()
+
+  def test_closing_multiplexer_fails_pending_requests(self):
+    policies = {Command.QUERY_ACTIVE_INPUT: ResponsePolicy.NEVER_REPLIES}
+    with EmulatorPool(1, response_policies = policies) as pool:
+      multiplexer = DeviceMultiplexer()
+      sut = MultiplexedDevice(multiplexer, endpoint_for(pool.servers[0], timeout_sec = 5))
+      future = sut.submit(QUERY)
+
+      multiplexer.close()
+
+      with pytest.raises(ConnectionError):
+        future.result(2)
+      with pytest.raises(ConnectionError):
+        sut.submit(QUERY)
+
+  def test_reply_timeout_follows_estimate(self):
+    policies = {Command.QUERY_ACTIVE_INPUT: ResponsePolicy.NEVER_REPLIES}
+    with EmulatorPool(1, response_policies = policies) as pool, \
+        DeviceMultiplexer() as multiplexer:
+      estimator = RttEstimator(initial_timeout_sec = 0.05)
+      sut = MultiplexedDevice(
+        multiplexer,
+        endpoint_for(pool.servers[0], timeout_sec = 5),
+        rtt_estimator = estimator,
+      )
+      started = time.monotonic()
+
+      result = sut.process(QUERY)
+
+      assert result == []
+      assert time.monotonic() - started < 1
+      assert estimator.timeout_sec == 0.1
+
+class TestMultiplexedMediaSwitch:
+  def test_one_thread_polls_many_switches(self):
+    with EmulatorPool(20, input_count = 4, latency_sec = 0.05) as pool, \
+        DeviceMultiplexer() as multiplexer:
+      switches = [
+        get_media_switch(url, input_count = 4, persistent = True, multiplexer = multiplexer)
+        for url in pool.urls
+      ]
+      for index, server in enumerate(pool.servers):
+        pool.select_from_front_panel(server, index % 4 + 1)
+      started = time.monotonic()
+
+      futures = [media_switch.submit_update() for media_switch in switches]
+      for future in futures:
+        future.result(2)
+
+      # Polled one after another, the switches' latency would add up to a second
+      assert time.monotonic() - started < 0.5
+      assert [media_switch.selected_source for media_switch in switches] == [
+        index % 4 + 1 for index in range(len(switches))
+      ]
+
+  def test_submit_update_reports_errors_through_future(self):
+    with DeviceMultiplexer() as multiplexer:
+      with EmulatorPool(1, input_count = 4) as pool:
+        media_switch = get_media_switch(pool.urls[0], input_count = 4, multiplexer = multiplexer)
+
+      future = media_switch.submit_update()
+
+      with pytest.raises(ConnectionRefusedError):
+        future.result(2)
+
+  def test_pipelining_is_rejected(self):
+    with DeviceMultiplexer() as multiplexer:
+      with pytest.raises(ValueError):
+        get_media_switch('127.0.0.1', pipelined = True, multiplexer = multiplexer)
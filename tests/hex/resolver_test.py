@@ -0,0 +1,104 @@
+import pytest
+import socket
+
+from teeheesmart.hex.io import TcpEndpoint
+from teeheesmart.hex.resolver import ResolverCache, _interleave_families
+
+from fakes import FakeServer
+
+class FakeClock:
+  def __init__(self):
+    self.now = 100.0
+
+  def __call__(self) -> float:
+    return self.now
+
+class FakeResolver:
+  def __init__(self, *hosts: str):
+    self.hosts = hosts
+    self.call_count = 0
+
+  def __call__(self, host, port, type = 0):
+    self.call_count += 1
+    return [gen_address(address, port) for address in self.hosts]
+
+class TestResolverCache:
+  def test_resolve_reuses_addresses_until_ttl_expires(self):
+    clock = FakeClock()
+    getaddrinfo = FakeResolver('10.0.0.1')
+    sut = ResolverCache(ttl_sec = 30.0, clock = clock, getaddrinfo = getaddrinfo)
+
+    sut.resolve('switch.local', 5000)
+    sut.resolve('switch.local', 5000)
+    clock.now += 31.0
+    sut.resolve('switch.local', 5000)
+
+    assert getaddrinfo.call_count == 2
+
+  def test_connect_falls_back_to_next_address_and_remembers_winner(self):
+    server = FakeServer()
+    port = server.port
+    sut = ResolverCache(
+      stagger_sec = 0.05,
+      # An address refusing connections, then the server
+      getaddrinfo = FakeResolver('127.0.0.2', '127.0.0.1'),
+    )
+
+    try:
+      with sut.connect('switch.local', port, timeout_sec = 2.0) as conn:
+        peer = conn.getpeername()
+    finally:
+      server.close()
+
+    assert peer == ('127.0.0.1', port)
+    assert sut.resolve('switch.local', port)[0][4][0] == '127.0.0.1'
+
+  def test_connect_failure_discards_cached_addresses(self):
+    with socket.create_server(('127.0.0.1', 0)) as server:
+      port = server.getsockname()[1]
+    getaddrinfo = FakeResolver('127.0.0.1')
+    sut = ResolverCache(getaddrinfo = getaddrinfo)
+
+    with pytest.raises(ConnectionRefusedError):
+      sut.connect('switch.local', port, timeout_sec = 1.0)
+    sut.resolve('switch.local', port)
+
+    assert getaddrinfo.call_count == 2
+
+  def test_connect_raises_when_nothing_resolved(self):
+    sut = ResolverCache(getaddrinfo = FakeResolver())
+
+    with pytest.raises(OSError):
+      sut.connect('switch.local', 5000)
+
+  def test_interleave_families_alternates_starting_with_first(self):
+    addresses = [
+      gen_address('::1', 5000, socket.AF_INET6),
+      gen_address('::2', 5000, socket.AF_INET6),
+      gen_address('10.0.0.1', 5000),
+      gen_address('10.0.0.2', 5000),
+    ]
+
+    result = _interleave_families(addresses)
+
+    assert [address[4][0] for address in result] == ['::1', '10.0.0.1', '::2', '10.0.0.2']
+
+  def test_endpoint_connects_through_resolver(self):
+    server = FakeServer()
+    getaddrinfo = FakeResolver('127.0.0.1')
+    sut = TcpEndpoint('switch.local', server.port, resolver = ResolverCache(getaddrinfo = getaddrinfo))
+
+    try:
+      for _ in range(2):
+        sut.create_connection().close()
+    finally:
+      server.close()
+
+    assert getaddrinfo.call_count == 1
+
+#
+# Helpers
+#
+def gen_address(host: str, port: int, family: int = socket.AF_INET):
+  sockaddr = (host, port) if family == socket.AF_INET else (host, port, 0, 0)
+  return (family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', sockaddr)
@@ -0,0 +1,69 @@
+import pytest
+
+from teeheesmart.hex.rtt import RttEstimator
+
+class TestRttEstimator:
+  def test_timeout_is_initial_until_measured(self):
+    sut = RttEstimator(initial_timeout_sec = 0.3)
+
+    assert sut.timeout_sec == 0.3
+    assert sut.smoothed_rtt_sec is None
+
+  def test_first_sample_sets_timeout_to_three_times_rtt(self):
+    sut = RttEstimator(min_timeout_sec = 0.001)
+
+    sut.record_rtt(0.01)
+
+    assert sut.smoothed_rtt_sec == 0.01
+    assert sut.timeout_sec == pytest.approx(0.03)
+
+  def test_steady_samples_converge_on_rtt(self):
+    sut = RttEstimator(min_timeout_sec = 0.001)
+
+    for _ in range(50):
+      sut.record_rtt(0.01)
+
+    assert sut.smoothed_rtt_sec == pytest.approx(0.01)
+    assert sut.timeout_sec == pytest.approx(0.01, abs = 0.001)
+
+  def test_varying_samples_widen_timeout(self):
+    steady = RttEstimator(min_timeout_sec = 0.001)
+    varying = RttEstimator(min_timeout_sec = 0.001)
+
+    for index in range(50):
+      steady.record_rtt(0.01)
+      varying.record_rtt(0.005 if index % 2 == 0 else 0.015)
+
+    assert varying.timeout_sec > steady.timeout_sec
+
+  def test_timeout_is_clamped(self):
+    fast = RttEstimator(min_timeout_sec = 0.05, max_timeout_sec = 1)
+    slow = RttEstimator(min_timeout_sec = 0.05, max_timeout_sec = 1)
+
+    fast.record_rtt(0.001)
+    slow.record_rtt(5)
+
+    assert fast.timeout_sec == 0.05
+    assert slow.timeout_sec == 1
+
+  def test_record_timeout_doubles_timeout_up_to_max(self):
+    sut = RttEstimator(initial_timeout_sec = 0.3, max_timeout_sec = 1)
+
+    sut.record_timeout()
+    doubled = sut.timeout_sec
+    sut.record_timeout()
+
+    assert doubled == 0.6
+    assert sut.timeout_sec == 1
+
+  def test_rejects_invalid_bounds(self):
+    with pytest.raises(ValueError):
+      RttEstimator(min_timeout_sec = 1, max_timeout_sec = 0.5)
+
+  def test_for_endpoint_shares_estimator(self):
+    first = RttEstimator.for_endpoint('rtt-shared.local', 5000)
+    second = RttEstimator.for_endpoint('rtt-shared.local', 5000)
+    other = RttEstimator.for_endpoint('rtt-shared.local', 5001)
+
+    assert first is second
+    assert first is not other
@@ -0,0 +1,167 @@
+import pytest
+import random
+import threading
+
+from teeheesmart.hex.io import Command, Instruction, TcpEndpoint
+from teeheesmart.hex.media_switch import MediaSwitch
+from teeheesmart.hex.worker import DeviceWorker, Priority
+
+from fakes import FakeDevice
+
+class BlockingDevice(FakeDevice):
+  """
+  Blocks the first `process` call until released, so work can queue up behind it
+  """
+
+  def __init__(self):
+    super().__init__()
+    self.endpoint = gen_endpoint()
+    self.started = threading.Event()
+    self.release = threading.Event()
+
+  def process(self, instructions):
+    if not self.started.is_set():
+      self.started.set()
+      self.release.wait()
+    return super().process(instructions)
+
+class TestDeviceWorker:
+  def test_process_returns_device_results(self):
+    device = FakeDevice()
+    device.endpoint = gen_endpoint()
+    expected = [Instruction(Command.CURRENT_ACTIVE_INPUT, 2)]
+    device.response_instructions = [expected]
+    sut = DeviceWorker(device)
+
+    result = sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+    sut.stop()
+
+    assert result == expected
+
+  def test_process_raises_device_errors(self):
+    class FailingDevice(FakeDevice):
+      def process(self, instructions):
+        raise ConnectionRefusedError()
+    device = FailingDevice()
+    device.endpoint = gen_endpoint()
+    sut = DeviceWorker(device)
+
+    with pytest.raises(ConnectionRefusedError):
+      sut.process(Instruction(Command.QUERY_ACTIVE_INPUT))
+    sut.stop()
+
+  def test_queued_interactive_work_runs_before_background_work(self):
+    device = BlockingDevice()
+    sut = DeviceWorker(device)
+    in_progress = sut.submit(Instruction(Command.QUERY_ACTIVE_INPUT))
+    device.started.wait()
+
+    background = sut.submit(Instruction(Command.QUERY_ACTIVE_INPUT), Priority.BACKGROUND)
+    interactive = sut.submit(Instruction(Command.SWITCH_VIDEO, 3), Priority.INTERACTIVE)
+    device.release.set()
+    for future in [in_progress, background, interactive]:
+      future.result()
+    sut.stop()
+
+    assert device.processed_instructions == [
+      Instruction(Command.QUERY_ACTIVE_INPUT),
+      Instruction(Command.SWITCH_VIDEO, 3),
+      Instruction(Command.QUERY_ACTIVE_INPUT),
+    ]
+
+  def test_all_work_runs_on_a_single_thread(self):
+    device = FakeDevice()
+    device.endpoint = gen_endpoint()
+    threads = set()
+    original_process = device.process
+    def record_thread(instructions):
+      threads.add(threading.get_ident())
+      return original_process(instructions)
+    device.process = record_thread
+    sut = DeviceWorker(device)
+    callers = [
+      threading.Thread(target = sut.process, args = (Instruction(Command.QUERY_ACTIVE_INPUT),))
+      for _ in range(5)
+    ]
+
+    for caller in callers:
+      caller.start()
+    for caller in callers:
+      caller.join()
+    sut.stop()
+
+    assert len(threads) == 1
+    assert device.process_count == 5
+
+  def test_for_device_shares_worker_for_same_endpoint(self):
+    endpoint = gen_endpoint()
+    device1 = FakeDevice()
+    device1.endpoint = endpoint
+    device2 = FakeDevice()
+    device2.endpoint = TcpEndpoint(endpoint.host, endpoint.port)
+
+    worker1 = DeviceWorker.for_device(device1)
+    worker2 = DeviceWorker.for_device(device2)
+    worker1.release()
+    worker3 = DeviceWorker.for_device(device2)
+    worker2.release()
+    worker3.release()
+    worker4 = DeviceWorker.for_device(device2)
+    worker4.release()
+
+    assert worker1 is worker2
+    assert worker3 is worker1
+    assert worker4 is not worker1
+    assert worker4.device is device2
+
+  def test_release_closes_device_once_no_references_remain(self):
+    device = FakeDevice()
+    device.endpoint = gen_endpoint()
+    worker1 = DeviceWorker.for_device(device)
+    worker2 = DeviceWorker.for_device(device)
+
+    worker1.release()
+    close_count_while_referenced = device.close_count
+    worker2.release()
+
+    assert close_count_while_referenced == 0
+    assert device.close_count == 1
+
+class TestMediaSwitchSerialization:
+  def test_commands_are_processed_through_worker(self):
+    device = FakeDevice()
+    device.endpoint = gen_endpoint()
+    device.response_instructions = [
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, 0)],
+      [Instruction(Command.CURRENT_ACTIVE_INPUT, 4)],
+    ]
+    sut = MediaSwitch(device, input_count = 16, serialize = True)
+
+    sut.select_source(5)
+    sut.close()
+
+    assert sut.selected_source == 5
+    assert device.process_count == 2
+    assert device.close_count == 1
+
+  def test_closing_one_switch_leaves_shared_device_open_for_others(self):
+    endpoint = gen_endpoint()
+    devices = [FakeDevice(), FakeDevice()]
+    for device in devices:
+      device.endpoint = endpoint
+      device.response_instructions = [[Instruction(Command.CURRENT_ACTIVE_INPUT, 0)]] * 3
+    first = MediaSwitch(devices[0], input_count = 16, serialize = True)
+    second = MediaSwitch(devices[1], input_count = 16, serialize = True)
+
+    first.close()
+    second.update()
+    close_counts_while_shared = [device.close_count for device in devices]
+    second.close()
+
+    assert close_counts_while_shared == [0, 0]
+    assert devices[0].process_count == 3
+    assert devices[1].process_count == 0
+    assert devices[0].close_count == 1
+
+def gen_endpoint(rand = random) -> TcpEndpoint:
+  return TcpEndpoint('localhost', rand.randrange(49152, 65535))
@@ -0,0 +1,122 @@
+import pytest
+import threading
+import time
+
+from teeheesmart import get_media_switch
+from teeheesmart.hex.emulator import EmulatorPool
+from teeheesmart.registry import SwitchRegistry
+
+class StubSwitch:
+  def __init__(self, url: str, delay_sec: float = 0):
+    time.sleep(delay_sec)
+    self.url = url
+    self.selected_source = 1
+    self.close_count = 0
+
+  def close(self) -> None:
+    self.close_count += 1
+
+class CountingFactory:
+  def __init__(self, delay_sec: float = 0):
+    self.delay_sec = delay_sec
+    self.created: list[StubSwitch] = []
+
+  def __call__(self, url: str) -> StubSwitch:
+    media_switch = StubSwitch(url, self.delay_sec)
+    self.created.append(media_switch)
+    return media_switch
+
+class TestSwitchRegistry:
+  def test_acquire_shares_switch_for_equivalent_urls(self):
+    factory = CountingFactory()
+    sut = SwitchRegistry()
+
+    first = sut.acquire('switch.local', factory)
+    second = sut.acquire('tcp://SWITCH.local:5000?inputs=8#hex', factory)
+
+    assert len(factory.created) == 1
+    assert first.media_switch is second.media_switch
+    assert second.selected_source == 1
+    assert len(sut) == 1
+
+  def test_acquire_separates_ports(self):
+    factory = CountingFactory()
+    sut = SwitchRegistry()
+
+    sut.acquire('switch.local:5000', factory)
+    sut.acquire('switch.local:5001', factory)
+
+    assert len(factory.created) == 2
+
+  def test_switch_closed_once_last_handle_closed(self):
+    factory = CountingFactory()
+    sut = SwitchRegistry()
+    first = sut.acquire('switch.local', factory)
+    second = sut.acquire('switch.local', factory)
+
+    first.close()
+    first.close()
+    closed_after_first = factory.created[0].close_count
+    second.close()
+
+    assert closed_after_first == 0
+    assert factory.created[0].close_count == 1
+    assert 'switch.local' not in sut
+
+  def test_acquire_after_close_creates_new_switch(self):
+    factory = CountingFactory()
+    sut = SwitchRegistry()
+    sut.acquire('switch.local', factory).close()
+
+    result = sut.acquire('switch.local', factory)
+
+    assert len(factory.created) == 2
+    assert result.media_switch is factory.created[1]
+
+  def test_closed_handle_rejects_use(self):
+    sut = SwitchRegistry()
+    handle = sut.acquire('switch.local', CountingFactory())
+
+    handle.close()
+
+    assert handle.closed
+    with pytest.raises(RuntimeError):
+      handle.selected_source
+
+  def test_failed_creation_is_not_registered(self):
+    def factory(url):
+      raise ConnectionRefusedError()
+    sut = SwitchRegistry()
+
+    with pytest.raises(ConnectionRefusedError):
+      sut.acquire('switch.local', factory)
+
+    assert len(sut) == 0
+
+  def test_concurrent_acquire_creates_switch_once(self):
+    factory = CountingFactory(delay_sec = 0.05)
+    sut = SwitchRegistry()
+    handles = []
+    def acquire():
+      handles.append(sut.acquire('switch.local', factory))
+    threads = [threading.Thread(target = acquire) for _ in range(8)]
+
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    assert len(factory.created) == 1
+    assert len(handles) == 8
+
+class TestGetSharedMediaSwitch:
+  def test_shared_switches_use_one_device(self):
+    with EmulatorPool(1, input_count = 4) as pool:
+      with get_media_switch(pool.urls[0], shared = True) as first, \
+          get_media_switch(pool.urls[0], shared = True) as second:
+        first.select_source(3)
+        second.update()
+
+        assert first.media_switch is second.media_switch
+        assert second.selected_source == 3
+        assert second.input_count == 4
@@ -61,6 +61,19 @@ class TestEndpoint:
 
     assert sut.protocol == protocol
 
+  # Options
+  def test_sets_options_empty_when_not_specified(self):
+    sut = Endpoint()
+
+    assert sut.options == {}
+
+  def test_sets_options_as_specified(self):
+    options = {'inputs': '8'}
+
+    sut = Endpoint(options = options)
+
+    assert sut.options == options
+
 class TestParseUrl:
   def test_host_only_parses_correctly(self):
     url = 'localhost'
@@ -147,3 +160,23 @@ class TestParseUrl:
     assert result.host == host
     assert result.port == port
     assert result.protocol == protocol
+
+  def test_query_parses_as_options(self):
+    host = 'mediaswitch.local'
+    url = f'tcp://{host}:1337?model=HSW-801&inputs=8#hex'
+
+    result = parse_url(url)
+
+    assert result.host == host
+    assert result.port == 1337
+    assert result.protocol == PROTOCOL_HEX
+    assert result.options == {'model': 'HSW-801', 'inputs': '8'}
+
+  def test_host_and_query_parses_correctly(self):
+    url = '10.0.0.1?inputs=4'
+
+    result = parse_url(url)
+
+    assert result.host == '10.0.0.1'
+    assert result.port == _DEFAULT_PORT_TCP
+    assert result.options == {'inputs': '4'}